@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -50,6 +52,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'listings.replicas.ReplicaPinMiddleware',
 ]
 
 ROOT_URLCONF = 'compramos_tu_coche.urls'
@@ -79,9 +82,64 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file (not the in-memory default) so concurrency tests can use
+        # several connections in WAL mode.
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# SQLite connection profile, selected with DATABASE_PROFILE:
+# - 'default': Django's defaults (rollback journal, one connection per request).
+# - 'tuned': WAL, so readers no longer wait for a writer; synchronous=NORMAL,
+#   which is safe with WAL (a power cut may lose the last commits, never
+#   corrupts); a memory-mapped file and a 64 MiB page cache; a 5 s busy
+#   timeout; IMMEDIATE transactions, so a transaction that writes queues for
+#   the lock instead of failing with "database is locked" when it upgrades
+#   from a read; and persistent connections, checked before reuse.
+# PRAGMAS are run on every new connection by listings.signals.apply_sqlite_pragmas.
+# Django recommends CONN_MAX_AGE=0 under ASGI; override it with
+# DATABASE_CONN_MAX_AGE there.
+DATABASE_PROFILES = {
+    'default': {},
+    'tuned': {
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        'PRAGMAS': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -64 * 1024,  # negative: KiB
+            'busy_timeout': 5000,  # ms
+            'temp_store': 'MEMORY',
+        },
+    },
+}
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'default')
+if DATABASE_PROFILE not in DATABASE_PROFILES:
+    raise ImproperlyConfigured(
+        f"DATABASE_PROFILE must be one of: {', '.join(DATABASE_PROFILES)}."
+    )
+DATABASES['default'].update(DATABASE_PROFILES[DATABASE_PROFILE])
+if 'DATABASE_CONN_MAX_AGE' in os.environ:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ['DATABASE_CONN_MAX_AGE'])
+
+# Read replicas of the default database, as comma separated SQLite paths in
+# DATABASE_REPLICAS (kept in sync by the replication tool, e.g. Litestream
+# or LiteFS). The catalogue pages read cars and photos from them; a visitor
+# who changes a car reads from 'default' for LISTINGS_REPLICA_PIN_SECONDS
+# afterwards, which should exceed the replication lag. Run the test suite
+# without DATABASE_REPLICAS: the routing tests set up their own replica.
+for _index, _path in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{_index}'] = {
+        **DATABASES['default'],
+        'NAME': _path,
+        'TEST': {'MIRROR': 'default'},
+    }
+LISTINGS_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+LISTINGS_REPLICA_PIN_SECONDS = 10
+DATABASE_ROUTERS = ['listings.replicas.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -138,3 +196,63 @@ STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY', '')
 STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY', '')
 STRIPE_SUCCESS_URL = os.environ.get('STRIPE_SUCCESS_URL', 'http://localhost:8000/?pago=exitoso')
 STRIPE_CANCEL_URL = os.environ.get('STRIPE_CANCEL_URL', 'http://localhost:8000/?pago=cancelado')
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
+# Points the payment client at a local stub in tests and load tests.
+STRIPE_API_BASE = os.environ.get('STRIPE_API_BASE', 'https://api.stripe.com')
+
+# Cache backend, selected with CACHE_BACKEND: 'locmem' (per process, the
+# default), 'file', 'database' (run `python manage.py createcachetable` first),
+# 'memcached' (needs pymemcache), 'redis' (needs redis-py) or 'fake' (an
+# in-process cache that records every call, for tests). CACHE_LOCATION
+# overrides the directory, table, server list (comma separated) or URL.
+_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'compramos-tu-coche'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'cache')),
+    'database': ('django.core.cache.backends.db.DatabaseCache', 'listings_cache'),
+    'memcached': ('django.core.cache.backends.memcached.PyMemcacheCache', '127.0.0.1:11211'),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379'),
+    'fake': ('listings.cache_backends.RecordingCache', 'compramos-tu-coche'),
+}
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+if CACHE_BACKEND not in _CACHE_BACKENDS:
+    raise ImproperlyConfigured(
+        f"CACHE_BACKEND must be one of: {', '.join(_CACHE_BACKENDS)}."
+    )
+_cache_class, _cache_location = _CACHE_BACKENDS[CACHE_BACKEND]
+_cache_location = os.environ.get('CACHE_LOCATION', _cache_location)
+if CACHE_BACKEND == 'memcached':
+    _cache_location = _cache_location.split(',')
+CACHES = {
+    'default': {
+        'BACKEND': _cache_class,
+        'LOCATION': _cache_location,
+        'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', ''),
+    }
+}
+
+# Full-text search used by the catalogue "q" filter. Use
+# 'listings.search.IContainsSearchBackend' on databases without FTS5.
+LISTINGS_SEARCH_BACKEND = 'listings.search.SQLiteFTSSearchBackend'
+
+# Seconds the brand/year facet lists of the catalogue stay cached. They are
+# also invalidated whenever a car is saved or deleted.
+LISTINGS_FACETS_TIMEOUT = 60 * 60
+
+# Catalogue pagination: 'offset' (numbered pages) or 'keyset' (cursor based,
+# constant cost for deep pages). The result count is cached per filter
+# combination for LISTINGS_COUNT_TIMEOUT seconds or until a car changes.
+LISTINGS_PAGINATION = os.environ.get('LISTINGS_PAGINATION', 'offset')
+LISTINGS_COUNT_TIMEOUT = 5 * 60
+
+# Seconds a rendered anonymous catalogue page stays in the page cache. Any car
+# or photo change invalidates every cached page immediately.
+LISTINGS_PAGE_CACHE_TIMEOUT = 10 * 60
+
+# Resized copies generated (by the task queue) for every uploaded car photo
+# and served via srcset. Formats the installed Pillow cannot encode are skipped.
+LISTINGS_RENDITION_WIDTHS = (320, 640, 1024)
+LISTINGS_RENDITION_FORMATS = ('avif', 'webp', 'jpeg')
+
+# Background task queue. Run workers with `python manage.py run_tasks`; with
+# LISTINGS_TASKS_EAGER=1 tasks run in-process after commit instead.
+LISTINGS_TASKS_EAGER = os.environ.get('LISTINGS_TASKS_EAGER', '') == '1'
@@ -1,8 +1,20 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.exceptions import EmptyResultSet
+from django.template.response import TemplateResponse
 from django.utils.translation import gettext_lazy as _
 
-from .models import Car, CarPhoto, User
+from . import bulk
+from .cache import catalogue_key, get_or_compute
+from .forms import PriceChangeForm
+from .models import Car, CarPhoto, CheckoutSession, PaymentEvent, Task, User
+from .pagination import CachedCountPaginator
+from .search import get_search_backend
+
+# Seconds the car changelist keeps its filter choices; any car or photo change
+# invalidates them sooner. Result counts follow LISTINGS_COUNT_TIMEOUT.
+ADMIN_CACHE_TIMEOUT = 10 * 60
 
 
 @admin.register(User)
@@ -25,8 +37,26 @@ class CarPhotoInline(admin.TabularInline):
     max_num = Car.MAX_PHOTOS
 
 
+class CachedValuesListFilter(admin.AllValuesFieldListFilter):
+    """``AllValuesFieldListFilter`` whose ``SELECT DISTINCT`` is cached."""
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        choices = self.lookup_choices
+        self.lookup_choices = get_or_compute(
+            catalogue_key("admin-choices", field_path), lambda: list(choices), ADMIN_CACHE_TIMEOUT
+        )
+
+
 @admin.register(Car)
 class CarAdmin(admin.ModelAdmin):
+    """Changelist that stays fast on large inventories.
+
+    Filter choices and result counts are cached per catalogue version, the
+    "N in total" count is skipped, searches use the catalogue's full-text
+    index and rows are ordered by primary key, which needs no sort.
+    """
+
     list_display = (
         "license_plate",
         "brand",
@@ -35,10 +65,128 @@ class CarAdmin(admin.ModelAdmin):
         "year",
         "price",
         "is_active",
+        "created_by",
     )
-    list_filter = ("brand", "year", "is_active")
+    list_filter = (
+        ("brand", CachedValuesListFilter),
+        ("year", CachedValuesListFilter),
+        "is_active",
+    )
+    list_select_related = ("created_by",)
     search_fields = ("license_plate", "brand", "model_name")
+    search_help_text = _("Matrícula, marca, modelo o descripción; admite prefijos.")
+    show_full_result_count = False
+    ordering = ("-pk",)
     readonly_fields = ("created_at", "updated_at")
     inlines = [CarPhotoInline]
+    actions = ["activate_cars", "deactivate_cars", "change_prices", "delete_cars"]
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # Replaced by delete_cars, which does not load and signal every photo.
+        actions.pop("delete_selected", None)
+        return actions
+
+    @admin.action(description=_("Publicar los anuncios seleccionados"), permissions=["change"])
+    def activate_cars(self, request, queryset):
+        changed = bulk.set_active(queryset, True)
+        self.message_user(request, f"{changed} anuncios publicados.", messages.SUCCESS)
+
+    @admin.action(description=_("Retirar los anuncios seleccionados"), permissions=["change"])
+    def deactivate_cars(self, request, queryset):
+        changed = bulk.set_active(queryset, False)
+        self.message_user(request, f"{changed} anuncios retirados.", messages.SUCCESS)
+
+    @admin.action(description=_("Cambiar el precio en un porcentaje"), permissions=["change"])
+    def change_prices(self, request, queryset):
+        form = PriceChangeForm(request.POST if "apply" in request.POST else None)
+        if form.is_valid():
+            changed = bulk.change_prices(queryset, form.cleaned_data["percent"])
+            self.message_user(
+                request,
+                f"Precio de {changed} anuncios cambiado un {form.cleaned_data['percent']} %.",
+                messages.SUCCESS,
+            )
+            return None
+        return self.confirm_action(request, queryset, "change_prices", form)
+
+    @admin.action(description=_("Borrar los anuncios seleccionados"), permissions=["delete"])
+    def delete_cars(self, request, queryset):
+        if "apply" in request.POST:
+            deleted = bulk.delete_cars(queryset)
+            self.message_user(request, f"{deleted} anuncios borrados.", messages.SUCCESS)
+            return None
+        return self.confirm_action(request, queryset, "delete_cars")
+
+    def confirm_action(self, request, queryset, action, form=None):
+        """Intermediate page that re-posts the selection with ``apply`` set."""
+        context = {
+            **self.admin_site.each_context(request),
+            "title": self.get_action(action)[2],
+            "opts": self.model._meta,
+            "action": action,
+            "form": form,
+            "count": queryset.count(),
+            "selected": request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            "select_across": request.POST.get("select_across", "0"),
+            "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, "admin/listings/car/confirm_action.html", context)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        # The changelist applies its own ordering, so skip the relevance rank.
+        return get_search_backend().search(queryset, search_term, rank=False), False
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            # e.g. a search without any word (``-``), which matches nothing:
+            # the count of such a queryset is 0 without a query.
+            count_key = None
+        else:
+            count_key = catalogue_key("admin-count", sql, params)
+        return CachedCountPaginator(
+            queryset, per_page, orphans, allow_empty_first_page, count_key=count_key
+        )
+
+    # The admin forms already ran full_clean(); skip the second pass in save().
+    def save_model(self, request, obj, form, change):
+        obj.save(validate=False)
+
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not CarPhoto:
+            return super().save_formset(request, form, formset, change)
+        photos = formset.save(commit=False)
+        for photo in formset.deleted_objects:
+            photo.delete()
+        for photo in photos:
+            photo.save(validate=False)
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ("name", "status", "attempts", "run_after", "finished_at")
+    list_filter = ("status", "name")
+    readonly_fields = ("attempts", "locked_until", "last_error", "created_at", "finished_at")
+
+
+@admin.register(CheckoutSession)
+class CheckoutSessionAdmin(admin.ModelAdmin):
+    list_display = ("stripe_session_id", "user", "car", "amount_cents", "status", "expires_at")
+    list_filter = ("status",)
+    search_fields = ("stripe_session_id", "user__username", "car__license_plate")
+    raw_id_fields = ("user", "car")
+    readonly_fields = ("stripe_session_id", "idempotency_key", "url", "created_at", "updated_at")
+
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ("event_id", "type", "received_at", "processed_at")
+    list_filter = ("type",)
+    search_fields = ("event_id",)
+    readonly_fields = ("event_id", "type", "payload", "received_at", "processed_at")
 
 # Register your models here.
@@ -0,0 +1,182 @@
+"""Read-only JSON API for the public catalogue.
+
+Rows are read with ``values()`` and serialized as plain dicts. Every response
+carries a strong ``ETag`` and a ``Last-Modified`` derived from the newest
+``updated_at`` of the matching cars; both come from a single aggregate
+query, so a conditional request that still matches gets its 304 before any
+row is read or serialized.
+"""
+
+import hashlib
+
+from django.db.models import Count, Max
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.generic import View
+
+from .export import attach_photos
+from .filters import filter_catalogue
+from .models import Car
+from .pagination import KeysetPaginator, decode_cursor
+from .replicas import ReplicaReadMixin
+
+API_FIELDS = (
+    "id",
+    "license_plate",
+    "brand",
+    "model_name",
+    "year",
+    "kilometers",
+    "price",
+    "description",
+    "created_at",
+    "updated_at",
+    "photos",
+)
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def requested_fields(params):
+    """Fields listed in ``?fields=a,b`` (all by default); None if any is unknown."""
+    raw = params.get("fields", "")
+    if not raw.strip():
+        return API_FIELDS
+    fields = tuple(dict.fromkeys(name.strip() for name in raw.split(",") if name.strip()))
+    if not fields or not set(fields) <= set(API_FIELDS):
+        return None
+    return fields
+
+
+def page_size(params) -> int:
+    try:
+        size = int(params.get("page_size", DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        size = DEFAULT_PAGE_SIZE
+    return min(max(size, 1), MAX_PAGE_SIZE)
+
+
+def strong_etag(*parts) -> str:
+    return quote_etag(hashlib.sha256(repr(parts).encode()).hexdigest()[:32])
+
+
+def api_error(message: str, status: int = 400) -> JsonResponse:
+    return JsonResponse({"error": message}, status=status)
+
+
+class CatalogueApiView(ReplicaReadMixin, View):
+    """Shared field selection, serialization and conditional GET handling."""
+
+    http_method_names = ["get", "head"]
+
+    def get(self, request, *args, **kwargs):
+        self.fields = requested_fields(request.GET)
+        if self.fields is None:
+            return api_error(f"Campos disponibles: {', '.join(API_FIELDS)}.")
+        return self.respond(request, *args, **kwargs)
+
+    def columns(self) -> list:
+        # id and created_at are always read: photos and cursors need them.
+        return [
+            name for name in dict.fromkeys(["id", "created_at", *self.fields]) if name != "photos"
+        ]
+
+    def serialize(self, rows) -> list:
+        if "photos" in self.fields:
+            attach_photos(rows, self.request.build_absolute_uri)
+        return [{name: row[name] for name in self.fields} for row in rows]
+
+    def not_modified(self, etag, updated_at):
+        """Store the validators and return a 304/412 response if they match."""
+        self.etag = etag
+        self.last_modified = int(updated_at.timestamp()) if updated_at else None
+        response = get_conditional_response(
+            self.request, etag=etag, last_modified=self.last_modified
+        )
+        if response is not None:
+            self.add_validators(response)
+        return response
+
+    def add_validators(self, response):
+        response["ETag"] = self.etag
+        if self.last_modified is not None:
+            response["Last-Modified"] = http_date(self.last_modified)
+        return response
+
+
+class CarApiListView(CatalogueApiView):
+    """Active cars filtered like the listing page, newest first.
+
+    Pages are followed with the ``next``/``previous`` links: cursors normally,
+    numbered pages for text searches, which are ordered by relevance.
+    """
+
+    def respond(self, request):
+        queryset = filter_catalogue(Car.objects.filter(is_active=True), request.GET)
+        state = queryset.aggregate(updated_at=Max("updated_at"), count=Count("id"))
+        params = sorted((name, tuple(values)) for name, values in request.GET.lists())
+        etag = strong_etag(state["updated_at"], state["count"], params)
+        response = self.not_modified(etag, state["updated_at"])
+        if response is not None:
+            return response
+
+        size = page_size(request.GET)
+        rows = queryset.values(*self.columns())
+        if request.GET.get("q"):
+            rows, next_params, previous_params = self.numbered_page(rows, size)
+        else:
+            cursor = request.GET.get("cursor")
+            if cursor and decode_cursor(cursor) is None:
+                return api_error("Cursor no válido.")
+            page = KeysetPaginator(rows, size, stale_to_first=False).page(cursor)
+            rows = list(page.object_list)
+            next_params = {"cursor": page.next_cursor} if page.has_next() else None
+            previous_params = {"cursor": page.previous_cursor} if page.has_previous() else None
+
+        return self.add_validators(
+            JsonResponse(
+                {
+                    "count": state["count"],
+                    "next": self.page_link(next_params),
+                    "previous": self.page_link(previous_params),
+                    "results": self.serialize(rows),
+                }
+            )
+        )
+
+    def numbered_page(self, rows, size):
+        try:
+            number = max(int(self.request.GET.get("page", 1)), 1)
+        except ValueError:
+            number = 1
+        start = (number - 1) * size
+        rows = list(rows[start : start + size + 1])
+        next_params = {"page": str(number + 1)} if len(rows) > size else None
+        previous_params = {"page": str(number - 1)} if number > 1 else None
+        return rows[:size], next_params, previous_params
+
+    def page_link(self, params):
+        if params is None:
+            return None
+        query = self.request.GET.copy()
+        for name in ("cursor", "page"):
+            query.pop(name, None)
+        query.update(params)
+        return self.request.build_absolute_uri(f"?{query.urlencode()}")
+
+
+class CarApiDetailView(CatalogueApiView):
+    def respond(self, request, pk):
+        queryset = Car.objects.filter(is_active=True, pk=pk)
+        updated_at = queryset.values_list("updated_at", flat=True).first()
+        if updated_at is None:
+            return api_error("Anuncio no encontrado.", status=404)
+        response = self.not_modified(strong_etag(pk, updated_at, self.fields), updated_at)
+        if response is not None:
+            return response
+
+        rows = list(queryset.values(*self.columns()))
+        if not rows:
+            return api_error("Anuncio no encontrado.", status=404)
+        return self.add_validators(JsonResponse(self.serialize(rows)[0]))
@@ -0,0 +1,474 @@
+"""Performance scenarios run by the ``benchmark`` management command.
+
+Every scenario receives the command instance (for output) and the parsed
+options, and runs against a throwaway database created by the command, so
+the development ``db.sqlite3`` is never touched.
+"""
+
+import random
+import time
+
+from django.db import connection
+from django.test import RequestFactory
+
+from .models import Car
+from .synthetic import synthetic_cars
+
+SCENARIOS = {}
+
+# Filter combinations accepted by CarListView.get_queryset.
+FILTER_COMBINATIONS = [
+    {},
+    {"brand": "Seat"},
+    {"year_min": "2015"},
+    {"year_max": "2012"},
+    {"year_min": "2015", "year_max": "2018"},
+    {"km_max": "20000"},
+    {"brand": "Audi", "year_min": "2016"},
+    {"brand": "BMW", "km_max": "50000"},
+    {"year_min": "2018", "km_max": "40000"},
+    {"brand": "Toyota", "year_min": "2014", "year_max": "2020", "km_max": "90000"},
+    {"model": "golf"},
+]
+
+
+def scenario(name):
+    """Register a benchmark scenario under ``name``."""
+
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+
+    return decorator
+
+
+def make_catalogue(rows: int, batch_size: int = 2000, seed: int = 42) -> None:
+    """Bulk insert ``rows`` synthetic cars, bypassing per-row validation."""
+    rng = random.Random(seed)
+    batch = []
+    for car in synthetic_cars(rows, seed=seed):
+        car.is_active = rng.random() > 0.1
+        batch.append(car)
+        if len(batch) >= batch_size:
+            Car.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Car.objects.bulk_create(batch)
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def list_view_queryset(params):
+    from .views import CarListView
+
+    view = CarListView()
+    view.setup(RequestFactory().get("/", params))
+    return view.get_queryset()
+
+
+def query_plan(queryset) -> str:
+    return queryset.explain()
+
+
+def uses_table_scan(plan: str) -> bool:
+    """True when SQLite walks listings_car without any index."""
+    return any(
+        "SCAN listings_car" in line and "USING" not in line
+        for line in plan.splitlines()
+    )
+
+
+@scenario("indexes")
+def bench_indexes(command, options):
+    """Check every CarListView filter combination hits an index and time it."""
+    make_catalogue(options["rows"])
+    failures = 0
+    for params in FILTER_COMBINATIONS:
+        queryset = list_view_queryset(params)
+        plan = query_plan(queryset)
+        start = time.perf_counter()
+        for _ in range(options["repeat"]):
+            list(queryset.prefetch_related(None)[:12])
+        elapsed = (time.perf_counter() - start) / options["repeat"] * 1000
+        scan = uses_table_scan(plan)
+        failures += scan
+        label = ", ".join(f"{k}={v}" for k, v in params.items()) or "(sin filtros)"
+        style = command.style.ERROR if scan else command.style.SUCCESS
+        command.stdout.write(style(f"{label}: {elapsed:.2f} ms"))
+        if options["verbosity"] > 1 or scan:
+            command.stdout.write(plan)
+    return failures == 0
+
+
+@scenario("pagination")
+def bench_pagination(command, options):
+    """Compare offset and keyset pagination cost for shallow and deep pages."""
+    from .pagination import KeysetPaginator, encode_cursor
+
+    make_catalogue(options["rows"])
+    queryset = list_view_queryset({}).prefetch_related(None)
+    per_page = 12
+    ordered = queryset.order_by("-created_at", "-id")
+    for depth in (1, 100, options["rows"] // per_page // 2):
+        offset = (depth - 1) * per_page
+        start = time.perf_counter()
+        for _ in range(options["repeat"]):
+            list(ordered[offset : offset + per_page])
+        offset_ms = (time.perf_counter() - start) / options["repeat"] * 1000
+
+        token = None
+        if offset:
+            anchor = ordered[offset - 1]
+            token = encode_cursor(anchor.created_at, anchor.pk)
+        paginator = KeysetPaginator(queryset, per_page)
+        start = time.perf_counter()
+        for _ in range(options["repeat"]):
+            paginator.page(token)
+        keyset_ms = (time.perf_counter() - start) / options["repeat"] * 1000
+        command.stdout.write(
+            f"página {depth}: offset {offset_ms:.2f} ms · keyset {keyset_ms:.2f} ms"
+        )
+
+
+@scenario("import")
+def bench_import(command, options):
+    """Time import_listings on a synthetic CSV feed: first load, then upsert."""
+    import csv
+    import os
+    import tempfile
+    from pathlib import Path
+
+    from .importer import FEED_FIELDS, import_feed, read_feed
+
+    target = 5000  # rows/s
+    handle, path = tempfile.mkstemp(suffix=".csv")
+    try:
+        with os.fdopen(handle, "w", newline="", encoding="utf-8") as feed:
+            writer = csv.writer(feed)
+            writer.writerow(FEED_FIELDS)
+            for car in synthetic_cars(options["rows"], seed=7):
+                writer.writerow([getattr(car, name) for name in FEED_FIELDS])
+        ok = True
+        for label in ("carga inicial", "actualización"):
+            report = import_feed(read_feed(Path(path)), deactivate_missing=True)
+            rate = report.rows_per_second
+            ok = ok and rate >= target and not report.errors
+            style = command.style.SUCCESS if rate >= target else command.style.ERROR
+            command.stdout.write(
+                style(f"{label}: {report.rows} filas en {report.seconds:.2f} s ({rate:.0f} filas/s)")
+            )
+        return ok
+    finally:
+        os.unlink(path)
+
+
+@scenario("checkout")
+def bench_checkout(command, options):
+    """Checkouts/s against a slow payment stub: WSGI threads vs one ASGI event loop.
+
+    A WSGI worker holds a thread for the whole provider round-trip, so its
+    throughput is capped at threads / latency; the ASGI loop keeps accepting
+    requests while the calls are in flight.
+    """
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.db import connections
+    from django.test import AsyncClient, Client, override_settings
+    from django.urls import reverse
+
+    from .models import User
+    from .payment_stub import StubPaymentServer
+
+    wsgi_threads = 8
+    asgi_concurrency = 64
+    latency = 0.1  # seconds per provider call
+    total = options["repeat"] * 10
+
+    # A car per checkout: repeated ones would reuse the open session.
+    cars = Car.objects.bulk_create(synthetic_cars(2 * total, seed=1))
+    urls = [reverse("listings:checkout_session", args=[car.pk]) for car in cars]
+    login = Client()
+    login.force_login(User.objects.create_user("bench-buyer", email="bench@example.com"))
+
+    def wsgi_run(urls):
+        def worker(urls):
+            client = Client()
+            client.cookies = login.cookies
+            try:
+                return [client.post(url).status_code for url in urls]
+            finally:
+                connections.close_all()
+
+        shares = [urls[index::wsgi_threads] for index in range(wsgi_threads)]
+        with ThreadPoolExecutor(max_workers=wsgi_threads) as pool:
+            return [status for chunk in pool.map(worker, shares) for status in chunk]
+
+    async def asgi_run(urls):
+        client = AsyncClient()
+        client.cookies = login.cookies
+        limit = asyncio.Semaphore(asgi_concurrency)
+
+        async def post(url):
+            async with limit:
+                return (await client.post(url)).status_code
+
+        return await asyncio.gather(*(post(url) for url in urls))
+
+    rates = {}
+    with StubPaymentServer(delay=latency) as stub, override_settings(
+        ALLOWED_HOSTS=["testserver"],
+        STRIPE_SECRET_KEY="sk_bench",
+        STRIPE_PUBLISHABLE_KEY="pk_bench",
+        STRIPE_API_BASE=stub.url,
+    ):
+        for label, run in (
+            (f"WSGI ({wsgi_threads} hilos)", lambda: wsgi_run(urls[:total])),
+            (
+                f"ASGI (1 bucle, {asgi_concurrency} en vuelo)",
+                lambda: asyncio.run(asgi_run(urls[total:])),
+            ),
+        ):
+            start = time.perf_counter()
+            statuses = run()
+            elapsed = time.perf_counter() - start
+            failed = sum(status != 200 for status in statuses)
+            rates[label] = total / elapsed
+            command.stdout.write(
+                f"{label}: {total} checkouts en {elapsed:.2f} s "
+                f"({rates[label]:.0f}/s, {failed} fallidos)"
+            )
+            if failed:
+                return False
+    wsgi_rate, asgi_rate = rates.values()
+    return asgi_rate > wsgi_rate
+
+
+@scenario("reservations")
+def bench_reservations(command, options):
+    """Reserve/check/release cycles per second while threads fight over a few cars.
+
+    Runs on SQLite in WAL mode. A cycle that finds its car held by someone
+    else right after reserving it counts as a conflict; there must be none.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.db import connections
+
+    from .models import User
+    from .reservations import release, reserve
+
+    threads = 16
+    attempts = options["repeat"] * 5  # per thread
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode=WAL")
+    users = User.objects.bulk_create(User(username=f"bench-{n}") for n in range(threads))
+
+    conflicts = 0
+    start_index = 0
+    for hot_cars in (1, 4, 64):
+        cars = Car.objects.bulk_create(synthetic_cars(hot_cars, start=start_index, seed=3))
+        start_index += hot_cars
+        car_ids = [car.pk for car in cars]
+
+        def worker(user_id):
+            rng = random.Random(user_id)
+            won = lost = clashes = 0
+            try:
+                for _ in range(attempts):
+                    car_id = rng.choice(car_ids)
+                    if not reserve(car_id, user_id):
+                        lost += 1
+                        continue
+                    won += 1
+                    holder = Car.objects.values_list("reserved_by", flat=True).get(pk=car_id)
+                    clashes += holder != user_id
+                    release(car_id, user_id)
+            finally:
+                connections.close_all()
+            return won, lost, clashes
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(worker, [user.pk for user in users]))
+        elapsed = time.perf_counter() - start
+        won, lost, clashes = (sum(column) for column in zip(*results))
+        conflicts += clashes
+        style = command.style.ERROR if clashes else command.style.SUCCESS
+        command.stdout.write(
+            style(
+                f"{hot_cars} anuncio(s), {threads} hilos: "
+                f"{threads * attempts / elapsed:.0f} intentos/s · {won} reservas · "
+                f"{lost} rechazadas · {clashes} conflictos"
+            )
+        )
+    return conflicts == 0
+
+
+@scenario("home")
+def bench_home(command, options):
+    """Home page reads/s while a writer keeps saving cars, per database profile.
+
+    Reader threads render the catalogue (page cache off) and a writer thread
+    saves cars as the admin does; connections are closed after each request
+    as a WSGI server would. Each of ``settings.DATABASE_PROFILES`` is applied
+    to the benchmark database in turn.
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.conf import settings
+    from django.db import OperationalError, close_old_connections, connections
+    from django.test import Client, override_settings
+    from django.urls import reverse
+
+    readers = 8
+    duration = options["repeat"] * 0.25  # seconds per profile
+    write_interval = 0.1  # seconds between saves, a busy back office
+    django_defaults = {
+        "CONN_MAX_AGE": 0,
+        "CONN_HEALTH_CHECKS": False,
+        "OPTIONS": {},
+        "PRAGMAS": {},
+    }
+    make_catalogue(options["rows"])
+    url = reverse("listings:home")
+    writable = list(Car.objects.filter(is_active=True).values_list("pk", flat=True)[:500])
+
+    def reader(index, stop):
+        client = Client()
+        rng = random.Random(index)
+        latencies, errors = [], 0
+        try:
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    errors += client.get(url, rng.choice(FILTER_COMBINATIONS)).status_code != 200
+                except OperationalError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+                close_old_connections()
+        finally:
+            connections.close_all()
+        return latencies, errors
+
+    def writer(stop):
+        rng = random.Random(0)
+        latencies, errors = [], 0
+        try:
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    car = Car.objects.get(pk=rng.choice(writable))
+                    car.price += 1
+                    car.save()
+                except OperationalError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+                close_old_connections()
+                stop.wait(write_interval)
+        finally:
+            connections.close_all()
+        return latencies, errors
+
+    def p95_ms(latencies):
+        latencies = sorted(latencies)
+        return latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+
+    settings_dict = connection.settings_dict
+    original = {key: settings_dict.get(key) for key in django_defaults}
+    rates = {}
+    try:
+        with override_settings(ALLOWED_HOSTS=["testserver"], LISTINGS_PAGE_CACHE_TIMEOUT=0):
+            for name, profile in settings.DATABASE_PROFILES.items():
+                connections.close_all()
+                settings_dict.update(django_defaults, **profile)
+                journal_mode = settings_dict["PRAGMAS"].get("journal_mode", "DELETE")
+                with connection.cursor() as cursor:
+                    cursor.execute(f"PRAGMA journal_mode = {journal_mode}")
+                Client().get(url)  # warm up templates and caches
+                connections.close_all()
+
+                stop = threading.Event()
+                with ThreadPoolExecutor(max_workers=readers + 1) as pool:
+                    writes = pool.submit(writer, stop)
+                    reads = [pool.submit(reader, index, stop) for index in range(readers)]
+                    time.sleep(duration)
+                    stop.set()
+                    write_times, write_errors = writes.result()
+                    results = [future.result() for future in reads]
+                read_times = [latency for result in results for latency in result[0]]
+                read_errors = sum(result[1] for result in results)
+                rates[name] = len(read_times) / duration
+                failed = read_errors or write_errors
+                style = command.style.ERROR if failed else command.style.SUCCESS
+                command.stdout.write(
+                    style(
+                        f"{name}: {rates[name]:.0f} lecturas/s (p95 {p95_ms(read_times):.0f} ms, "
+                        f"{read_errors} errores) · {len(write_times) / duration:.0f} "
+                        f"escrituras/s (p95 {p95_ms(write_times):.0f} ms, {write_errors} errores)"
+                    )
+                )
+    finally:
+        connections.close_all()
+        settings_dict.update(original)
+    return rates.get("tuned", 0) > rates.get("default", 0)
+
+
+@scenario("admin")
+def bench_admin(command, options):
+    """Car changelist time and queries: a stock ModelAdmin vs CarAdmin.
+
+    Each page is rendered cold (empty cache) and then ``repeat`` times warm.
+    Use ``--rows 200000`` for an inventory of realistic size.
+    """
+    from django.contrib import admin
+    from django.core.cache import cache
+    from django.test.utils import CaptureQueriesContext
+
+    from .admin import CarAdmin
+    from .models import User
+
+    class StockCarAdmin(admin.ModelAdmin):
+        list_display = CarAdmin.list_display
+        list_filter = ("brand", "year", "is_active")
+        search_fields = ("license_plate", "brand", "model_name")
+
+    make_catalogue(options["rows"])
+    plate = Car.objects.values_list("license_plate", flat=True).first()
+    pages = {
+        "listado": {},
+        "marca": {"brand__exact": "Seat"},
+        "activos": {"is_active__exact": "1"},
+        "matrícula": {"q": plate[:4]},
+        "texto": {"q": "golf"},
+    }
+    user = User.objects.create_superuser("bench-admin", "bench@example.com")
+    factory = RequestFactory()
+
+    def render(model_admin, params):
+        request = factory.get("/admin/listings/car/", params)
+        request.user = user
+        return model_admin.changelist_view(request).render()
+
+    timings = {}
+    for label, model_admin in (
+        ("ModelAdmin", StockCarAdmin(Car, admin.site)),
+        ("CarAdmin", CarAdmin(Car, admin.site)),
+    ):
+        cache.clear()
+        for name, params in pages.items():
+            start = time.perf_counter()
+            render(model_admin, params)
+            cold_ms = (time.perf_counter() - start) * 1000
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                for _ in range(options["repeat"]):
+                    render(model_admin, params)
+                warm_ms = (time.perf_counter() - start) / options["repeat"] * 1000
+            timings[label, name] = warm_ms
+            command.stdout.write(
+                f"{label} · {name}: {cold_ms:.0f} ms en frío · {warm_ms:.1f} ms "
+                f"({len(ctx.captured_queries) // options['repeat']} consultas)"
+            )
+    return all(timings["CarAdmin", name] < timings["ModelAdmin", name] for name in pages)
@@ -0,0 +1,95 @@
+"""Set-based bulk changes to cars, used by the admin actions.
+
+Each operation runs one ``UPDATE`` or ``DELETE`` per chunk of selected ids
+instead of a ``save()``/``delete()`` per car, which would validate every row
+and fire per-row signals, and invalidates the cached catalogue once at the
+end. Deleted photos leave their files behind; the ``delete_media_files``
+task removes the ones no other photo uses in the background.
+"""
+
+from decimal import Decimal
+
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.db.models.functions import Round
+from django.utils import timezone
+
+from .cache import bump_catalogue_version
+from .models import Car, CarPhoto, CheckoutSession
+from .queue import enqueue
+from .renditions import rendition_files
+
+DELETE_FILES_TASK = "delete_media_files"
+CHUNK_SIZE = 500
+
+
+def _id_chunks(queryset, size=CHUNK_SIZE):
+    ids = list(queryset.order_by().values_list("pk", flat=True))
+    for start in range(0, len(ids), size):
+        yield ids[start : start + size]
+
+
+def _delete_rows(model, field: str, ids) -> int:
+    """One ``DELETE`` of the ``model`` rows whose ``field`` is in ``ids``."""
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    column = quote(model._meta.get_field(field).column)
+    placeholders = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", ids)
+        return cursor.rowcount
+
+
+def _update(queryset, **values) -> int:
+    values["updated_at"] = timezone.now()
+    changed = 0
+    for ids in _id_chunks(queryset):
+        changed += Car.objects.filter(pk__in=ids).update(**values)
+    if changed:
+        # update() skips the signals that invalidate the cached catalogue.
+        bump_catalogue_version()
+    return changed
+
+
+def set_active(queryset, active: bool) -> int:
+    """Publish or withdraw the selected cars; sold cars stay withdrawn."""
+    if active:
+        queryset = queryset.filter(is_active=False, sold_at__isnull=True)
+    else:
+        queryset = queryset.filter(is_active=True)
+    return _update(queryset, is_active=active)
+
+
+def change_prices(queryset, percent: Decimal) -> int:
+    """Raise (or, with a negative ``percent``, cut) prices, rounded to cents."""
+    factor = 1 + Decimal(percent) / 100
+    return _update(queryset, price=Round(F("price") * factor, 2))
+
+
+def delete_cars(queryset) -> int:
+    """Delete the selected cars with their photos and checkout sessions.
+
+    Each table is emptied with one SQL ``DELETE`` per chunk rather than
+    ``QuerySet.delete()``, which would load every car and photo to send its
+    ``post_delete`` signal: the photo one only gives back slots of cars that
+    are going away, and the cache ones are replaced by a single version bump.
+    Photo files, renditions included, are queued for deletion once each
+    chunk commits.
+    """
+    deleted = 0
+    for ids in _id_chunks(queryset):
+        with transaction.atomic():
+            photos = CarPhoto.objects.filter(car_id__in=ids)
+            names = []
+            for image, renditions in photos.values_list("image", "renditions"):
+                names.extend([image, *rendition_files(renditions)])
+            _delete_rows(CarPhoto, "car", ids)
+            _delete_rows(CheckoutSession, "car", ids)
+            deleted += _delete_rows(Car, "id", ids)
+            names = [name for name in names if name]
+            if names:
+                enqueue(DELETE_FILES_TASK, names=names)
+    if deleted:
+        bump_catalogue_version()
+    return deleted
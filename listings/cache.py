@@ -0,0 +1,198 @@
+"""Cache helpers shared by the listings app.
+
+Everything derived from the catalogue is stored under keys that embed the
+current catalogue version, so bumping the version invalidates all of it at
+once without having to enumerate keys. Values that are expensive to build
+go through ``get_or_compute``, which keeps concurrent misses from all hitting
+the database at once.
+"""
+
+import asyncio
+import hashlib
+import math
+import random
+import time
+
+from django.core.cache import cache
+
+from .replicas import primary_reads
+
+KEY_PREFIX = "listings"
+CATALOGUE_VERSION_KEY = f"{KEY_PREFIX}:catalogue-version"
+
+# A missing value is computed by the caller that takes a short lock on its
+# key; the others poll for the result, for up to LOCK_TIMEOUT seconds.
+LOCK_TIMEOUT = 10
+LOCK_POLL_INTERVAL = 0.05
+# Values are refreshed a little before they expire, with a probability that
+# grows with how long they took to compute (XFetch); higher values refresh
+# earlier.
+EARLY_REFRESH_BETA = 1.0
+
+
+def _fresh_version() -> int:
+    # Time based so a version lost to eviction never reuses an older value.
+    return time.time_ns() // 1000
+
+
+def catalogue_version() -> int:
+    version = cache.get(CATALOGUE_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOGUE_VERSION_KEY, _fresh_version(), timeout=None)
+        version = cache.get(CATALOGUE_VERSION_KEY, _fresh_version())
+    return version
+
+
+async def acatalogue_version() -> int:
+    version = await cache.aget(CATALOGUE_VERSION_KEY)
+    if version is None:
+        await cache.aadd(CATALOGUE_VERSION_KEY, _fresh_version(), timeout=None)
+        version = await cache.aget(CATALOGUE_VERSION_KEY, _fresh_version())
+    return version
+
+
+def bump_catalogue_version() -> None:
+    try:
+        cache.incr(CATALOGUE_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOGUE_VERSION_KEY, _fresh_version(), timeout=None)
+
+
+def _versioned_key(namespace: str, version: int, parts) -> str:
+    key = f"{KEY_PREFIX}:{namespace}:{version}"
+    if parts:
+        key += ":" + hashlib.sha256(repr(parts).encode()).hexdigest()
+    return key
+
+
+def catalogue_key(namespace: str, *parts) -> str:
+    """Build a key for ``namespace`` tied to the current catalogue version.
+
+    ``parts`` may be arbitrary user input, so they are hashed into a digest
+    that is safe for every cache backend.
+    """
+    return _versioned_key(namespace, catalogue_version(), parts)
+
+
+async def acatalogue_key(namespace: str, *parts) -> str:
+    return _versioned_key(namespace, await acatalogue_version(), parts)
+
+
+def counter_key(name: str) -> str:
+    return f"{KEY_PREFIX}:counter:{name}"
+
+
+def incr_counter(name: str) -> None:
+    key = counter_key(name)
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+async def aincr_counter(name: str) -> None:
+    key = counter_key(name)
+    if not await cache.aadd(key, 1, timeout=None):
+        try:
+            await cache.aincr(key)
+        except ValueError:
+            await cache.aset(key, 1, timeout=None)
+
+
+def get_counters(*names: str) -> dict:
+    values = cache.get_many([counter_key(name) for name in names])
+    return {name: values.get(counter_key(name), 0) for name in names}
+
+
+def _lock_key(key: str) -> str:
+    return f"{key}:lock"
+
+
+def _is_fresh(entry) -> bool:
+    _, delta, expires_at = entry
+    gap = delta * EARLY_REFRESH_BETA * -math.log(1.0 - random.random())
+    return time.time() + gap < expires_at
+
+
+def _entry(value, started: float, timeout):
+    expires_at = math.inf if timeout is None else time.time() + timeout
+    return (value, time.monotonic() - started, expires_at)
+
+
+def get_or_compute(key: str, compute, timeout):
+    """Value cached under ``key``, calling ``compute()`` when it is missing.
+
+    Concurrent misses wait for the one caller holding the key's lock instead
+    of computing it themselves, and a value close to expiry is refreshed
+    early by one caller while the rest keep getting the old one. ``None``
+    results are returned but not stored. ``compute`` always reads from the
+    primary database, so a lagging replica cannot leave stale values cached
+    under a new catalogue version.
+    """
+    if timeout is not None and timeout <= 0:
+        return compute()
+    entry = cache.get(key)
+    if entry is not None and _is_fresh(entry):
+        return entry[0]
+    lock = _lock_key(key)
+    locked = cache.add(lock, 1, LOCK_TIMEOUT)
+    if not locked and entry is not None:
+        return entry[0]  # another caller is refreshing it
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    # Past the deadline the holder is presumed stuck; compute it here too.
+    while not locked and time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+        locked = cache.add(lock, 1, LOCK_TIMEOUT)
+    try:
+        if locked and entry is None:
+            # It may have been stored between the first read and the lock.
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[0]
+        started = time.monotonic()
+        with primary_reads():
+            value = compute()
+        if value is not None:
+            cache.set(key, _entry(value, started, timeout), timeout)
+    finally:
+        if locked:
+            cache.delete(lock)
+    return value
+
+
+async def aget_or_compute(key: str, compute, timeout):
+    """``get_or_compute`` for a coroutine function ``compute``."""
+    if timeout is not None and timeout <= 0:
+        return await compute()
+    entry = await cache.aget(key)
+    if entry is not None and _is_fresh(entry):
+        return entry[0]
+    lock = _lock_key(key)
+    locked = await cache.aadd(lock, 1, LOCK_TIMEOUT)
+    if not locked and entry is not None:
+        return entry[0]
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while not locked and time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        entry = await cache.aget(key)
+        if entry is not None:
+            return entry[0]
+        locked = await cache.aadd(lock, 1, LOCK_TIMEOUT)
+    try:
+        if locked and entry is None:
+            entry = await cache.aget(key)
+            if entry is not None:
+                return entry[0]
+        started = time.monotonic()
+        with primary_reads():
+            value = await compute()
+        if value is not None:
+            await cache.aset(key, _entry(value, started, timeout), timeout)
+    finally:
+        if locked:
+            await cache.adelete(lock)
+    return value
@@ -0,0 +1,62 @@
+"""Cache backends for tests and local experiments."""
+
+import threading
+
+from django.core.cache.backends.locmem import LocMemCache
+
+_calls = {}
+_calls_lock = threading.Lock()
+
+
+class RecordingCache(LocMemCache):
+    """In-process cache that records every operation as ``(operation, key)``.
+
+    Tests use it to assert on cache traffic (what was read, written or
+    locked) without a cache server. Like ``LocMemCache``, instances with the
+    same ``LOCATION`` share their data, and their log; ``clear()`` empties
+    both.
+    """
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        with _calls_lock:
+            self.calls = _calls.setdefault(name, [])
+
+    def operations(self, operation: str) -> list:
+        """Keys passed to ``operation``, in call order."""
+        return [key for name, key in list(self.calls) if name == operation]
+
+    def _record(self, operation, key):
+        self.calls.append((operation, key))
+
+    def add(self, key, *args, **kwargs):
+        self._record("add", key)
+        return super().add(key, *args, **kwargs)
+
+    def get(self, key, *args, **kwargs):
+        self._record("get", key)
+        return super().get(key, *args, **kwargs)
+
+    def set(self, key, *args, **kwargs):
+        self._record("set", key)
+        return super().set(key, *args, **kwargs)
+
+    def touch(self, key, *args, **kwargs):
+        self._record("touch", key)
+        return super().touch(key, *args, **kwargs)
+
+    def incr(self, key, *args, **kwargs):
+        self._record("incr", key)
+        return super().incr(key, *args, **kwargs)
+
+    def has_key(self, key, *args, **kwargs):
+        self._record("has_key", key)
+        return super().has_key(key, *args, **kwargs)
+
+    def delete(self, key, *args, **kwargs):
+        self._record("delete", key)
+        return super().delete(key, *args, **kwargs)
+
+    def clear(self):
+        super().clear()
+        self.calls.clear()
@@ -0,0 +1,158 @@
+"""Stripe Checkout sessions for the purchase flow.
+
+The provider is called through ``stripe.StripeClient`` with its async httpx
+transport, so an ASGI worker keeps serving other requests while a session is
+being created. Clients are pooled per event loop: httpx connections cannot be
+shared between loops.
+
+Sessions are stored as ``CheckoutSession`` rows and cached per (buyer, car,
+price): while one is open it is handed out again instead of creating another,
+and new ones are requested with an idempotency key, so double-clicks and
+retries cost at most one provider round-trip.
+"""
+
+import asyncio
+import weakref
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+import stripe
+
+from .cache import KEY_PREFIX
+from .models import CheckoutSession
+from .reservations import areserve
+
+# Seconds to wait for the provider before giving up on a checkout.
+STRIPE_TIMEOUT = 20
+# Sessions this close to expiring are not handed out again.
+REUSE_MARGIN = timedelta(minutes=5)
+
+_clients = weakref.WeakKeyDictionary()
+
+
+class CheckoutError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def ensure_configured() -> None:
+    if not settings.STRIPE_SECRET_KEY or not settings.STRIPE_PUBLISHABLE_KEY:
+        raise CheckoutError(
+            "Stripe no está configurado. Contacta con el administrador.", status=500
+        )
+
+
+def amount_cents(car) -> int:
+    return int(car.price * 100)
+
+
+def session_cache_key(user_id: int, car_id: int, amount: int) -> str:
+    return f"{KEY_PREFIX}:checkout:{user_id}:{car_id}:{amount}"
+
+
+def checkout_params(car, user) -> dict:
+    """Parameters of the Checkout Session that sells ``car`` to ``user``."""
+    if car.price <= 0:
+        raise CheckoutError("El anuncio no tiene un precio válido.")
+    params = {
+        "mode": "payment",
+        "line_items": [
+            {
+                "price_data": {
+                    "currency": "eur",
+                    "product_data": {
+                        "name": f"{car.brand} {car.model_name}",
+                        "metadata": {"car_id": car.pk},
+                    },
+                    "unit_amount": amount_cents(car),
+                },
+                "quantity": 1,
+            }
+        ],
+        "success_url": settings.STRIPE_SUCCESS_URL,
+        "cancel_url": settings.STRIPE_CANCEL_URL,
+        "payment_method_types": ["card"],
+        "metadata": {"car_id": car.pk, "user_id": user.pk},
+    }
+    if user.email:
+        params["customer_email"] = user.email
+    return params
+
+
+def stripe_client() -> stripe.StripeClient:
+    """Client for the running event loop and the current settings."""
+    config = (settings.STRIPE_SECRET_KEY, settings.STRIPE_API_BASE)
+    clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    if config not in clients:
+        clients[config] = stripe.StripeClient(
+            settings.STRIPE_SECRET_KEY,
+            base_addresses={"api": settings.STRIPE_API_BASE},
+            http_client=stripe.HTTPXClient(timeout=STRIPE_TIMEOUT),
+        )
+    return clients[config]
+
+
+async def acreate_checkout_session(car, user) -> CheckoutSession:
+    """Open Checkout Session for ``user`` buying ``car`` at its current price.
+
+    An open session is reused; otherwise the car is reserved for ``user``
+    first (see ``listings.reservations``). A new session's idempotency key
+    counts the earlier sessions of the same (buyer, car, price) and carries
+    the hold's expiry, so concurrent requests send the same key and get the
+    same remote session, while one requested after the previous expired, or
+    after the hold was renewed (a new ``expires_at``), gets a fresh key.
+    """
+    params = checkout_params(car, user)
+    amount = amount_cents(car)
+    key = session_cache_key(user.pk, car.pk, amount)
+    usable_until = timezone.now() + REUSE_MARGIN
+
+    session = await cache.aget(key)
+    if session is None or session.expires_at <= usable_until:
+        matching = CheckoutSession.objects.filter(user=user, car=car, amount_cents=amount)
+        session = await matching.filter(
+            status=CheckoutSession.Status.OPEN, expires_at__gt=usable_until
+        ).afirst()
+    if session is None:
+        # Only a buyer holding the car may open a new session, and the
+        # session cannot outlive the hold.
+        reserved_until = await areserve(car.pk, user.pk)
+        if reserved_until is None:
+            raise CheckoutError(
+                "Otro comprador está pagando este vehículo. Inténtalo más tarde.", status=409
+            )
+        params["expires_at"] = int(reserved_until.timestamp())
+        idempotency_key = (
+            f"checkout-{user.pk}-{car.pk}-{amount}-{await matching.acount()}"
+            f"-{params['expires_at']}"
+        )
+        try:
+            remote = await stripe_client().v1.checkout.sessions.create_async(
+                params=params, options={"idempotency_key": idempotency_key}
+            )
+        except stripe.StripeError as exc:
+            raise CheckoutError(
+                f"Error creando la sesión de pago: {exc.user_message or 'inténtalo de nuevo.'}"
+            ) from exc
+        session, _ = await CheckoutSession.objects.aget_or_create(
+            stripe_session_id=remote.id,
+            defaults={
+                "user": user,
+                "car": car,
+                "amount_cents": amount,
+                "idempotency_key": idempotency_key,
+                "url": remote.url or "",
+                "expires_at": datetime.fromtimestamp(remote.expires_at, dt_timezone.utc),
+            },
+        )
+
+    timeout = (session.expires_at - usable_until).total_seconds()
+    if timeout > 0:
+        await cache.aset(key, session, timeout)
+    return session
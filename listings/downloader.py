@@ -0,0 +1,190 @@
+"""Concurrent, resumable HTTP downloader for listing photos.
+
+Downloads run on a bounded thread pool sharing one pooled ``requests.Session``
+and are streamed to ``.part`` files in a work directory, one per URL and job
+``key``, so memory use does not depend on image size. An interrupted download
+resumes with a ``Range`` request (guarded by ``If-Range``) on the next attempt
+or the next run, and known ``ETag``/``Last-Modified`` validators turn
+unchanged images into cheap 304s.
+"""
+
+import hashlib
+import json
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DOWNLOADED = "downloaded"
+NOT_MODIFIED = "not_modified"
+FAILED = "failed"
+
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+RETRY_EXCEPTIONS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+@dataclass
+class DownloadJob:
+    url: str
+    etag: str = ""
+    last_modified: str = ""
+    context: dict = field(default_factory=dict)
+    # Tells apart jobs for the same URL, which must not share a partial file.
+    key: str = ""
+
+
+@dataclass
+class DownloadResult:
+    job: DownloadJob
+    status: str
+    path: Path | None = None
+    etag: str = ""
+    last_modified: str = ""
+    size: int = 0
+    attempts: int = 0
+    error: str = ""
+
+    def discard(self) -> None:
+        """Remove the downloaded file once it has been stored elsewhere."""
+        if self.path is not None:
+            self.path.unlink(missing_ok=True)
+            self.path.with_suffix(".json").unlink(missing_ok=True)
+
+
+class RetryableError(Exception):
+    pass
+
+
+class PhotoDownloader:
+    def __init__(
+        self,
+        *,
+        workers: int = 8,
+        retries: int = 3,
+        backoff: float = 0.5,
+        timeout: float = 30,
+        chunk_size: int = 64 * 1024,
+        workdir: str | Path | None = None,
+        session: requests.Session | None = None,
+    ):
+        self.workers = max(1, workers)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.workdir = Path(workdir or Path(tempfile.gettempdir()) / "compramos-downloads")
+        self.workdir.mkdir(parents=True, exist_ok=True)
+        self.session = session or self._build_session()
+
+    def _build_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["User-Agent"] = "compramos-tu-coche/photo-downloader"
+        return session
+
+    def part_path(self, url: str, key: str = "") -> Path:
+        digest = hashlib.sha256(f"{key}\n{url}".encode() if key else url.encode())
+        return self.workdir / f"{digest.hexdigest()[:32]}.part"
+
+    def download_all(self, jobs):
+        """Yield a DownloadResult per job, as downloads finish."""
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="download") as pool:
+            pending = set()
+            for job in jobs:
+                pending.add(pool.submit(self.fetch, job))
+                # Bound the backlog so huge source files are not submitted at once.
+                if len(pending) >= self.workers * 4:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            for future in as_completed(pending):
+                yield future.result()
+
+    def fetch(self, job: DownloadJob) -> DownloadResult:
+        """Download one URL with retries; never raises."""
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = self._fetch_once(job)
+            except RetryableError as exc:
+                error = str(exc)
+            except RETRY_EXCEPTIONS as exc:
+                error = f"{type(exc).__name__}: {exc}"
+            except requests.RequestException as exc:
+                return DownloadResult(job, FAILED, attempts=attempt, error=str(exc))
+            except OSError as exc:  # the partial file, not the network
+                return DownloadResult(job, FAILED, attempts=attempt, error=str(exc))
+            else:
+                result.attempts = attempt
+                return result
+            if attempt > self.retries:
+                return DownloadResult(job, FAILED, attempts=attempt, error=error)
+            time.sleep(self.backoff * 2 ** (attempt - 1))
+
+    def _fetch_once(self, job: DownloadJob) -> DownloadResult:
+        part = self.part_path(job.url, job.key)
+        meta_path = part.with_suffix(".json")
+        offset = part.stat().st_size if part.exists() else 0
+        meta = json.loads(meta_path.read_text()) if offset and meta_path.exists() else {}
+
+        headers = {}
+        if job.etag:
+            headers["If-None-Match"] = job.etag
+        if job.last_modified:
+            headers["If-Modified-Since"] = job.last_modified
+        if offset and (meta.get("etag") or meta.get("last_modified")):
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = meta.get("etag") or meta["last_modified"]
+
+        response = self.session.get(job.url, headers=headers, stream=True, timeout=self.timeout)
+        with response:
+            if response.status_code == 304:
+                part.unlink(missing_ok=True)
+                meta_path.unlink(missing_ok=True)
+                return DownloadResult(
+                    job,
+                    NOT_MODIFIED,
+                    etag=job.etag,
+                    last_modified=job.last_modified,
+                )
+            if response.status_code in RETRY_STATUSES:
+                raise RetryableError(f"HTTP {response.status_code}")
+            if response.status_code == 416:
+                # The partial file no longer matches the resource: start over.
+                part.unlink(missing_ok=True)
+                meta_path.unlink(missing_ok=True)
+                raise RetryableError("HTTP 416")
+            response.raise_for_status()
+
+            etag = response.headers.get("ETag", "")
+            last_modified = response.headers.get("Last-Modified", "")
+            resuming = response.status_code == 206
+            if not resuming:
+                meta_path.write_text(json.dumps({"etag": etag, "last_modified": last_modified}))
+            else:
+                etag = etag or meta.get("etag", "")
+                last_modified = last_modified or meta.get("last_modified", "")
+
+            with part.open("ab" if resuming else "wb") as target:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    target.write(chunk)
+
+        return DownloadResult(
+            job,
+            DOWNLOADED,
+            path=part,
+            etag=etag,
+            last_modified=last_modified,
+            size=part.stat().st_size,
+        )
@@ -0,0 +1,133 @@
+"""Streaming export of the catalogue as CSV or JSON Lines.
+
+Rows are read with ``values()`` and ``iterator(chunk_size=...)`` and turned
+into text one by one, so memory use does not grow with the catalogue and the
+first bytes go out before the last rows are read. Photo URLs are loaded with
+one query per chunk of cars. Under ASGI, where Django would buffer a sync
+iterator whole, ``aexport_rows`` and ``arender_export`` stream the same rows
+from keyset pages read with the async ORM.
+"""
+
+import csv
+import json
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from asgiref.sync import sync_to_async
+
+from .models import CarPhoto
+
+EXPORT_FIELDS = (
+    "id",
+    "license_plate",
+    "brand",
+    "model_name",
+    "year",
+    "kilometers",
+    "price",
+    "description",
+    "created_at",
+    "updated_at",
+)
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+}
+DEFAULT_CHUNK_SIZE = 2000
+PHOTO_SEPARATOR = " "
+
+
+def attach_photos(rows, photo_url=None):
+    """Set ``row["photos"]`` to the ordered photo URLs of each car in ``rows``.
+
+    ``rows`` are dicts with an ``id``; one query loads the photos of all of
+    them. ``photo_url`` turns a storage URL into the one to publish (e.g.
+    absolute).
+    """
+    storage = CarPhoto._meta.get_field("image").storage
+    photos = {}
+    images = (
+        CarPhoto.objects.filter(car_id__in=[row["id"] for row in rows])
+        .order_by("car_id", "position", "id")
+        .values_list("car_id", "image")
+    )
+    for car_id, name in images:
+        url = storage.url(name)
+        photos.setdefault(car_id, []).append(photo_url(url) if photo_url else url)
+    for row in rows:
+        row["photos"] = photos.get(row["id"], [])
+    return rows
+
+
+def export_rows(queryset, *, chunk_size: int = DEFAULT_CHUNK_SIZE, photo_url=None):
+    """Yield one dict per car with ``EXPORT_FIELDS`` plus a ``photos`` list."""
+    rows = queryset.values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        yield from attach_photos(chunk, photo_url)
+
+
+async def aexport_rows(queryset, *, chunk_size: int = DEFAULT_CHUNK_SIZE, photo_url=None):
+    """``export_rows`` as an async generator, newest cars first.
+
+    Each chunk is a keyset page on ``(created_at, id)``, so no cursor or
+    transaction stays open between chunks.
+    """
+    queryset = queryset.order_by("-created_at", "-id").values(*EXPORT_FIELDS)
+    page = queryset
+    while True:
+        chunk = [row async for row in page[:chunk_size]]
+        if not chunk:
+            return
+        await sync_to_async(attach_photos)(chunk, photo_url)
+        for row in chunk:
+            yield row
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1]
+        page = queryset.filter(
+            Q(created_at__lt=last["created_at"])
+            | Q(created_at=last["created_at"], id__lt=last["id"])
+        )
+
+
+class _Echo:
+    """File-like object whose ``write`` returns the line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def csv_line(row) -> str:
+    values = [row[name] for name in EXPORT_FIELDS]
+    return csv.writer(_Echo()).writerow([*values, PHOTO_SEPARATOR.join(row["photos"])])
+
+
+def jsonl_line(row) -> str:
+    return json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def _format(fmt: str):
+    """``(header, line function)`` of ``fmt``."""
+    if fmt == "csv":
+        return csv.writer(_Echo()).writerow([*EXPORT_FIELDS, "photos"]), csv_line
+    return "", jsonl_line
+
+
+def render_export(rows, fmt: str):
+    """Text chunks of ``rows`` in ``fmt`` (a key of ``EXPORT_FORMATS``)."""
+    header, line = _format(fmt)
+    if header:
+        yield header
+    for row in rows:
+        yield line(row)
+
+
+async def arender_export(rows, fmt: str):
+    """``render_export`` for the async iterator ``rows``."""
+    header, line = _format(fmt)
+    if header:
+        yield header
+    async for row in rows:
+        yield line(row)
@@ -0,0 +1,34 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Count
+
+from .cache import catalogue_key, get_or_compute
+from .models import Car
+
+DEFAULT_FACETS_TIMEOUT = 60 * 60
+
+
+def compute_catalogue_facets() -> dict:
+    """Brand and year facets with counts, from a single grouped query."""
+    brands = Counter()
+    years = Counter()
+    rows = (
+        Car.objects.filter(is_active=True)
+        .values_list("brand", "year")
+        .annotate(total=Count("id"))
+        .order_by()
+    )
+    for brand, year, total in rows:
+        brands[brand] += total
+        years[year] += total
+    return {
+        "brands": sorted(brands.items()),
+        "years": sorted(years.items()),
+    }
+
+
+def get_catalogue_facets() -> dict:
+    """Cached facets; the cache is invalidated whenever a Car changes."""
+    timeout = getattr(settings, "LISTINGS_FACETS_TIMEOUT", DEFAULT_FACETS_TIMEOUT)
+    return get_or_compute(catalogue_key("facets"), compute_catalogue_facets, timeout)
@@ -0,0 +1,48 @@
+"""Catalogue filters shared by the listing page, the export and the API.
+
+``params`` is any mapping with the public query parameters (a ``QueryDict``
+or a plain dict); invalid numbers are ignored rather than rejected, as the
+listing page always did.
+"""
+
+from django.db.models import Value
+from django.db.models.functions import Lower
+
+from .search import get_search_backend
+
+FILTER_PARAMS = ("brand", "model", "year_min", "year_max", "km_max", "q")
+
+
+def _int_param(params, name):
+    try:
+        return int(params.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def filter_catalogue(queryset, params):
+    """Apply the brand/model/year/km/text filters of ``params`` to ``queryset``."""
+    brand = params.get("brand")
+    model_name = params.get("model")
+    year_min = _int_param(params, "year_min")
+    year_max = _int_param(params, "year_max")
+    km_max = _int_param(params, "km_max")
+    search = params.get("q")
+
+    if brand:
+        # Compare against LOWER(brand) so car_active_brand_lower_idx applies;
+        # SQLite cannot use an index for the LIKE emitted by brand__iexact.
+        queryset = queryset.alias(brand_lower=Lower("brand")).filter(
+            brand_lower=Lower(Value(brand))
+        )
+    if model_name:
+        queryset = queryset.filter(model_name__icontains=model_name)
+    if year_min is not None:
+        queryset = queryset.filter(year__gte=year_min)
+    if year_max is not None:
+        queryset = queryset.filter(year__lte=year_max)
+    if km_max is not None:
+        queryset = queryset.filter(kilometers__lte=km_max)
+    if search:
+        queryset = get_search_backend().search(queryset, search)
+    return queryset
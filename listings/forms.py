@@ -11,3 +11,14 @@ class SignUpForm(UserCreationForm):
     class Meta(UserCreationForm.Meta):
         model = get_user_model()
         fields = ("username", "first_name", "last_name", "email")
+
+
+class PriceChangeForm(forms.Form):
+    percent = forms.DecimalField(
+        label="Variación del precio (%)",
+        max_digits=5,
+        decimal_places=2,
+        min_value=-90,
+        max_value=100,
+        help_text="Usa un valor negativo para rebajar, por ejemplo -5.",
+    )
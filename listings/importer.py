@@ -0,0 +1,287 @@
+"""Bulk import of dealer inventory feeds.
+
+Feeds are CSV, JSON Lines or JSON arrays with one vehicle per row/object and
+the columns in ``FEED_FIELDS``. They are read incrementally, validated in
+batches with ``listings.validation`` and upserted by ``license_plate``, so
+memory use and query count depend on the batch size rather than on the size
+of the feed.
+"""
+
+import csv
+import json
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from .cache import bump_catalogue_version
+from .models import Car
+from .search import get_search_backend
+from .validation import validate_cars
+
+FEED_FIELDS = ("license_plate", "brand", "model_name", "kilometers", "year", "price", "description")
+REQUIRED_FIELDS = ("license_plate", "brand", "model_name", "kilometers", "year", "price")
+
+# Columns an upsert overwrites; created_at, created_by and photo_count keep
+# their stored values, and a sold car is never reactivated by its feed row.
+UPDATE_FIELDS = [
+    "brand",
+    "model_name",
+    "kilometers",
+    "year",
+    "price",
+    "description",
+    "is_active",
+    "updated_at",
+]
+
+# Every column written by an upsert, in the order of ``upsert_cars`` params.
+INSERT_FIELDS = [
+    "license_plate",
+    "brand",
+    "model_name",
+    "kilometers",
+    "year",
+    "price",
+    "description",
+    "is_active",
+    "photo_count",
+    "created_at",
+    "updated_at",
+    "created_by",
+]
+
+READ_CHUNK = 64 * 1024
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    imported: int = 0
+    created: int = 0
+    deactivated: int = 0
+    seconds: float = 0.0
+    errors: list = field(default_factory=list)  # (row number, message)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def read_feed(path: Path):
+    """Yield ``(row number, dict)`` pairs without loading the whole file."""
+    suffix = path.suffix.lower()
+    with path.open(encoding="utf-8", newline="") as handle:
+        if suffix == ".csv":
+            yield from enumerate(csv.DictReader(handle), start=1)
+        elif suffix == ".jsonl":
+            number = 0
+            for line in handle:
+                if line.strip():
+                    number += 1
+                    yield number, json.loads(line)
+        elif suffix == ".json":
+            yield from enumerate(iter_json_array(handle), start=1)
+        else:
+            raise ValueError("El fichero debe ser .csv, .jsonl o .json")
+
+
+def iter_json_array(handle):
+    """Incrementally decode the objects of a top-level JSON array."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip(" \t\r\n,")
+        if not started and buffer:
+            if buffer[0] != "[":
+                raise ValueError("El JSON debe ser una lista de objetos")
+            buffer = buffer[1:]
+            started = True
+            continue
+        if buffer.startswith("]"):
+            return
+        if buffer:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # A number at the end of the buffer may still be incomplete.
+                if end < len(buffer) or eof:
+                    yield item
+                    buffer = buffer[end:]
+                    continue
+        if eof:
+            if buffer:
+                raise ValueError("JSON incompleto")
+            return
+        chunk = handle.read(READ_CHUNK)
+        eof = not chunk
+        buffer += chunk
+
+
+def row_to_car(row: dict, **fields) -> Car:
+    """Build an unsaved Car from a feed row, raising ValidationError on bad values."""
+    if not isinstance(row, dict):
+        raise ValidationError("Cada fila debe ser un objeto.")
+    missing = [name for name in REQUIRED_FIELDS if row.get(name) in (None, "")]
+    if missing:
+        raise ValidationError({name: ["Este campo es obligatorio."] for name in missing})
+    try:
+        values = {
+            "license_plate": str(row["license_plate"]).strip(),
+            "brand": str(row["brand"]).strip(),
+            "model_name": str(row["model_name"]).strip(),
+            "kilometers": int(row["kilometers"]),
+            "year": int(row["year"]),
+            "price": Decimal(str(row["price"])),
+            "description": str(row.get("description") or "").strip(),
+        }
+    except (TypeError, ValueError, InvalidOperation) as exc:
+        raise ValidationError(f"Valor no válido: {exc}") from exc
+    return Car(**values, is_active=True, **fields)
+
+
+def error_text(error: ValidationError) -> str:
+    if hasattr(error, "error_dict"):
+        return "; ".join(
+            f"{name}: {' '.join(messages)}" for name, messages in error.message_dict.items()
+        )
+    return " ".join(error.messages)
+
+
+def upsert_cars(cars, using: str = "default") -> None:
+    """Insert ``cars`` or update the stored rows with the same plate.
+
+    Where the backend supports ``ON CONFLICT (license_plate)``, one statement
+    is compiled once and run with ``executemany``: Django's per-row SQL
+    compilation would otherwise cost more than the database work itself.
+    Elsewhere the stored plates are looked up first and the batch is split
+    into ``bulk_update`` and ``bulk_create``.
+    """
+    connection = connections[using]
+    if not connection.features.supports_update_conflicts_with_target:
+        _update_then_create(cars, using)
+        return
+
+    ops = connection.ops
+    fields = [Car._meta.get_field(name) for name in INSERT_FIELDS]
+    sold_at = ops.quote_name(Car._meta.get_field("sold_at").column)
+    updates = []
+    for name in UPDATE_FIELDS:
+        column = ops.quote_name(Car._meta.get_field(name).column)
+        value = f"EXCLUDED.{column}"
+        if name == "is_active":
+            value = f"({value} AND {sold_at} IS NULL)"
+        updates.append(f"{column} = {value}")
+    sql = "INSERT INTO %s (%s) VALUES (%s) ON CONFLICT(%s) DO UPDATE SET %s" % (
+        ops.quote_name(Car._meta.db_table),
+        ", ".join(ops.quote_name(field.column) for field in fields),
+        ", ".join(["%s"] * len(fields)),
+        ops.quote_name(Car._meta.get_field("license_plate").column),
+        ", ".join(updates),
+    )
+    now = ops.adapt_datetimefield_value(timezone.now())
+    price = Car._meta.get_field("price")
+    params = [
+        (
+            car.license_plate,
+            car.brand,
+            car.model_name,
+            car.kilometers,
+            car.year,
+            price.get_db_prep_save(car.price, connection),
+            car.description,
+            car.is_active,
+            car.photo_count,
+            now,
+            now,
+            car.created_by_id,
+        )
+        for car in cars
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def _update_then_create(cars, using: str) -> None:
+    stored = {
+        plate: (pk, sold_at)
+        for plate, pk, sold_at in Car.objects.using(using)
+        .filter(license_plate__in=[car.license_plate for car in cars])
+        .values_list("license_plate", "pk", "sold_at")
+    }
+    now = timezone.now()
+    updated, created = [], []
+    for car in cars:
+        if car.license_plate not in stored:
+            created.append(car)
+            continue
+        car.pk, sold_at = stored[car.license_plate]
+        car.is_active = car.is_active and sold_at is None
+        car.updated_at = now  # bulk_update() does not apply auto_now
+        updated.append(car)
+    Car.objects.using(using).bulk_update(updated, UPDATE_FIELDS)
+    Car.objects.using(using).bulk_create(created)
+
+
+def prepare_batch(rows, batch_size: int, **fields):
+    """Read and validate the next batch: ``(row count, valid cars, errors)``."""
+    batch = list(islice(rows, batch_size))
+    if not batch:
+        return None
+    cars, numbers, errors = [], [], []
+    for number, row in batch:
+        try:
+            cars.append(row_to_car(row, **fields))
+            numbers.append(number)
+        except ValidationError as exc:
+            errors.append((number, error_text(exc)))
+    invalid = validate_cars(cars, existing_ok=True)
+    for index, error in sorted(invalid.items()):
+        errors.append((numbers[index], error_text(error)))
+    valid = [car for index, car in enumerate(cars) if index not in invalid]
+    return len(batch), valid, errors
+
+
+def import_feed(rows, *, batch_size: int = 1000, deactivate_missing=False, created_by=None):
+    """Upsert every valid row of ``rows`` (as yielded by ``read_feed``).
+
+    With ``deactivate_missing`` the active cars not present in the feed are
+    deactivated afterwards, limited to those created by ``created_by`` when
+    given. New cars are added to the search index once per batch and the
+    cached catalogue is invalidated once, at the end.
+    """
+    report = ImportReport()
+    started_at = timezone.now()
+    started = time.perf_counter()
+    count_before = Car.objects.count()
+    rows = iter(rows)
+    search = get_search_backend()
+    while prepared := prepare_batch(rows, batch_size, created_by=created_by):
+        count, valid, errors = prepared
+        with transaction.atomic(), search.deferred_indexing(connections[DEFAULT_DB_ALIAS]):
+            upsert_cars(valid)
+        report.rows += count
+        report.imported += len(valid)
+        report.errors.extend(errors)
+
+    report.created = Car.objects.count() - count_before
+    if deactivate_missing:
+        missing = Car.objects.filter(is_active=True, updated_at__lt=started_at)
+        if created_by is not None:
+            missing = missing.filter(created_by=created_by)
+        report.deactivated = missing.update(is_active=False, updated_at=timezone.now())
+    # Raw upserts and update() skip the signals that invalidate the cache.
+    bump_catalogue_version()
+    report.errors.sort()
+    report.seconds = time.perf_counter() - started
+    return report
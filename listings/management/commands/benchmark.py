@@ -0,0 +1,45 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from listings.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = "Ejecuta un escenario de rendimiento sobre una base de datos temporal."
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenario", choices=sorted(SCENARIOS))
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=20000,
+            help="Número de anuncios sintéticos a generar.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=20,
+            help="Repeticiones por medición.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("Los escenarios de rendimiento requieren SQLite.")
+
+        # A file (not :memory:) so multi-threaded scenarios share the database.
+        workdir = tempfile.mkdtemp(prefix="bench-")
+        connection.settings_dict["TEST"]["NAME"] = os.path.join(workdir, "bench.sqlite3")
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            ok = SCENARIOS[options["scenario"]](self, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            os.rmdir(workdir)
+
+        if ok is False:
+            raise CommandError("El escenario no cumplió el objetivo.")
@@ -0,0 +1,59 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from listings.models import CarPhoto
+from listings.renditions import build_renditions, needs_renditions
+
+
+class Command(BaseCommand):
+    help = "Genera las miniaturas responsive (AVIF/WebP/JPEG) de las fotos existentes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Regenera también las fotos que ya tienen miniaturas.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Fotos procesadas en paralelo.",
+        )
+
+    def handle(self, *args, **options):
+        force = options["force"]
+        photos = CarPhoto.objects.only("id", "image", "renditions").order_by("pk")
+        pending = [
+            photo.pk
+            for photo in photos.iterator(chunk_size=500)
+            if force or needs_renditions(photo)
+        ]
+        if not pending:
+            self.stdout.write(self.style.NOTICE("Todas las fotos tienen miniaturas."))
+            return
+
+        workers = max(1, options["workers"])
+
+        def process(photo_id):
+            try:
+                return photo_id, build_renditions(photo_id, force=force), None
+            except Exception as exc:  # keep going with the remaining photos
+                return photo_id, False, exc
+            finally:
+                if workers > 1:  # each pool thread opened its own connection
+                    connections.close_all()
+
+        built = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(process, pending) if workers > 1 else map(process, pending)
+            for photo_id, done, error in results:
+                if error is not None:
+                    self.stdout.write(self.style.ERROR(f"Foto {photo_id}: {error}"))
+                elif done:
+                    built += 1
+        self.stdout.write(
+            self.style.SUCCESS(f"Miniaturas generadas para {built} de {len(pending)} fotos.")
+        )
@@ -0,0 +1,54 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from listings.export import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, export_rows, render_export
+from listings.filters import filter_catalogue
+from listings.models import Car
+
+
+class Command(BaseCommand):
+    help = "Exporta el catálogo en CSV o JSON Lines sin cargarlo entero en memoria."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+        parser.add_argument("--output", help="Fichero de salida (por defecto, la salida estándar).")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help="Anuncios leídos de la base de datos por bloque.",
+        )
+        parser.add_argument(
+            "--base-url",
+            default="",
+            help="Prefijo para las URLs de las fotos, p. ej. https://compramostucoche.es",
+        )
+        parser.add_argument(
+            "--include-inactive",
+            action="store_true",
+            help="Incluye también los anuncios desactivados.",
+        )
+        for name in ("brand", "model", "year_min", "year_max", "km_max", "q"):
+            parser.add_argument(f"--{name.replace('_', '-')}", dest=name, help="Filtro como en el listado.")
+
+    def handle(self, *args, **options):
+        queryset = Car.objects.order_by("-created_at", "-id")
+        if not options["include_inactive"]:
+            queryset = queryset.filter(is_active=True)
+        queryset = filter_catalogue(queryset, options)
+        base_url = options["base_url"].rstrip("/")
+        rows = export_rows(
+            queryset,
+            chunk_size=max(1, options["chunk_size"]),
+            photo_url=(lambda url: base_url + url) if base_url else None,
+        )
+
+        lines = render_export(rows, options["format"])
+        if not options["output"]:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+        with open(options["output"], "w", encoding="utf-8", newline="") as target:
+            target.writelines(lines)
+        self.stderr.write(self.style.SUCCESS(f"Catálogo exportado a {options['output']}"))
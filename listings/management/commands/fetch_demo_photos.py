@@ -1,10 +1,14 @@
-import itertools
+import csv
+import json
+import time
+from pathlib import Path
 
-import requests
-from django.core.files.base import ContentFile
-from django.core.management.base import BaseCommand
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
 
+from listings.downloader import DOWNLOADED, NOT_MODIFIED, DownloadJob, PhotoDownloader
 from listings.models import Car, CarPhoto
+from listings.queue import enqueue
 
 # Pexels URLs (licencia gratuita). Sustituye por tus propias fuentes si lo prefieres.
 EXTERNAL_SOURCES = {
@@ -61,6 +65,38 @@ EXTERNAL_SOURCES = {
 }
 
 
+def read_sources(path: Path):
+    """Yield ``(license_plate, url)`` pairs from a CSV, JSON or JSON Lines file.
+
+    CSV needs ``license_plate`` and ``url`` columns. JSON is either a mapping
+    ``{matrícula: [urls]}`` or a list of ``{"license_plate", "urls"}`` objects;
+    JSON Lines has one such object (or ``{"license_plate", "url"}``) per line.
+    """
+    suffix = path.suffix.lower()
+    with path.open(encoding="utf-8", newline="") as handle:
+        if suffix == ".csv":
+            for row in csv.DictReader(handle):
+                yield row["license_plate"].strip(), row["url"].strip()
+        elif suffix == ".jsonl":
+            for line in handle:
+                if line.strip():
+                    yield from _entry_pairs(json.loads(line))
+        elif suffix == ".json":
+            data = json.load(handle)
+            if isinstance(data, dict):
+                data = [{"license_plate": plate, "urls": urls} for plate, urls in data.items()]
+            for entry in data:
+                yield from _entry_pairs(entry)
+        else:
+            raise CommandError("El fichero de fuentes debe ser .csv, .json o .jsonl")
+
+
+def _entry_pairs(entry: dict):
+    urls = entry.get("urls") or [entry["url"]]
+    for url in urls:
+        yield entry["license_plate"].strip(), url.strip()
+
+
 class Command(BaseCommand):
     help = "Descarga fotos libres de Pexels/URLs configuradas y las asigna a cada anuncio."
 
@@ -70,41 +106,145 @@ class Command(BaseCommand):
             action="store_true",
             help="Reemplaza todas las fotos existentes por las descargadas.",
         )
+        parser.add_argument(
+            "--enqueue",
+            action="store_true",
+            help="Encola las descargas para el worker (run_tasks) en lugar de descargarlas ahora.",
+        )
+        parser.add_argument(
+            "--source",
+            type=Path,
+            help="Fichero CSV/JSON/JSONL con matrículas y URLs (por defecto, las fuentes de demo).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Descargas simultáneas.",
+        )
+        parser.add_argument(
+            "--retries",
+            type=int,
+            default=3,
+            help="Reintentos por URL ante errores de red o 5xx.",
+        )
 
     def handle(self, *args, **options):
         force = options["force"]
-        total_downloaded = 0
+        started = time.perf_counter()
+
+        if options["source"]:
+            pairs = read_sources(options["source"])
+        else:
+            pairs = ((plate, url) for plate, urls in EXTERNAL_SOURCES.items() for url in urls)
+        sources = {}
+        for plate, url in pairs:
+            sources.setdefault(plate.upper(), []).append(url)
 
-        for license_plate, urls in EXTERNAL_SOURCES.items():
-            car = Car.objects.filter(license_plate=license_plate).first()
+        cars = {}
+        plates = list(sources)
+        for start in range(0, len(plates), 500):
+            cars.update(
+                Car.objects.in_bulk(plates[start : start + 500], field_name="license_plate")
+            )
+
+        jobs = []
+        total_queued = 0
+        for license_plate, urls in sources.items():
+            car = cars.get(license_plate)
             if not car:
                 self.stdout.write(self.style.WARNING(f"No existe {license_plate}, se omite."))
                 continue
+            urls = urls[: Car.MAX_PHOTOS]
 
-            if not force:
+            if force:
+                car.photos.all().delete()
+                known = {}
+            else:
+                known = {photo.source_url: photo for photo in car.photos.all() if photo.source_url}
                 existing = car.photos.count()
-                if existing >= len(urls):
+                if not known and existing >= len(urls):
                     self.stdout.write(
                         self.style.NOTICE(
                             f"{car} ya tiene {existing} fotos, usa --force para reemplazar."
                         )
                     )
                     continue
-            else:
-                car.photos.all().delete()
 
             for position, url in enumerate(urls):
-                try:
-                    self.stdout.write(f"Descargando {url} para {car}...")
-                    response = requests.get(url, timeout=30)
-                    response.raise_for_status()
-                except requests.RequestException as exc:
-                    self.stdout.write(self.style.ERROR(f"Error descargando {url}: {exc}"))
+                filename = f"{license_plate.lower()}_{position}.jpg"
+                photo = known.get(url)
+                if options["enqueue"]:
+                    enqueue(
+                        "ingest_remote_photo",
+                        car_id=car.pk,
+                        url=url,
+                        position=position,
+                        filename=filename,
+                        photo_id=photo.pk if photo else None,
+                        etag=photo.source_etag if photo else "",
+                        last_modified=photo.source_last_modified if photo else "",
+                    )
+                    total_queued += 1
                     continue
+                jobs.append(
+                    DownloadJob(
+                        url,
+                        etag=photo.source_etag if photo else "",
+                        last_modified=photo.source_last_modified if photo else "",
+                        key=f"{car.pk}:{position}",
+                        context={
+                            "car": car,
+                            "photo": photo,
+                            "position": position,
+                            "filename": filename,
+                        },
+                    )
+                )
 
-                filename = f"{license_plate.lower()}_{position}.jpg"
-                photo = CarPhoto(car=car, position=position)
-                photo.image.save(filename, ContentFile(response.content), save=True)
-                total_downloaded += 1
+        if total_queued:
+            self.stdout.write(self.style.SUCCESS(f"Descargas encoladas: {total_queued}"))
+
+        downloader = PhotoDownloader(workers=options["workers"], retries=options["retries"])
+        total_downloaded = total_unchanged = total_failed = total_bytes = 0
+        # Downloads run in worker threads; storing files and rows stays here.
+        for result in downloader.download_all(jobs):
+            context = result.job.context
+            if result.status == NOT_MODIFIED:
+                total_unchanged += 1
+                continue
+            if result.status != DOWNLOADED:
+                total_failed += 1
+                self.stdout.write(
+                    self.style.ERROR(f"Error descargando {result.job.url}: {result.error}")
+                )
+                continue
 
-        self.stdout.write(self.style.SUCCESS(f"Fotos descargadas: {total_downloaded}"))
+            photo = context["photo"] or CarPhoto(car=context["car"], position=context["position"])
+            photo.source_url = result.job.url
+            photo.source_etag = result.etag
+            photo.source_last_modified = result.last_modified
+            try:
+                with result.path.open("rb") as handle:
+                    photo.image.save(context["filename"], File(handle), save=True)
+            except Exception as exc:
+                total_failed += 1
+                self.stdout.write(self.style.ERROR(f"No se pudo guardar {result.job.url}: {exc}"))
+                continue
+            finally:
+                result.discard()
+            total_downloaded += 1
+            total_bytes += result.size
+            self.stdout.write(f"Descargada {result.job.url} para {context['car']}")
+
+        elapsed = time.perf_counter() - started
+        if total_unchanged:
+            self.stdout.write(self.style.NOTICE(f"Sin cambios (304): {total_unchanged}"))
+        if total_failed:
+            self.stdout.write(self.style.ERROR(f"Fallidas: {total_failed}"))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Fotos descargadas: {total_downloaded} "
+                f"({total_bytes / 1_048_576:.1f} MiB en {elapsed:.1f} s)"
+            )
+        )
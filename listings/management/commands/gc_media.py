@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from listings.media_gc import DEFAULT_MIN_AGE, collect_orphans
+
+
+class Command(BaseCommand):
+    help = "Borra las fotos y miniaturas del disco que ya no pertenecen a ningún anuncio."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Solo lista los ficheros huérfanos, sin borrarlos.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Ficheros borrados en paralelo.",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=0,
+            help="Máximo de ficheros borrados por segundo (0, sin límite).",
+        )
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=DEFAULT_MIN_AGE,
+            help="Segundos de antigüedad mínima; los ficheros más recientes se respetan.",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        verbose = options["verbosity"] > 1 or dry_run
+        report = collect_orphans(
+            dry_run=dry_run,
+            workers=options["workers"],
+            rate=options["rate"],
+            min_age=options["min_age"],
+            on_orphan=(lambda media: self.stdout.write(media.name)) if verbose else None,
+        )
+        for name, message in report.errors:
+            self.stdout.write(self.style.ERROR(f"{name}: {message}"))
+        size = filesizeformat(report.reclaimed)
+        if dry_run:
+            summary = (
+                f"{report.orphans} huérfanos de {report.scanned} ficheros; "
+                f"se liberarían {size}."
+            )
+        else:
+            summary = (
+                f"{report.deleted} de {report.orphans} huérfanos borrados "
+                f"({report.scanned} ficheros revisados); {size} liberados "
+                f"en {report.seconds:.1f} s."
+            )
+        self.stdout.write(self.style.SUCCESS(summary))
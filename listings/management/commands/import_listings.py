@@ -0,0 +1,64 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.importer import import_feed, read_feed
+from listings.models import User
+
+
+class Command(BaseCommand):
+    help = "Importa un feed de inventario (CSV, JSONL o JSON) creando o actualizando anuncios por matrícula."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path, help="Fichero del feed.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Filas por lote.")
+        parser.add_argument(
+            "--deactivate-missing",
+            action="store_true",
+            help="Desactiva los anuncios activos que no aparecen en el feed (ni en filas válidas).",
+        )
+        parser.add_argument(
+            "--user",
+            help="Usuario que figura como creador de los anuncios nuevos; limita también --deactivate-missing a sus anuncios.",
+        )
+        parser.add_argument(
+            "--max-errors",
+            type=int,
+            default=50,
+            help="Errores por fila que se muestran (el resto solo se cuenta).",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not path.exists():
+            raise CommandError(f"No existe {path}")
+        created_by = None
+        if options["user"]:
+            created_by = User.objects.filter(username=options["user"]).first()
+            if created_by is None:
+                raise CommandError(f"No existe el usuario {options['user']}")
+
+        try:
+            report = import_feed(
+                read_feed(path),
+                batch_size=max(1, options["batch_size"]),
+                deactivate_missing=options["deactivate_missing"],
+                created_by=created_by,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+
+        for number, message in report.errors[: options["max_errors"]]:
+            self.stdout.write(self.style.ERROR(f"Fila {number}: {message}"))
+        hidden = len(report.errors) - options["max_errors"]
+        if hidden > 0:
+            self.stdout.write(self.style.ERROR(f"... y {hidden} errores más."))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{report.rows} filas en {report.seconds:.1f} s "
+                f"({report.rows_per_second:.0f} filas/s): "
+                f"{report.created} nuevos, {report.imported - report.created} actualizados, "
+                f"{len(report.errors)} con errores, {report.deactivated} desactivados."
+            )
+        )
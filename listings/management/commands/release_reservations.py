@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from listings.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = "Libera las reservas de anuncios caducadas y marca como caducadas sus sesiones de pago."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Repite la limpieza cada N segundos en lugar de ejecutarla una vez.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                released, expired = release_expired()
+                if released or expired or options["verbosity"] > 1:
+                    self.stdout.write(
+                        f"Reservas liberadas: {released} · sesiones caducadas: {expired}"
+                    )
+                if not options["interval"]:
+                    return
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING("Detenido."))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from listings.queue import run_worker
+
+
+class Command(BaseCommand):
+    help = "Procesa la cola de tareas en segundo plano (miniaturas, descargas...)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=2,
+            help="Número de tareas ejecutadas en paralelo.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Vacía la cola y termina en lugar de quedarse esperando.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Segundos de espera cuando la cola está vacía.",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"Procesando tareas con concurrencia {options['concurrency']}..."
+        )
+        try:
+            processed = run_worker(
+                options["concurrency"],
+                once=options["once"],
+                poll_interval=options["poll_interval"],
+            )
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING("Detenido."))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Tareas procesadas: {processed}"))
@@ -1,13 +1,21 @@
+import hashlib
 import random
+import time
+from concurrent.futures import ProcessPoolExecutor
 from decimal import Decimal
-from io import BytesIO
+from itertools import islice
 
 from django.core.files.base import ContentFile
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
-from PIL import Image, ImageDraw
-
+from listings.cache import bump_catalogue_version
 from listings.models import Car, CarPhoto, User
+from listings.renditions import generate_renditions
+from listings.synthetic import CATALOGUE_MODELS, IMAGE_COLORS, render_placeholder, synthetic_cars
+
+# Synthetic catalogues share a small pool of images, stored once by content hash.
+SEED_IMAGE_DIR = "cars/seed"
 
 SAMPLE_CARS = [
     {
@@ -103,18 +111,35 @@ SAMPLE_CARS = [
 ]
 
 
-def generate_image_bytes(text: str, color: str) -> bytes:
-    img = Image.new("RGB", (1200, 800), color)
-    draw = ImageDraw.Draw(img)
-    draw.text((50, 50), text, fill=(255, 255, 255))
-    buffer = BytesIO()
-    img.save(buffer, format="JPEG", quality=80)
-    return buffer.getvalue()
-
-
 class Command(BaseCommand):
     help = "Seed the database with 10 car listings and demo images."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--count",
+            type=int,
+            help="Genera N anuncios sintéticos en bloque (pruebas de carga) en lugar de los 10 de demo.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000, help="Anuncios por inserción.")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Procesos que generan las imágenes.",
+        )
+        parser.add_argument(
+            "--image-variants",
+            type=int,
+            default=3,
+            help="Imágenes distintas por marca; todas las fotos reutilizan este conjunto.",
+        )
+        parser.add_argument(
+            "--no-renditions",
+            action="store_true",
+            help="No genera las miniaturas responsive de las imágenes compartidas.",
+        )
+        parser.add_argument("--seed", type=int, help="Semilla aleatoria para repetir el catálogo.")
+
     def handle(self, *args, **options):
         admin = (
             User.objects.filter(role=User.Roles.ADMIN).first()
@@ -126,6 +151,10 @@ class Command(BaseCommand):
             )
         )
 
+        if options["count"]:
+            self.seed_synthetic(admin, options)
+            return
+
         created = 0
         colors = ["#0f172a", "#145388", "#ef4444", "#22c55e", "#f97316"]
 
@@ -152,7 +181,7 @@ class Command(BaseCommand):
             # attach demo photos
             total_photos = random.randint(2, 4)
             for idx in range(total_photos):
-                image_bytes = generate_image_bytes(
+                image_bytes = render_placeholder(
                     f"{car.brand} {car.model_name}", random.choice(colors)
                 )
                 photo = CarPhoto(
@@ -173,3 +202,94 @@ class Command(BaseCommand):
             )
         else:
             self.stdout.write(self.style.WARNING("No se crearon anuncios nuevos."))
+
+    def seed_synthetic(self, admin, options):
+        started = time.perf_counter()
+        rng = random.Random(options["seed"])
+        images = self.image_pool(rng, options)
+        self.stdout.write(
+            f"Imágenes compartidas: {sum(len(names) for names in images.values())} "
+            f"({time.perf_counter() - started:.1f} s)"
+        )
+
+        # Continue after the existing rows so repeated runs add new plates.
+        cars = synthetic_cars(
+            options["count"],
+            start=Car.objects.count(),
+            seed=options["seed"],
+            created_by=admin,
+        )
+        batch_size = max(1, options["batch_size"])
+        created = photos = 0
+        while batch := list(islice(cars, batch_size)):
+            taken = set(
+                Car.objects.filter(
+                    license_plate__in=[car.license_plate for car in batch]
+                ).values_list("license_plate", flat=True)
+            )
+            batch = [car for car in batch if car.license_plate not in taken]
+            picks = []
+            for car in batch:
+                pool = images[car.brand]
+                picked = rng.sample(pool, min(len(pool), rng.randint(2, 4)))
+                # bulk_create bypasses CarPhoto.save, which maintains the counter.
+                car.photo_count = len(picked)
+                picks.append(picked)
+            with transaction.atomic():
+                Car.objects.bulk_create(batch)
+                rows = [
+                    CarPhoto(car=car, position=position, image=name, renditions=manifest)
+                    for car, picked in zip(batch, picks)
+                    for position, (name, manifest) in enumerate(picked)
+                ]
+                CarPhoto.objects.bulk_create(rows)
+            created += len(batch)
+            photos += len(rows)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{created} anuncios ({created / elapsed:.0f}/s)")
+
+        # bulk_create skips the signals that invalidate the cached catalogue.
+        bump_catalogue_version()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Se insertaron {created} anuncios y {photos} fotos "
+                f"en {time.perf_counter() - started:.1f} s."
+            )
+        )
+
+    def image_pool(self, rng, options):
+        """Render, store and thumbnail ``--image-variants`` images per brand.
+
+        Files are named after their content hash, so identical images are
+        stored once and reused across runs.
+        """
+        variants = max(1, options["image_variants"])
+        specs = [
+            (brand, color)
+            for brand in CATALOGUE_MODELS
+            for color in rng.sample(IMAGE_COLORS, min(variants, len(IMAGE_COLORS)))
+        ]
+        texts = [brand for brand, _ in specs]
+        colors = [color for _, color in specs]
+        workers = max(1, options["workers"])
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                rendered = list(pool.map(render_placeholder, texts, colors))
+        else:
+            rendered = list(map(render_placeholder, texts, colors))
+
+        storage = CarPhoto._meta.get_field("image").storage
+        images = {}
+        for (brand, _), data in zip(specs, rendered):
+            name = f"{SEED_IMAGE_DIR}/{hashlib.sha256(data).hexdigest()[:16]}.jpg"
+            manifest = {}
+            if storage.exists(name):
+                existing = CarPhoto.objects.filter(image=name).only("image", "renditions").first()
+                if existing and existing.renditions.get("source") == name:
+                    manifest = existing.renditions
+            else:
+                name = storage.save(name, ContentFile(data))
+            if not manifest and not options["no_renditions"]:
+                manifest = generate_renditions(CarPhoto(image=name))
+            images.setdefault(brand, []).append((name, manifest))
+        return images
@@ -0,0 +1,210 @@
+"""Garbage collection of photo files that no ``CarPhoto`` references.
+
+Deleting cars (or re-downloading photos with ``fetch_demo_photos --force``)
+removes the rows but not the files. ``find_orphans`` walks the upload
+directory one folder at a time with ``os.scandir`` and checks the names in
+batches, one ``image IN (...)`` query per chunk, so neither the file tree
+nor the photo table is ever loaded whole. A rendition is kept while the
+manifest of its source photo lists it; one whose source is not on disk is
+left alone, since there is no cheap way to tell who owns it.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import PurePosixPath
+
+from .models import CarPhoto
+from .renditions import RENDITION_NAME_RE, rendition_files
+
+BATCH_SIZE = 2000
+LOOKUP_CHUNK = 500
+# Files younger than this may belong to an upload whose row is not committed yet.
+DEFAULT_MIN_AGE = 3600  # seconds
+
+
+@dataclass
+class MediaFile:
+    name: str  # storage name, relative to the storage root
+    path: str
+    size: int
+    mtime: float
+
+
+@dataclass
+class CollectionReport:
+    scanned: int = 0
+    orphans: int = 0
+    deleted: int = 0
+    reclaimed: int = 0  # bytes
+    seconds: float = 0.0
+    errors: list = field(default_factory=list)  # (name, message)
+
+
+class RateLimiter:
+    """Spaces calls to ``wait()`` at most ``rate`` per second across threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def photo_storage():
+    return CarPhoto._meta.get_field("image").storage
+
+
+def upload_root() -> str:
+    """Top-level directory of the photo uploads, e.g. ``cars``."""
+    return CarPhoto._meta.get_field("image").upload_to.split("/", 1)[0]
+
+
+def scan_directories(root: str, prefix: str):
+    """Yield the files of each directory under ``root``, one list per directory."""
+    pending = [(root, prefix)]
+    while pending:
+        path, name = pending.pop()
+        files = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    entry_name = f"{name}/{entry.name}"
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append((entry.path, entry_name))
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        files.append(
+                            MediaFile(entry_name, entry.path, stat.st_size, stat.st_mtime)
+                        )
+        except FileNotFoundError:
+            continue
+        if files:
+            yield files
+
+
+def _referenced(names) -> dict:
+    """``{image name: renditions manifest}`` of the photos using ``names``."""
+    names = list(names)
+    found = {}
+    for start in range(0, len(names), LOOKUP_CHUNK):
+        rows = CarPhoto.objects.filter(image__in=names[start : start + LOOKUP_CHUNK])
+        found.update(rows.values_list("image", "renditions"))
+    return found
+
+
+def unreferenced(names) -> list:
+    """Those of ``names`` that no photo uses, as image or listed rendition.
+
+    A rendition is only judged together with its source: one whose source
+    is not among ``names`` is assumed to be in use.
+    """
+    originals, renditions = [], []
+    for name in names:
+        match = RENDITION_NAME_RE.match(PurePosixPath(name).name)
+        if match:
+            renditions.append((name, match))
+        else:
+            originals.append(name)
+
+    referenced = _referenced(originals)
+    live = set(referenced)
+    for manifest in referenced.values():
+        live.update(rendition_files(manifest))
+    # Renditions are named after the source's stem, whatever its extension.
+    stems = {str(PurePosixPath(name).with_suffix("")) for name in originals}
+
+    orphans = [name for name in originals if name not in live]
+    for name, match in renditions:
+        stem = str(PurePosixPath(name).with_name(match["stem"]))
+        if stem in stems and name not in live:
+            orphans.append(name)
+    return orphans
+
+
+def _orphans_in(files, cutoff: float) -> list:
+    orphans = set(unreferenced(media.name for media in files))
+    return [media for media in files if media.name in orphans and media.mtime < cutoff]
+
+
+def find_orphans(*, min_age: float = DEFAULT_MIN_AGE, batch_size: int = BATCH_SIZE, report=None):
+    """Yield the ``MediaFile`` of every unreferenced photo file, batch by batch.
+
+    A directory is never split across batches, so renditions are always
+    checked together with their source.
+    """
+    root = upload_root()
+    location = photo_storage().path(root)
+    cutoff = time.time() - min_age
+    batch = []
+    for files in scan_directories(location, root):
+        if report is not None:
+            report.scanned += len(files)
+        batch.extend(files)
+        if len(batch) >= batch_size:
+            yield from _orphans_in(batch, cutoff)
+            batch = []
+    if batch:
+        yield from _orphans_in(batch, cutoff)
+
+
+def collect_orphans(
+    *,
+    dry_run: bool = False,
+    workers: int = 4,
+    rate: float = 0,
+    min_age: float = DEFAULT_MIN_AGE,
+    on_orphan=None,
+) -> CollectionReport:
+    """Delete (or, with ``dry_run``, only count) every orphaned photo file.
+
+    ``workers`` threads unlink files in parallel, together at most ``rate``
+    per second when it is set, so a large clean-up does not saturate the disk.
+    """
+    report = CollectionReport()
+    started = time.monotonic()
+    limiter = RateLimiter(rate)
+    lock = threading.Lock()
+    workers = max(1, workers)
+    # Bounds the queued deletions so the scan does not run far ahead of them.
+    slots = threading.BoundedSemaphore(workers * 4)
+
+    def delete(media):
+        try:
+            limiter.wait()
+            os.remove(media.path)
+        except FileNotFoundError:
+            return
+        except OSError as exc:
+            with lock:
+                report.errors.append((media.name, str(exc)))
+            return
+        finally:
+            slots.release()
+        with lock:
+            report.deleted += 1
+            report.reclaimed += media.size
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for media in find_orphans(min_age=min_age, report=report):
+            report.orphans += 1
+            if on_orphan is not None:
+                on_orphan(media)
+            if dry_run:
+                report.reclaimed += media.size
+            else:
+                slots.acquire()
+                executor.submit(delete, media)
+    report.seconds = time.monotonic() - started
+    return report
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:26
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0002_car_price'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(models.OrderBy(models.F('created_at'), descending=True), condition=models.Q(('is_active', True)), name='car_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(django.db.models.functions.text.Lower('brand'), models.OrderBy(models.F('created_at'), descending=True), condition=models.Q(('is_active', True)), name='car_active_brand_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['brand'], name='car_active_brand_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['year'], name='car_active_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['kilometers'], name='car_active_km_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carphoto',
+            index=models.Index(fields=['car', 'position'], name='carphoto_car_position_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0003_car_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carphoto',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
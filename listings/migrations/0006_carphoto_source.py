@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carphoto',
+            name='source_etag',
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='carphoto',
+            name='source_last_modified',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='carphoto',
+            name='source_url',
+            field=models.URLField(blank=True, editable=False, max_length=500),
+        ),
+    ]
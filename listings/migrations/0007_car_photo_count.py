@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:47
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_photos(apps, schema_editor):
+    Car = apps.get_model("listings", "Car")
+    CarPhoto = apps.get_model("listings", "CarPhoto")
+    photos = (
+        CarPhoto.objects.filter(car=OuterRef("pk"))
+        .order_by()
+        .values("car")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    Car.objects.update(photo_count=Coalesce(Subquery(photos), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0006_carphoto_source'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='photo_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_photos, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='car',
+            constraint=models.CheckConstraint(condition=models.Q(('photo_count__lte', 10)), name='car_photo_count_max'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0007_car_photo_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckoutSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount_cents', models.PositiveIntegerField()),
+                ('stripe_session_id', models.CharField(max_length=255, unique=True)),
+                ('idempotency_key', models.CharField(max_length=255)),
+                ('url', models.URLField(blank=True, max_length=1000)),
+                ('status', models.CharField(choices=[('open', 'Abierta'), ('complete', 'Pagada'), ('expired', 'Caducada')], default='open', max_length=10)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('car', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkout_sessions', to='listings.car')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkout_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'sesión de pago',
+                'verbose_name_plural': 'sesiones de pago',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'car', 'amount_cents', 'status'], name='checkout_reuse_idx')],
+            },
+        ),
+    ]
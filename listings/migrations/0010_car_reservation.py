@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0009_payment_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='reserved_by',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reservations', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='reserved_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(condition=models.Q(('reserved_until__isnull', False)), fields=['reserved_until'], name='car_reserved_until_idx'),
+        ),
+    ]
@@ -4,9 +4,14 @@ from decimal import Decimal
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+# Photos per listing; enforced by the car_photo_count_max constraint too.
+MAX_PHOTOS = 10
+
 
 class User(AbstractUser):
     """Custom user that captures the role hierarchy required by the platform."""
@@ -28,10 +33,25 @@ class User(AbstractUser):
         return self.role == self.Roles.COMMERCIAL
 
 
+class CarQuerySet(models.QuerySet):
+    def with_photos(self):
+        """Prefetch position-ordered photos; ``photo_count`` gives their number."""
+        return self.prefetch_related(
+            models.Prefetch(
+                "photos",
+                queryset=CarPhoto.objects.only(
+                    "id", "car", "image", "position", "renditions"
+                ),
+            )
+        )
+
+
 class Car(models.Model):
     """Car listing entity published by administrators."""
 
-    MAX_PHOTOS = 10
+    MAX_PHOTOS = MAX_PHOTOS
+    MAX_PHOTOS_MESSAGE = _("Cada anuncio puede tener un máximo de 10 fotografías.")
+    CONCURRENT_FIELDS = {"photo_count", "sold_at", "reserved_by", "reserved_until"}
 
     license_plate_validator = RegexValidator(
         regex=r"^[A-Z0-9-]{4,10}$",
@@ -60,6 +80,22 @@ class Car(models.Model):
     )
     description = models.TextField(blank=True)
     is_active = models.BooleanField(default=True)
+    # Set, together with is_active=False, when a payment for the car succeeds.
+    sold_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Checkout hold taken with a conditional UPDATE by listings.reservations;
+    # a hold whose reserved_until has passed is free to take.
+    reserved_by = models.ForeignKey(
+        "User",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="reservations",
+        editable=False,
+    )
+    reserved_until = models.DateTimeField(null=True, blank=True, editable=False)
+    # Maintained by CarPhoto.save and the photo post_delete signal; the
+    # constraint makes the database reject a photo over the cap.
+    photo_count = models.PositiveSmallIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(
@@ -70,10 +106,53 @@ class Car(models.Model):
         related_name="cars_created",
     )
 
+    objects = CarQuerySet.as_manager()
+
     class Meta:
         ordering = ["-created_at"]
         verbose_name = _("anuncio")
         verbose_name_plural = _("anuncios")
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(photo_count__lte=MAX_PHOTOS),
+                name="car_photo_count_max",
+            ),
+        ]
+        # Partial indexes matching the filter combinations of CarListView, which
+        # always restricts to active listings and orders by newest first.
+        indexes = [
+            models.Index(
+                models.F("created_at").desc(),
+                name="car_active_created_idx",
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                Lower("brand"),
+                models.F("created_at").desc(),
+                name="car_active_brand_lower_idx",
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=["brand"],
+                name="car_active_brand_idx",
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=["year"],
+                name="car_active_year_idx",
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=["kilometers"],
+                name="car_active_km_idx",
+                condition=models.Q(is_active=True),
+            ),
+            models.Index(
+                fields=["reserved_until"],
+                name="car_reserved_until_idx",
+                condition=models.Q(reserved_until__isnull=False),
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.brand} {self.model_name} - {self.license_plate}"
@@ -89,12 +168,32 @@ class Car(models.Model):
 
     @property
     def cover_photo(self):
+        """First photo by position, served from the prefetch cache if loaded."""
+        prefetched = getattr(self, "_prefetched_objects_cache", {}).get("photos")
+        if prefetched is not None:
+            return next(iter(prefetched), None)
         return self.photos.first()
 
-    def save(self, *args, **kwargs):
+    def save(self, *args, validate=True, **kwargs):
+        """Save after ``full_clean()``.
+
+        Pass ``validate=False`` only when the row was already validated, e.g.
+        by a ModelForm or ``listings.validation.validate_cars``.
+        """
         if self.license_plate:
             self.license_plate = self.license_plate.upper()
-        self.full_clean()
+        if validate:
+            # The database enforces the photo_count constraint; checking it
+            # here would build and run a query on every save.
+            self.full_clean(validate_constraints=False)
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            # Never write back stale copies of the columns maintained by
+            # conditional updates (photo uploads, checkouts, payments).
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.CONCURRENT_FIELDS
+            ]
         super().save(*args, **kwargs)
 
 
@@ -109,31 +208,165 @@ class CarPhoto(models.Model):
     image = models.ImageField(upload_to="cars/%Y/%m/%d")
     position = models.PositiveSmallIntegerField(default=0)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
+    # Where the image was downloaded from, plus the validators needed to ask
+    # the origin whether it changed since (conditional GET).
+    source_url = models.URLField(max_length=500, blank=True, editable=False)
+    source_etag = models.CharField(max_length=200, blank=True, editable=False)
+    source_last_modified = models.CharField(max_length=64, blank=True, editable=False)
 
     class Meta:
         ordering = ["position", "id"]
+        indexes = [
+            models.Index(fields=["car", "position"], name="carphoto_car_position_idx"),
+        ]
         verbose_name = _("foto")
         verbose_name_plural = _("fotos")
 
     def __str__(self) -> str:
         return f"Foto {self.position} de {self.car}"
 
+    def srcset(self, fmt: str) -> str:
+        """``srcset`` value for the stored renditions in ``fmt``."""
+        if self.renditions.get("source") != self.image.name:
+            return ""
+        widths = self.renditions.get("formats", {}).get(fmt, {})
+        storage = self.image.storage
+        return ", ".join(
+            f"{storage.url(name)} {width}w"
+            for width, name in sorted(widths.items(), key=lambda item: int(item[0]))
+        )
+
     def clean(self) -> None:
-        """Hard cap of MAX_PHOTOS per listing."""
+        """Hard cap of MAX_PHOTOS per listing.
+
+        This is an early, friendly check; ``save`` is what enforces the cap.
+        """
         super().clean()
-        if not self.car_id:
+        if not self.car_id or not self._state.adding:
             return
+        if self.car.photo_count >= Car.MAX_PHOTOS:
+            raise ValidationError(Car.MAX_PHOTOS_MESSAGE)
 
-        existing = (
-            CarPhoto.objects.filter(car_id=self.car_id)
-            .exclude(pk=self.pk)
-            .count()
-        )
-        if existing >= Car.MAX_PHOTOS:
-            raise ValidationError(
-                _("Cada anuncio puede tener un máximo de 10 fotografías.")
-            )
+    def save(self, *args, validate=True, **kwargs):
+        """Save after ``full_clean()``; see ``Car.save`` for ``validate``.
 
-    def save(self, *args, **kwargs):
-        self.full_clean()
-        super().save(*args, **kwargs)
+        A new photo first claims a slot with a conditional ``UPDATE`` of
+        ``Car.photo_count``, so concurrent uploads cannot exceed the cap. Either
+        way the car's ``updated_at`` is bumped, as the API derives its
+        validators from it.
+        """
+        if validate:
+            self.full_clean()
+        if not self._state.adding:
+            with transaction.atomic(using=kwargs.get("using")):
+                super().save(*args, **kwargs)
+                # Photos are part of the listing: its Last-Modified must move.
+                Car.objects.filter(pk=self.car_id).update(updated_at=timezone.now())
+            return
+        with transaction.atomic(using=kwargs.get("using")):
+            claimed = Car.objects.filter(
+                pk=self.car_id, photo_count__lt=Car.MAX_PHOTOS
+            ).update(photo_count=models.F("photo_count") + 1, updated_at=timezone.now())
+            if not claimed:
+                raise ValidationError(Car.MAX_PHOTOS_MESSAGE)
+            super().save(*args, **kwargs)
+        if CarPhoto.car.is_cached(self):
+            self.car.photo_count += 1
+
+
+class Task(models.Model):
+    """Unit of background work stored in the database and run by ``run_tasks``."""
+
+    class Status(models.TextChoices):
+        PENDING = "pending", _("Pendiente")
+        RUNNING = "running", _("En curso")
+        DONE = "done", _("Completada")
+        FAILED = "failed", _("Fallida")
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["run_after", "id"]
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="task_status_run_after_idx"),
+        ]
+        verbose_name = _("tarea")
+        verbose_name_plural = _("tareas")
+
+    def __str__(self) -> str:
+        return f"{self.name} #{self.pk} ({self.get_status_display()})"
+
+
+class CheckoutSession(models.Model):
+    """Stripe Checkout Session created for a buyer, kept so it can be reused."""
+
+    class Status(models.TextChoices):
+        OPEN = "open", _("Abierta")
+        COMPLETE = "complete", _("Pagada")
+        EXPIRED = "expired", _("Caducada")
+
+    user = models.ForeignKey(User, related_name="checkout_sessions", on_delete=models.CASCADE)
+    car = models.ForeignKey(Car, related_name="checkout_sessions", on_delete=models.CASCADE)
+    amount_cents = models.PositiveIntegerField()
+    stripe_session_id = models.CharField(max_length=255, unique=True)
+    idempotency_key = models.CharField(max_length=255)
+    url = models.URLField(max_length=1000, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.OPEN)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["user", "car", "amount_cents", "status"],
+                name="checkout_reuse_idx",
+            ),
+        ]
+        verbose_name = _("sesión de pago")
+        verbose_name_plural = _("sesiones de pago")
+
+    def __str__(self) -> str:
+        return f"{self.stripe_session_id} ({self.get_status_display()})"
+
+
+class PaymentEvent(models.Model):
+    """Raw payment provider webhook event, stored as received.
+
+    Rows are only ever inserted by the webhook and stamped with
+    ``processed_at`` by ``listings.payments.process_payment_events``.
+    """
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(processed_at__isnull=True),
+                name="paymentevent_pending_idx",
+            ),
+        ]
+        verbose_name = _("evento de pago")
+        verbose_name_plural = _("eventos de pago")
+
+    def __str__(self) -> str:
+        return f"{self.type} {self.event_id}"
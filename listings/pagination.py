@@ -0,0 +1,184 @@
+"""Paginators for the public catalogue.
+
+``CachedCountPaginator`` is Django's offset paginator with the ``COUNT(*)``
+cached per filter combination. ``KeysetPaginator`` seeks on
+``(created_at, id)`` with opaque cursor tokens instead of ``OFFSET``, so deep
+pages cost the same as the first one.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .cache import get_or_compute
+
+DEFAULT_COUNT_TIMEOUT = 5 * 60
+
+FORWARD = "n"
+BACKWARD = "p"
+
+
+def encode_cursor(created_at: datetime, pk: int, direction: str = FORWARD) -> str:
+    payload = json.dumps([created_at.isoformat(), pk, direction], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str | None):
+    """Return ``(created_at, pk, direction)`` or ``None`` for a bad token."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        created_at, pk, direction = json.loads(base64.urlsafe_b64decode(padded))
+        created_at = datetime.fromisoformat(created_at)
+        pk = int(pk)
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        return None
+    if direction not in (FORWARD, BACKWARD) or created_at.tzinfo is None:
+        return None
+    return created_at, pk, direction
+
+
+def cached_count(queryset, key: str | None) -> int:
+    if key is None:
+        return queryset.count()
+    timeout = getattr(settings, "LISTINGS_COUNT_TIMEOUT", DEFAULT_COUNT_TIMEOUT)
+    return get_or_compute(key, queryset.count, timeout)
+
+
+class CachedCountPaginator(Paginator):
+    def __init__(self, object_list, per_page, *args, count_key=None, **kwargs):
+        super().__init__(object_list, per_page, *args, **kwargs)
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        return cached_count(self.object_list, self.count_key)
+
+
+def row_position(row) -> tuple:
+    """``(created_at, pk)`` of a model instance or a ``values()`` dict."""
+    if isinstance(row, dict):
+        return row["created_at"], row["id"]
+    return row.created_at, row.pk
+
+
+class KeysetPage:
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, *, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f"<KeysetPage of {len(self.object_list)} items>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return ""
+        return encode_cursor(*row_position(self.object_list[-1]), FORWARD)
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return ""
+        return encode_cursor(*row_position(self.object_list[0]), BACKWARD)
+
+
+class KeysetPaginator:
+    """Newest-first pagination seeking on ``(created_at, id)``."""
+
+    def __init__(self, queryset, per_page, *, count_key=None, stale_to_first=True):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.count_key = count_key
+        # Without it a stale cursor gives an empty page with no links, so
+        # API clients following ``next`` stop instead of starting over.
+        self.stale_to_first = stale_to_first
+
+    @cached_property
+    def count(self):
+        return cached_count(self.queryset, self.count_key)
+
+    def first_page(self) -> KeysetPage:
+        rows = list(self.queryset.order_by("-created_at", "-id")[: self.per_page + 1])
+        return KeysetPage(
+            rows[: self.per_page],
+            self,
+            has_next=len(rows) > self.per_page,
+            has_previous=False,
+        )
+
+    def stale_page(self) -> KeysetPage:
+        if self.stale_to_first:
+            return self.first_page()
+        return KeysetPage([], self, has_next=False, has_previous=False)
+
+    def page(self, token: str | None) -> KeysetPage:
+        """The page after (or before) ``token``.
+
+        A cursor that no longer leads anywhere (its neighbours were deleted
+        or withdrawn, or it was made up) gives the first page, or an empty
+        page without ``stale_to_first``.
+        """
+        cursor = decode_cursor(token)
+        if cursor is None:
+            return self.first_page()
+
+        created_at, pk, direction = cursor
+        if direction == FORWARD:
+            rows = list(
+                self.queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk),
+                    created_at__lte=created_at,
+                ).order_by("-created_at", "-id")[: self.per_page + 1]
+            )
+            if not rows:
+                return self.stale_page()
+            return KeysetPage(
+                rows[: self.per_page],
+                self,
+                has_next=len(rows) > self.per_page,
+                has_previous=True,
+            )
+
+        rows = list(
+            self.queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk),
+                created_at__gte=created_at,
+            ).order_by("created_at", "id")[: self.per_page + 1]
+        )
+        if not rows:
+            return self.stale_page()
+        page_rows = rows[: self.per_page]
+        page_rows.reverse()
+        return KeysetPage(
+            page_rows,
+            self,
+            has_next=True,
+            has_previous=len(rows) > self.per_page,
+        )
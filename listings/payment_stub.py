@@ -0,0 +1,115 @@
+"""Local stand-in for the Stripe API, used by the tests and the checkout benchmark.
+
+Point ``STRIPE_API_BASE`` at ``StubPaymentServer.url``. Only Checkout Session
+creation is implemented, including idempotent replays; every request is
+recorded so callers can assert on what the app sent.
+"""
+
+import hashlib
+import hmac
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+
+def sign_webhook(payload: str, secret: str, timestamp: int | None = None) -> str:
+    """``Stripe-Signature`` header for ``payload``, as the provider computes it."""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    digest = hmac.new(
+        secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256
+    ).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open many connections at once.
+    request_queue_size = 256
+
+
+class StubPaymentServer:
+    def __init__(self, *, delay: float = 0.0):
+        self.delay = delay
+        self.error = None  # (status, message) to fail every request with
+        self.requests = []  # (path, headers, form fields)
+        # Idempotency-Key -> (form, status, body), as the real API replays them
+        self.replies = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), self._handler())
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def create_session(self, form: dict) -> tuple[int, dict]:
+        if self.error:
+            status, message = self.error
+            return status, {"error": {"type": "invalid_request_error", "message": message}}
+        session_id = f"cs_test_{next(self._ids)}"
+        return 200, {
+            "id": session_id,
+            "object": "checkout.session",
+            "status": "open",
+            "url": f"https://checkout.stripe.com/c/pay/{session_id}",
+            "expires_at": int(form.get("expires_at") or time.time() + 24 * 3600),
+            "amount_total": int(form.get("line_items[0][price_data][unit_amount]", 0)),
+            "metadata": {
+                key[len("metadata[") : -1]: value
+                for key, value in form.items()
+                if key.startswith("metadata[")
+            },
+        }
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                form = dict(parse_qsl(self.rfile.read(length).decode()))
+                with stub._lock:
+                    stub.requests.append((self.path, dict(self.headers), form))
+                if stub.delay:
+                    time.sleep(stub.delay)
+                key = self.headers.get("Idempotency-Key")
+                if self.path == "/v1/checkout/sessions":
+                    with stub._lock:
+                        if key not in stub.replies:
+                            stub.replies[key] = (form, *stub.create_session(form))
+                        sent, status, body = stub.replies[key]
+                        if sent != form:
+                            status, body = 400, {
+                                "error": {
+                                    "type": "idempotency_error",
+                                    "message": "Keys for idempotent requests can only be "
+                                    "used with the same parameters they were first used with.",
+                                }
+                            }
+                else:
+                    status, body = 404, {"error": {"message": "No such endpoint"}}
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
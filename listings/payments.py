@@ -0,0 +1,147 @@
+"""Payment provider webhooks.
+
+The webhook view only verifies the signature and appends the raw event to
+``PaymentEvent`` (duplicates, which providers do send, are dropped by the
+unique ``event_id``). ``process_payment_events`` applies them later, in
+batches, from the task queue: a burst of events becomes a few set-based
+updates and a single cache invalidation per batch.
+"""
+
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+import stripe
+
+from .cache import bump_catalogue_version
+from .checkout import session_cache_key
+from .models import Car, CheckoutSession, PaymentEvent, Task
+from .queue import enqueue
+
+PROCESS_TASK = "process_payment_events"
+BATCH_SIZE = 500
+# Processing waits this long so events arriving together share a batch.
+COALESCE_DELAY = 1  # seconds
+# Maximum age of a signed webhook, against replays.
+SIGNATURE_TOLERANCE = 300  # seconds
+
+SESSION_COMPLETED = "checkout.session.completed"
+SESSION_ASYNC_SUCCEEDED = "checkout.session.async_payment_succeeded"
+SESSION_EXPIRED = "checkout.session.expired"
+
+
+class InvalidEvent(Exception):
+    pass
+
+
+def parse_event(payload: bytes, signature: str) -> PaymentEvent:
+    """Verify ``payload`` against the ``Stripe-Signature`` header; unsaved event."""
+    try:
+        text = payload.decode()
+        stripe.WebhookSignature.verify_header(
+            text, signature, settings.STRIPE_WEBHOOK_SECRET, SIGNATURE_TOLERANCE
+        )
+        data = json.loads(text)
+        return PaymentEvent(event_id=data["id"], type=data["type"], payload=data)
+    except (
+        UnicodeDecodeError,
+        ValueError,
+        KeyError,
+        TypeError,
+        stripe.SignatureVerificationError,
+    ) as exc:
+        raise InvalidEvent(str(exc)) from exc
+
+
+def schedule_processing() -> None:
+    """Queue a processing run unless one is already waiting to start."""
+    if not Task.objects.filter(name=PROCESS_TASK, status=Task.Status.PENDING).exists():
+        enqueue(PROCESS_TASK, delay=COALESCE_DELAY)
+
+
+def record_event(event: PaymentEvent) -> None:
+    with transaction.atomic():
+        PaymentEvent.objects.bulk_create([event], ignore_conflicts=True)
+        schedule_processing()
+
+
+def _session(event: PaymentEvent) -> dict:
+    return event.payload.get("data", {}).get("object", {})
+
+
+def apply_events(events) -> int:
+    """Apply a batch of events; returns the number of cars marked sold."""
+    paid, expired = set(), set()
+    metadata_cars = {}
+    for event in events:
+        session = _session(event)
+        if event.type in (SESSION_COMPLETED, SESSION_ASYNC_SUCCEEDED):
+            # Delayed payment methods complete first and succeed later.
+            if session.get("payment_status") in ("paid", "no_payment_required"):
+                paid.add(session.get("id"))
+                metadata_cars[session.get("id")] = session.get("metadata", {}).get("car_id")
+        elif event.type == SESSION_EXPIRED:
+            expired.add(session.get("id"))
+    expired -= paid
+    if not paid and not expired:
+        return 0
+
+    now = timezone.now()
+    sessions = list(
+        CheckoutSession.objects.filter(stripe_session_id__in=paid | expired).values_list(
+            "stripe_session_id", "user_id", "car_id", "amount_cents"
+        )
+    )
+    cars = {session_id: car_id for session_id, _, car_id, _ in sessions}
+    sold_ids = set()
+    for session_id in paid:
+        car_id = cars.get(session_id) or metadata_cars.get(session_id)
+        if car_id is not None and str(car_id).isdigit():
+            sold_ids.add(int(car_id))
+
+    CheckoutSession.objects.filter(stripe_session_id__in=paid).update(
+        status=CheckoutSession.Status.COMPLETE, updated_at=now
+    )
+    CheckoutSession.objects.filter(
+        stripe_session_id__in=expired, status=CheckoutSession.Status.OPEN
+    ).update(status=CheckoutSession.Status.EXPIRED, updated_at=now)
+    sold = Car.objects.filter(pk__in=sold_ids, sold_at__isnull=True).update(
+        is_active=False, sold_at=now, updated_at=now, reserved_by=None, reserved_until=None
+    )
+    # An abandoned checkout frees the car for other buyers straight away.
+    lapsed = Q()
+    for session_id, user_id, car_id, _ in sessions:
+        if session_id in expired:
+            lapsed |= Q(pk=car_id, reserved_by=user_id)
+    if lapsed:
+        Car.objects.filter(lapsed).update(reserved_by=None, reserved_until=None)
+    cache.delete_many(
+        [session_cache_key(user_id, car_id, amount) for _, user_id, car_id, amount in sessions]
+    )
+    return sold
+
+
+def process_payment_events(batch_size: int = BATCH_SIZE) -> int:
+    """Apply every unprocessed event, ``batch_size`` at a time; returns the count.
+
+    Applying an event is idempotent, so a batch that is retried after a
+    crash, or processed twice by concurrent workers, does no harm.
+    """
+    processed = 0
+    while True:
+        with transaction.atomic():
+            events = list(PaymentEvent.objects.filter(processed_at__isnull=True)[:batch_size])
+            if not events:
+                return processed
+            sold = apply_events(events)
+            PaymentEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+                processed_at=timezone.now()
+            )
+        if sold:
+            # update() skips the signals that invalidate the cached catalogue.
+            bump_catalogue_version()
+        processed += len(events)
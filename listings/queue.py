@@ -0,0 +1,167 @@
+"""Minimal database-backed task queue.
+
+Tasks are registered with ``@task("name")`` and enqueued with
+``enqueue("name", **payload)``; the ``run_tasks`` management command claims
+and runs them. Claiming is a conditional ``UPDATE`` on the row, so any number
+of worker threads or processes can share the table without double-running a
+task. A claimed task holds a lease; if its worker dies the lease expires and
+another worker picks it up again.
+"""
+
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+DEFAULT_LEASE = timedelta(minutes=10)
+RETRY_BASE_DELAY = 10  # seconds, doubled after every failed attempt
+CLAIM_BATCH = 20
+
+
+def task(name: str, max_attempts: int = 3):
+    """Register ``func`` as a queue task called ``name``."""
+
+    def decorator(func):
+        func.task_name = name
+        func.max_attempts = max_attempts
+        TASKS[name] = func
+        return func
+
+    return decorator
+
+
+def enqueue(name: str, *, delay: float = 0, **payload) -> Task | None:
+    """Queue ``name`` with JSON-serializable keyword arguments.
+
+    With ``LISTINGS_TASKS_EAGER`` the task runs in-process once the current
+    transaction commits instead of being stored, which keeps tests and
+    single-process setups simple.
+    """
+    func = TASKS[name]
+    if getattr(settings, "LISTINGS_TASKS_EAGER", False):
+        transaction.on_commit(lambda: func(**payload))
+        return None
+    return Task.objects.create(
+        name=name,
+        payload=payload,
+        max_attempts=func.max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def claim_task(lease: timedelta = DEFAULT_LEASE) -> Task | None:
+    """Atomically take the next runnable task, or return None.
+
+    A task whose lease expired on its last attempt is marked failed instead:
+    one that kills or hangs its worker would otherwise be retried forever.
+    """
+    now = timezone.now()
+    expired = Q(status=Task.Status.RUNNING, locked_until__lt=now)
+    Task.objects.filter(expired, attempts__gte=F("max_attempts")).update(
+        status=Task.Status.FAILED,
+        locked_until=None,
+        last_error="El worker no terminó la tarea antes de que caducara su lease.",
+        finished_at=now,
+    )
+    runnable = Q(status=Task.Status.PENDING, run_after__lte=now) | (
+        expired & Q(attempts__lt=F("max_attempts"))
+    )
+    candidates = Task.objects.filter(runnable).order_by("run_after", "id")
+    for pk in candidates.values_list("pk", flat=True)[:CLAIM_BATCH]:
+        claimed = Task.objects.filter(runnable, pk=pk).update(
+            status=Task.Status.RUNNING,
+            locked_until=now + lease,
+            attempts=F("attempts") + 1,
+        )
+        if claimed:
+            return Task.objects.get(pk=pk)
+    return None
+
+
+def run_task(task_obj: Task) -> bool:
+    """Execute a claimed task and record the outcome; True on success."""
+    func = TASKS.get(task_obj.name)
+    try:
+        if func is None:
+            raise LookupError(f"Tarea desconocida: {task_obj.name}")
+        func(**task_obj.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("La tarea %s falló (intento %s)", task_obj, task_obj.attempts)
+        if task_obj.attempts < task_obj.max_attempts:
+            delay = RETRY_BASE_DELAY * 2 ** (task_obj.attempts - 1)
+            Task.objects.filter(pk=task_obj.pk).update(
+                status=Task.Status.PENDING,
+                run_after=timezone.now() + timedelta(seconds=delay),
+                locked_until=None,
+                last_error=error,
+            )
+        else:
+            Task.objects.filter(pk=task_obj.pk).update(
+                status=Task.Status.FAILED,
+                locked_until=None,
+                last_error=error,
+                finished_at=timezone.now(),
+            )
+        return False
+
+    Task.objects.filter(pk=task_obj.pk).update(
+        status=Task.Status.DONE,
+        locked_until=None,
+        finished_at=timezone.now(),
+    )
+    return True
+
+
+def work(stop: threading.Event, *, once: bool = False, poll_interval: float = 1.0) -> int:
+    """Claim and run tasks until ``stop`` is set (or the queue is empty if ``once``)."""
+    processed = 0
+    while not stop.is_set():
+        task_obj = claim_task()
+        if task_obj is None:
+            if once:
+                break
+            stop.wait(poll_interval)
+            continue
+        run_task(task_obj)
+        processed += 1
+    return processed
+
+
+def run_worker(
+    concurrency: int = 1,
+    *,
+    once: bool = False,
+    poll_interval: float = 1.0,
+    stop: threading.Event | None = None,
+) -> int:
+    """Run ``concurrency`` worker loops and return the number of tasks run."""
+    stop = stop or threading.Event()
+    if concurrency <= 1:
+        return work(stop, once=once, poll_interval=poll_interval)
+
+    def loop():
+        try:
+            return work(stop, once=once, poll_interval=poll_interval)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="tasks") as pool:
+        futures = [pool.submit(loop) for _ in range(concurrency)]
+        try:
+            return sum(future.result() for future in futures)
+        except KeyboardInterrupt:
+            stop.set()  # let the loops finish their current task
+            raise
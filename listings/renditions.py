@@ -0,0 +1,112 @@
+"""Responsive renditions (resized AVIF/WebP/JPEG copies) of car photos.
+
+Renditions are written next to the original upload as
+``<stem>__<width>w.<ext>`` and recorded in ``CarPhoto.renditions`` so templates
+can build ``srcset`` attributes without touching the storage.
+"""
+
+import re
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from PIL import Image, ImageOps, features
+
+from .cache import bump_catalogue_version
+from .models import CarPhoto
+
+DEFAULT_WIDTHS = (320, 640, 1024)
+DEFAULT_FORMATS = ("avif", "webp", "jpeg")
+
+FORMAT_OPTIONS = {
+    "avif": {"extension": "avif", "mime": "image/avif", "save": {"quality": 55}},
+    "webp": {"extension": "webp", "mime": "image/webp", "save": {"quality": 78, "method": 4}},
+    "jpeg": {
+        "extension": "jpg",
+        "mime": "image/jpeg",
+        "save": {"quality": 82, "optimize": True, "progressive": True},
+    },
+}
+
+RENDITION_NAME_RE = re.compile(r"^(?P<stem>.+)__(?P<width>\d+)w\.(?P<ext>avif|webp|jpg)$")
+
+
+def rendition_widths():
+    return tuple(sorted(getattr(settings, "LISTINGS_RENDITION_WIDTHS", DEFAULT_WIDTHS)))
+
+
+def rendition_formats():
+    """Configured formats that this Pillow build can actually encode."""
+    formats = getattr(settings, "LISTINGS_RENDITION_FORMATS", DEFAULT_FORMATS)
+    return tuple(fmt for fmt in formats if fmt == "jpeg" or features.check(fmt))
+
+
+def rendition_name(image_name: str, width: int, fmt: str) -> str:
+    path = PurePosixPath(image_name)
+    extension = FORMAT_OPTIONS[fmt]["extension"]
+    return str(path.with_name(f"{path.stem}__{width}w.{extension}"))
+
+
+def rendition_files(manifest: dict) -> list:
+    """Storage names of every rendition recorded in ``manifest``."""
+    return [
+        name for widths in manifest.get("formats", {}).values() for name in widths.values()
+    ]
+
+
+def needs_renditions(photo: CarPhoto) -> bool:
+    return bool(photo.image) and photo.renditions.get("source") != photo.image.name
+
+
+def generate_renditions(photo: CarPhoto) -> dict:
+    """Write every width/format rendition of ``photo`` and return the manifest.
+
+    Widths larger than the original are skipped (no upscaling); an image
+    narrower than every configured width gets a single rendition at its own
+    width so it still has modern-format copies.
+    """
+    storage = photo.image.storage
+    with photo.image.open("rb") as source:
+        with Image.open(source) as original:
+            original = ImageOps.exif_transpose(original)
+            original = original.convert("RGB")
+
+    widths = [width for width in rendition_widths() if width <= original.width]
+    if not widths:
+        widths = [original.width]
+
+    manifest = {"source": photo.image.name, "formats": {}}
+    for width in widths:
+        height = max(1, round(original.height * width / original.width))
+        resized = original.resize((width, height), Image.Resampling.LANCZOS)
+        for fmt in rendition_formats():
+            buffer = BytesIO()
+            resized.save(buffer, format=fmt.upper(), **FORMAT_OPTIONS[fmt]["save"])
+            name = rendition_name(photo.image.name, width, fmt)
+            if storage.exists(name):
+                storage.delete(name)
+            saved = storage.save(name, ContentFile(buffer.getvalue()))
+            manifest["formats"].setdefault(fmt, {})[str(width)] = saved
+    return manifest
+
+
+def build_renditions(photo_id: int, force: bool = False) -> bool:
+    """Generate and store renditions for one photo; False if nothing to do."""
+    photo = CarPhoto.objects.filter(pk=photo_id).first()
+    if photo is None or not (force or needs_renditions(photo)):
+        return False
+    manifest = generate_renditions(photo)
+    # update() skips CarPhoto.save validation and signals; only the cached
+    # catalogue pages need to learn about the new srcset.
+    CarPhoto.objects.filter(pk=photo_id, image=photo.image.name).update(renditions=manifest)
+    bump_catalogue_version()
+    return True
+
+
+def schedule_renditions(photo: CarPhoto) -> None:
+    """Queue rendition generation so uploads are not slowed down by encoding."""
+    from .queue import enqueue
+
+    enqueue("build_renditions", photo_id=photo.pk)
@@ -0,0 +1,126 @@
+"""Read replicas for the public catalogue.
+
+Views using ``ReplicaReadMixin`` read cars and photos from one of
+``LISTINGS_READ_REPLICAS`` while they handle a GET; everything else, and
+every write, goes to ``default``. A request that writes a car or a photo
+gets a short-lived cookie from ``ReplicaPinMiddleware`` that keeps that
+visitor on ``default`` until replication has caught up, so they always see
+their own changes. Values cached under a catalogue version are computed
+inside ``primary_reads()``: filled from a lagging replica, they would outlive
+the lag by the whole cache timeout.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.decorators import sync_and_async_middleware
+
+from asgiref.sync import iscoroutinefunction
+
+PIN_COOKIE = "replica_pin"
+DEFAULT_PIN_SECONDS = 10
+REPLICATED_MODELS = {"listings.car", "listings.carphoto"}
+
+_use_replicas = ContextVar("listings_use_replicas", default=False)
+# Labels of the replicated models written during the current request.
+_writes = ContextVar("listings_replicated_writes", default=None)
+
+
+def replica_aliases() -> list:
+    return list(getattr(settings, "LISTINGS_READ_REPLICAS", ()))
+
+
+@contextmanager
+def _routing(use_replicas: bool):
+    token = _use_replicas.set(use_replicas)
+    try:
+        yield
+    finally:
+        _use_replicas.reset(token)
+
+
+def replica_reads():
+    return _routing(True)
+
+
+def primary_reads():
+    """Read from ``default`` even inside ``replica_reads()``."""
+    return _routing(False)
+
+
+class ReplicaRouter:
+    """Catalogue reads inside ``replica_reads()`` go to a random replica."""
+
+    def db_for_read(self, model, **hints):
+        if _use_replicas.get() and model._meta.label_lower in REPLICATED_MODELS:
+            replicas = replica_aliases()
+            if replicas:
+                return random.choice(replicas)
+        return None
+
+    def db_for_write(self, model, **hints):
+        writes = _writes.get()
+        if writes is not None and model._meta.label_lower in REPLICATED_MODELS:
+            writes.add(model._meta.label_lower)
+        # Explicit, or instances read from a replica would be saved there.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class ReplicaReadMixin:
+    """Serve the view's GET requests from a replica, unless the visitor is pinned."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD") or PIN_COOKIE in request.COOKIES:
+            return super().dispatch(request, *args, **kwargs)
+        if self.view_is_async:
+            return self._adispatch(request, *args, **kwargs)
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
+
+    async def _adispatch(self, request, *args, **kwargs):
+        with replica_reads():
+            return await super().dispatch(request, *args, **kwargs)
+
+
+def _pin(response, writes):
+    if writes:
+        max_age = getattr(settings, "LISTINGS_REPLICA_PIN_SECONDS", DEFAULT_PIN_SECONDS)
+        response.set_cookie(PIN_COOKIE, "1", max_age=max_age, httponly=True, samesite="Lax")
+    return response
+
+
+@sync_and_async_middleware
+def ReplicaPinMiddleware(get_response):
+    """Pin visitors who just wrote a car or a photo to ``default``."""
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            writes = set()
+            token = _writes.set(writes)
+            try:
+                response = await get_response(request)
+            finally:
+                _writes.reset(token)
+            return _pin(response, writes)
+
+    else:
+
+        def middleware(request):
+            writes = set()
+            token = _writes.set(writes)
+            try:
+                response = get_response(request)
+            finally:
+                _writes.reset(token)
+            return _pin(response, writes)
+
+    return middleware
@@ -0,0 +1,82 @@
+"""Time-limited checkout holds on cars.
+
+A hold is taken with a single conditional ``UPDATE`` that only matches when
+the car is active and free (no hold, or an expired one). The database
+serializes competing updates on that row, so exactly one buyer wins without
+any lock beyond the row itself; ``select_for_update`` would add nothing on
+SQLite, which ignores it. Expired holds are simply overwritten, and the
+``release_reservations`` command clears them.
+"""
+
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Car, CheckoutSession
+
+# How long a buyer keeps a car while paying. Checkout Sessions expire with
+# the hold, and the provider only accepts sessions living 30 minutes or more,
+# so a buyer's own hold with less than MIN_HOLD_LEFT is renewed.
+RESERVATION_HOLD = timedelta(minutes=45)
+MIN_HOLD_LEFT = timedelta(minutes=31)
+
+
+def _claim(car_id: int, user_id: int, now):
+    free = (
+        Q(reserved_until__isnull=True)
+        | Q(reserved_until__lte=now)
+        | Q(reserved_by=user_id, reserved_until__lt=now + MIN_HOLD_LEFT)
+    )
+    return Car.objects.filter(free, pk=car_id, is_active=True)
+
+
+def _own_hold(car_id: int, user_id: int, now):
+    return Car.objects.filter(
+        pk=car_id, is_active=True, reserved_by=user_id, reserved_until__gt=now
+    ).values_list("reserved_until", flat=True)
+
+
+def reserve(car_id: int, user_id: int):
+    """Hold ``car_id`` for ``user_id``; the hold's expiry, or None if taken.
+
+    A hold the buyer already has is kept as is, so concurrent requests of
+    the same buyer agree on its expiry.
+    """
+    now = timezone.now()
+    until = now + RESERVATION_HOLD
+    if _claim(car_id, user_id, now).update(reserved_by=user_id, reserved_until=until):
+        return until
+    return _own_hold(car_id, user_id, now).first()
+
+
+async def areserve(car_id: int, user_id: int):
+    now = timezone.now()
+    until = now + RESERVATION_HOLD
+    if await _claim(car_id, user_id, now).aupdate(reserved_by=user_id, reserved_until=until):
+        return until
+    return await _own_hold(car_id, user_id, now).afirst()
+
+
+def release(car_id: int, user_id: int) -> bool:
+    """Give up ``user_id``'s hold on ``car_id``, if it still has it."""
+    return bool(
+        Car.objects.filter(pk=car_id, reserved_by=user_id).update(
+            reserved_by=None, reserved_until=None
+        )
+    )
+
+
+def release_expired(now=None) -> tuple[int, int]:
+    """Clear lapsed holds and expire the sessions that outlived them.
+
+    Returns ``(holds released, sessions expired)``.
+    """
+    now = now or timezone.now()
+    released = Car.objects.filter(reserved_until__lte=now).update(
+        reserved_by=None, reserved_until=None
+    )
+    expired = CheckoutSession.objects.filter(
+        status=CheckoutSession.Status.OPEN, expires_at__lte=now
+    ).update(status=CheckoutSession.Status.EXPIRED, updated_at=now)
+    return released, expired
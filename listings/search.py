@@ -0,0 +1,199 @@
+"""Pluggable full-text search used by the ``q`` parameter of the catalogue.
+
+The backend is chosen with the ``LISTINGS_SEARCH_BACKEND`` setting. The SQLite
+backend keeps an FTS5 index in sync with ``listings_car`` through triggers, so
+rows written with ``bulk_create`` or ``update`` are indexed as well.
+"""
+
+import re
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Car
+
+DEFAULT_SEARCH_BACKEND = "listings.search.SQLiteFTSSearchBackend"
+
+MAX_SEARCH_TERMS = 8
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+class IContainsSearchBackend:
+    """Portable fallback: substring match on brand, model and plate."""
+
+    def install(self, connection) -> None:
+        """Create whatever database objects the backend needs."""
+
+    @contextmanager
+    def deferred_indexing(self, connection):
+        """Batch the indexing of rows inserted inside the block, if supported."""
+        yield
+
+    def search(self, queryset, query: str, rank: bool = True):
+        """Rows of ``queryset`` matching ``query``, best first unless ``rank`` is False."""
+        return queryset.filter(
+            Q(brand__icontains=query)
+            | Q(model_name__icontains=query)
+            | Q(license_plate__icontains=query)
+        )
+
+
+class SQLiteFTSSearchBackend(IContainsSearchBackend):
+    """FTS5 index with accent-insensitive tokens and BM25 ranking.
+
+    ``remove_diacritics 2`` folds "Akrapovič" and "año" to their ASCII forms on
+    both sides of the match. Each search term is matched as a token prefix.
+    """
+
+    table = "listings_car_fts"
+    columns = ("license_plate", "brand", "model_name", "description")
+    # BM25 weights, in ``columns`` order: brand/model hits outrank descriptions.
+    weights = (8.0, 10.0, 10.0, 1.0)
+
+    def trigger_sql(self, source: str, indexed_up_to: int | None = None) -> dict:
+        """Trigger definitions; ``indexed_up_to`` restricts them to older rows.
+
+        The restricted set is used by ``deferred_indexing``: rows above that
+        id are not in the index yet, so their updates and deletes must not
+        touch it.
+        """
+        columns = ", ".join(self.columns)
+        new_values = ", ".join(f"new.{column}" for column in self.columns)
+        old_values = ", ".join(f"old.{column}" for column in self.columns)
+        # Upserts that rewrite a row with the same values (e.g. a nightly feed
+        # import) should not pay for re-indexing it.
+        changed = " OR ".join(f"old.{column} IS NOT new.{column}" for column in self.columns)
+        changed = f"({changed})"
+        deleted = ""
+        if indexed_up_to is not None:
+            changed = f"old.id <= {int(indexed_up_to)} AND {changed}"
+            deleted = f"WHEN old.id <= {int(indexed_up_to)} "
+        return {
+            "listings_car_fts_ai": (
+                f"CREATE TRIGGER listings_car_fts_ai AFTER INSERT ON {source} BEGIN "
+                f"INSERT INTO {self.table}(rowid, {columns}) VALUES (new.id, {new_values}); "
+                f"END"
+            ),
+            "listings_car_fts_ad": (
+                f"CREATE TRIGGER listings_car_fts_ad AFTER DELETE ON {source} {deleted}BEGIN "
+                f"INSERT INTO {self.table}({self.table}, rowid, {columns}) "
+                f"VALUES ('delete', old.id, {old_values}); "
+                f"END"
+            ),
+            "listings_car_fts_au": (
+                f"CREATE TRIGGER listings_car_fts_au "
+                f"AFTER UPDATE OF {columns} ON {source} WHEN {changed} BEGIN "
+                f"INSERT INTO {self.table}({self.table}, rowid, {columns}) "
+                f"VALUES ('delete', old.id, {old_values}); "
+                f"INSERT INTO {self.table}(rowid, {columns}) VALUES (new.id, {new_values}); "
+                f"END"
+            ),
+        }
+
+    def install(self, connection) -> None:
+        if connection.vendor != "sqlite":
+            return
+        source = Car._meta.db_table
+        triggers = self.trigger_sql(source)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+                [source],
+            )
+            installed = dict(cursor.fetchall())
+            if all(installed.get(name) == sql for name, sql in triggers.items()):
+                return
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                f"{', '.join(self.columns)}, content='{source}', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2')"
+            )
+            for name, sql in triggers.items():
+                if installed.get(name) != sql:
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+                    cursor.execute(sql)
+            # Triggers were missing or outdated (fresh install or a table
+            # remake), so the index may be stale.
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+
+    @contextmanager
+    def deferred_indexing(self, connection):
+        """Index the cars inserted inside the block with one statement at exit.
+
+        The per-row insert trigger costs more than the insert itself during
+        bulk imports. It is dropped for the duration (the update and delete
+        triggers are limited to already indexed rows) and the new rows, with
+        ids above the current maximum, are indexed set-based before the
+        triggers are restored. All of it runs in one transaction: SQLite DDL
+        is transactional, so other connections never see the triggers
+        missing, and a process killed halfway leaves them as they were. Keep
+        the block short (one import batch), as it holds the write lock.
+        """
+        if connection.vendor != "sqlite":
+            yield
+            return
+        source = Car._meta.db_table
+        columns = ", ".join(self.columns)
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                # Schema changes take the write lock, so no other connection
+                # can add rows above last_id until the block commits.
+                cursor.execute("DROP TRIGGER IF EXISTS listings_car_fts_ai")
+                cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {source}")
+                (last_id,) = cursor.fetchone()
+                for name, sql in self.trigger_sql(source, indexed_up_to=last_id).items():
+                    if name != "listings_car_fts_ai":
+                        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+                        cursor.execute(sql)
+            yield
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {self.table}(rowid, {columns}) "
+                    f"SELECT id, {columns} FROM {source} WHERE id > %s",
+                    [last_id],
+                )
+                for name, sql in self.trigger_sql(source).items():
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+                    cursor.execute(sql)
+
+    def match_expression(self, query: str) -> str:
+        """Turn free text into a safe FTS5 query of ANDed prefix terms."""
+        terms = TOKEN_RE.findall(query)[:MAX_SEARCH_TERMS]
+        return " ".join(f'"{term}"*' for term in terms)
+
+    def search(self, queryset, query: str, rank: bool = True):
+        connection = connections[queryset.db]
+        if connection.vendor != "sqlite":
+            return super().search(queryset, query, rank)
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+
+        matching = queryset.filter(
+            pk__in=RawSQL(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", (match,))
+        )
+        if not rank:
+            # The rank is a MATCH per row, costly when the caller sorts otherwise.
+            return matching
+        car_id = f"{connection.ops.quote_name(Car._meta.db_table)}.{connection.ops.quote_name('id')}"
+        weights = ", ".join(str(weight) for weight in self.weights)
+        return (
+            matching.annotate(
+                search_rank=RawSQL(
+                    f"SELECT bm25({self.table}, {weights}) FROM {self.table} "
+                    f"WHERE {self.table} MATCH %s AND rowid = {car_id}",
+                    (match,),
+                )
+            )
+            .order_by("search_rank", "-created_at")
+        )
+
+
+def get_search_backend():
+    path = getattr(settings, "LISTINGS_SEARCH_BACKEND", DEFAULT_SEARCH_BACKEND)
+    return import_string(path)()
@@ -0,0 +1,57 @@
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import bump_catalogue_version
+from .models import Car, CarPhoto
+from .renditions import needs_renditions, schedule_renditions
+from .search import get_search_backend
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Run the ``PRAGMAS`` of the connection's ``DATABASES`` entry."""
+    pragmas = connection.settings_dict.get("PRAGMAS")
+    if connection.vendor != "sqlite" or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+@receiver(post_migrate)
+def install_search_index(sender, using, **kwargs):
+    """(Re)create the search backend's index objects after every migrate."""
+    if sender.name != "listings":
+        return
+    get_search_backend().install(connections[using])
+
+
+@receiver(post_save, sender=Car)
+@receiver(post_delete, sender=Car)
+@receiver(post_save, sender=CarPhoto)
+@receiver(post_delete, sender=CarPhoto)
+def invalidate_catalogue_cache(sender, **kwargs):
+    bump_catalogue_version()
+    # Bump again once the write is visible, so a page rendered from the old
+    # rows while the transaction was open is not cached under the new version.
+    transaction.on_commit(bump_catalogue_version)
+
+
+@receiver(post_save, sender=CarPhoto)
+def queue_photo_renditions(sender, instance, raw=False, **kwargs):
+    if not raw and needs_renditions(instance):
+        schedule_renditions(instance)
+
+
+@receiver(post_delete, sender=CarPhoto)
+def release_photo_slot(sender, instance, **kwargs):
+    """Give back the slot claimed in ``CarPhoto.save``; also runs for queryset deletes."""
+    Car.objects.filter(pk=instance.car_id, photo_count__gt=0).update(
+        photo_count=F("photo_count") - 1, updated_at=timezone.now()
+    )
+    if CarPhoto.car.is_cached(instance):
+        instance.car.photo_count -= 1
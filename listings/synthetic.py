@@ -0,0 +1,99 @@
+"""Synthetic listings for load testing and benchmarks.
+
+Cars are generated with plausible distributions (popular brands are more
+common, mileage grows with age, prices depreciate with age and mileage) and
+are meant to be written with ``bulk_create``: they bypass ``Car.save`` and
+its per-row validation, so every value produced here is valid by construction.
+"""
+
+import random
+from decimal import Decimal
+from io import BytesIO
+
+from django.utils import timezone
+
+from PIL import Image, ImageDraw
+
+from .models import Car
+
+# brand -> (relative frequency, new price in euros, models)
+CATALOGUE_MODELS = {
+    "Seat": (14, 22_000, ["Ibiza", "Leon", "Arona", "Ateca"]),
+    "Volkswagen": (13, 28_000, ["Polo", "Golf", "T-Roc", "Tiguan", "Passat"]),
+    "Toyota": (11, 27_000, ["Yaris", "Corolla", "C-HR", "RAV4"]),
+    "Renault": (10, 20_000, ["Clio", "Megane", "Captur", "Kadjar"]),
+    "Peugeot": (9, 23_000, ["208", "308", "2008", "3008"]),
+    "Kia": (7, 24_000, ["Picanto", "Ceed", "Niro", "Sportage"]),
+    "Hyundai": (6, 23_000, ["i20", "i30", "Kona", "Tucson"]),
+    "Ford": (6, 24_000, ["Fiesta", "Focus", "Puma", "Kuga", "Mustang"]),
+    "Audi": (5, 38_000, ["A1", "A3", "A4", "Q3", "Q5"]),
+    "BMW": (5, 42_000, ["Serie 1", "Serie 3", "X1", "X3"]),
+    "Mercedes": (5, 45_000, ["Clase A", "Clase C", "GLA", "GLC"]),
+    "Dacia": (4, 15_000, ["Sandero", "Duster", "Jogger"]),
+    "Tesla": (2, 45_000, ["Model 3", "Model Y"]),
+}
+
+DESCRIPTIONS = [
+    "Mantenimiento al día en servicio oficial.",
+    "Único propietario y libro de revisiones completo.",
+    "Garantía de 12 meses incluida.",
+    "Siempre en garaje, interior impecable.",
+    "Neumáticos nuevos y ITV recién pasada.",
+    "Navegador, cámara trasera y control de crucero.",
+]
+
+IMAGE_COLORS = ["#0f172a", "#145388", "#ef4444", "#22c55e", "#f97316", "#64748b"]
+IMAGE_SIZE = (1200, 800)
+
+# Spanish plates: four digits and three consonants (no vowels, Ñ or Q).
+PLATE_LETTERS = "BCDFGHJKLMNPRSTVWXYZ"
+
+
+def synthetic_plate(index: int) -> str:
+    """Unique plate for ``index``; covers 80 million listings."""
+    number, letters_index = index % 10_000, index // 10_000
+    letters = ""
+    for _ in range(3):
+        letters_index, digit = divmod(letters_index, len(PLATE_LETTERS))
+        letters = PLATE_LETTERS[digit] + letters
+    return f"{number:04d}{letters}"
+
+
+def synthetic_car(rng: random.Random, index: int, *, current_year: int, **fields) -> Car:
+    brands = list(CATALOGUE_MODELS)
+    weights = [CATALOGUE_MODELS[brand][0] for brand in brands]
+    brand = rng.choices(brands, weights)[0]
+    _, new_price, models = CATALOGUE_MODELS[brand]
+
+    age = min(int(rng.triangular(0, 20, 3)), current_year - 1970)
+    kilometers = max(0, int(rng.gauss(15_000, 5_000) * (age + rng.random())))
+    price = new_price * 0.85**age * max(0.3, 1 - kilometers / 400_000)
+    fields.setdefault("is_active", True)
+    return Car(
+        license_plate=synthetic_plate(index),
+        brand=brand,
+        model_name=rng.choice(models),
+        kilometers=kilometers,
+        year=current_year - age,
+        price=Decimal(max(1_000, round(price / 50) * 50)),
+        description=" ".join(rng.sample(DESCRIPTIONS, 2)),
+        **fields,
+    )
+
+
+def synthetic_cars(count: int, *, start: int = 0, seed: int | None = None, **fields):
+    """Yield ``count`` unsaved cars with plates from index ``start`` onwards."""
+    rng = random.Random(seed)
+    current_year = timezone.now().year
+    for index in range(start, start + count):
+        yield synthetic_car(rng, index, current_year=current_year, **fields)
+
+
+def render_placeholder(text: str, color: str) -> bytes:
+    """JPEG placeholder photo; a plain function so process pools can run it."""
+    img = Image.new("RGB", IMAGE_SIZE, color)
+    draw = ImageDraw.Draw(img)
+    draw.text((50, 50), text, fill=(255, 255, 255))
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG", quality=80)
+    return buffer.getvalue()
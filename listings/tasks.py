@@ -0,0 +1,74 @@
+"""Background tasks run by the ``run_tasks`` worker."""
+
+from django.core.files import File
+
+from .bulk import DELETE_FILES_TASK
+from .downloader import DOWNLOADED, NOT_MODIFIED, DownloadJob, PhotoDownloader
+from .media_gc import unreferenced
+from .models import Car, CarPhoto
+from .payments import PROCESS_TASK, process_payment_events
+from .queue import task
+from .renditions import build_renditions
+
+
+@task("build_renditions")
+def build_renditions_task(photo_id: int) -> None:
+    build_renditions(photo_id)
+
+
+@task("ingest_remote_photo", max_attempts=5)
+def ingest_remote_photo(
+    car_id: int,
+    url: str,
+    position: int,
+    filename: str,
+    photo_id: int | None = None,
+    etag: str = "",
+    last_modified: str = "",
+) -> None:
+    """Download ``url`` and attach it to the car at ``position``.
+
+    With ``photo_id`` that photo is refreshed in place, and not at all if the
+    source answers 304 to its validators.
+    """
+    car = Car.objects.filter(pk=car_id).first()
+    if car is None:
+        return
+    photo = None
+    if photo_id is not None:
+        photo = CarPhoto.objects.filter(pk=photo_id, car=car).first()
+    if photo is None:
+        photo = CarPhoto(car=car, position=position)
+        etag = last_modified = ""
+    job = DownloadJob(url, etag=etag, last_modified=last_modified, key=f"{car_id}:{position}")
+    # The queue already retries with backoff, so the downloader does not.
+    result = PhotoDownloader(workers=1, retries=0).fetch(job)
+    if result.status == NOT_MODIFIED:
+        return
+    if result.status != DOWNLOADED:
+        raise RuntimeError(f"Error descargando {url}: {result.error}")
+    photo.source_url = url
+    photo.source_etag = result.etag
+    photo.source_last_modified = result.last_modified
+    try:
+        with result.path.open("rb") as handle:
+            photo.image.save(filename, File(handle), save=True)
+    finally:
+        result.discard()
+
+
+@task(DELETE_FILES_TASK)
+def delete_media_files(names: list) -> None:
+    """Remove files of deleted photos; names already gone are skipped.
+
+    Seeded cars share images and renditions, so files that a surviving photo
+    still uses are kept.
+    """
+    storage = CarPhoto._meta.get_field("image").storage
+    for name in unreferenced(names):
+        storage.delete(name)
+
+
+@task(PROCESS_TASK)
+def process_payment_events_task() -> None:
+    process_payment_events()
@@ -0,0 +1,30 @@
+from django import template
+
+from ..renditions import FORMAT_OPTIONS
+
+register = template.Library()
+
+CARD_SIZES = "(min-width: 1280px) 33vw, (min-width: 768px) 50vw, 100vw"
+
+
+@register.inclusion_tag("listings/includes/photo_picture.html")
+def photo_picture(photo, alt="", css_class="", sizes=CARD_SIZES, **attrs):
+    """Render ``photo`` as a <picture> using its AVIF/WebP/JPEG renditions.
+
+    Extra keyword arguments become attributes of the inner <img>, with
+    underscores turned into dashes (``data_carousel_item=True``).
+    """
+    sources = []
+    for fmt in ("avif", "webp"):
+        srcset = photo.srcset(fmt)
+        if srcset:
+            sources.append({"type": FORMAT_OPTIONS[fmt]["mime"], "srcset": srcset})
+    return {
+        "photo": photo,
+        "alt": alt,
+        "css_class": css_class,
+        "sizes": sizes,
+        "sources": sources,
+        "img_srcset": photo.srcset("jpeg"),
+        "attrs": [(name.replace("_", "-"), value) for name, value in attrs.items()],
+    }
@@ -1,13 +1,52 @@
+import asyncio
+import csv
+import json
+import os
 import shutil
+import sqlite3
 import tempfile
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from pathlib import Path
 from unittest.mock import patch
 
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase, override_settings
+from django.db import connection, connections, router, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
 
-from .models import Car, CarPhoto, User
+from .cache import get_or_compute
+from .benchmarks import FILTER_COMBINATIONS, list_view_queryset, uses_table_scan
+from .downloader import DOWNLOADED, FAILED, NOT_MODIFIED, DownloadJob, PhotoDownloader
+from .export import aexport_rows, export_rows
+from .facets import get_catalogue_facets
+from .importer import read_feed
+from .renditions import rendition_formats, rendition_name
+from .synthetic import CATALOGUE_MODELS
+from .validation import validate_cars, validate_photos
+from .models import Car, CarPhoto, CheckoutSession, PaymentEvent, Task, User
+from .pagination import BACKWARD, FORWARD, encode_cursor
+from .payment_stub import StubPaymentServer, sign_webhook
+from .payments import process_payment_events
+from .queue import claim_task, enqueue, run_worker, task
+from .replicas import PIN_COOKIE, ReplicaPinMiddleware, replica_reads
+from .reservations import reserve
+from .search import get_search_backend
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp()
 
@@ -16,6 +55,12 @@ def tearDownModule():
     shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
 
+def fake_jpeg(name: str, size=(1200, 800)) -> SimpleUploadedFile:
+    buffer = BytesIO()
+    Image.new("RGB", size, "#145388").save(buffer, format="JPEG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+
 def fake_image(name: str) -> SimpleUploadedFile:
     """Return a minimal valid GIF image to satisfy ImageField validation."""
     gif_bytes = (
@@ -28,6 +73,7 @@ def fake_image(name: str) -> SimpleUploadedFile:
 
 class CarListingViewTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.admin = User.objects.create_user(
             username="admin",
             password="secret",
@@ -83,6 +129,737 @@ class CarListingViewTests(TestCase):
         self.assertNotIn(older, response.context["cars"])
 
 
+class CarListIndexTests(TestCase):
+    def test_every_filter_combination_uses_an_index(self):
+        for params in FILTER_COMBINATIONS:
+            with self.subTest(params=params):
+                plan = list_view_queryset(params).explain()
+                self.assertFalse(uses_table_scan(plan), plan)
+
+    def test_brand_filter_is_case_insensitive(self):
+        car = Car.objects.create(
+            license_plate="4321CBA",
+            brand="Seat",
+            model_name="Arona",
+            kilometers=10000,
+            year=2022,
+            price=19000,
+        )
+        self.assertIn(car, list_view_queryset({"brand": "SEAT"}))
+
+
+class CarSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clio = Car.objects.create(
+            license_plate="4567HIJ",
+            brand="Renault",
+            model_name="Clio RS",
+            kilometers=38000,
+            year=2018,
+            price=16800,
+            description="Edición limitada Trophy con escape Akrapovič.",
+        )
+        self.ibiza = Car.objects.create(
+            license_plate="1234ABC",
+            brand="Seat",
+            model_name="Ibiza FR",
+            kilometers=45000,
+            year=2019,
+            price=13500,
+            description="Compacto ágil, ideal para quien busca un Renault pequeño.",
+        )
+
+    def search(self, query):
+        response = self.client.get(reverse("listings:home"), {"q": query})
+        return list(response.context["cars"])
+
+    def test_search_ignores_accents_and_case(self):
+        self.assertEqual(self.search("AKRAPOVIC"), [self.clio])
+        self.assertEqual(self.search("edicion"), [self.clio])
+
+    def test_search_matches_prefixes_of_plate_and_model(self):
+        self.assertEqual(self.search("ibi"), [self.ibiza])
+        self.assertEqual(self.search("1234"), [self.ibiza])
+
+    def test_brand_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search("renault"), [self.clio, self.ibiza])
+
+    def test_index_follows_updates_and_deletes(self):
+        Car.objects.filter(pk=self.ibiza.pk).update(model_name="Arona")
+        self.assertEqual(self.search("arona"), [self.ibiza])
+        self.assertEqual(self.search("ibiza"), [])
+        self.ibiza.delete()
+        self.assertEqual(self.search("arona"), [])
+
+    def test_punctuation_only_query_returns_nothing(self):
+        self.assertEqual(self.search('"*'), [])
+
+
+class CatalogueFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for plate, brand, year, active in [
+            ("1000AAA", "Seat", 2019, True),
+            ("2000AAA", "Seat", 2020, True),
+            ("3000AAA", "Audi", 2020, True),
+            ("4000AAA", "Kia", 2018, False),
+        ]:
+            Car.objects.create(
+                license_plate=plate,
+                brand=brand,
+                model_name="X",
+                kilometers=1000,
+                year=year,
+                price=10000,
+                is_active=active,
+            )
+
+    def test_facets_count_active_cars_in_one_query(self):
+        with self.assertNumQueries(1):
+            facets = get_catalogue_facets()
+        self.assertEqual(facets["brands"], [("Audi", 1), ("Seat", 2)])
+        self.assertEqual(facets["years"], [(2019, 1), (2020, 2)])
+
+    def test_warm_cache_skips_facet_queries(self):
+        get_catalogue_facets()
+        with self.assertNumQueries(0):
+            get_catalogue_facets()
+
+    def test_saving_or_deleting_a_car_invalidates_facets(self):
+        get_catalogue_facets()
+        Car.objects.get(license_plate="4000AAA").delete()
+        kia = Car.objects.create(
+            license_plate="5000AAA",
+            brand="Kia",
+            model_name="Ceed",
+            kilometers=1000,
+            year=2021,
+            price=10000,
+        )
+        self.assertIn(("Kia", 1), get_catalogue_facets()["brands"])
+        kia.delete()
+        self.assertNotIn(("Kia", 1), get_catalogue_facets()["brands"])
+
+    def test_home_page_shows_brand_counts(self):
+        response = self.client.get(reverse("listings:home"))
+        self.assertContains(response, "Seat (2)")
+        self.assertEqual(response.context["available_years"], [2019, 2020])
+
+
+@override_settings(LISTINGS_PAGINATION="keyset", LISTINGS_PAGE_CACHE_TIMEOUT=0)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Car.objects.bulk_create(
+            Car(
+                license_plate=f"{idx:04d}KEY",
+                brand="Seat" if idx % 2 else "Audi",
+                model_name="Leon",
+                kilometers=1000 * idx,
+                year=2020,
+                price=10000,
+            )
+            for idx in range(30)
+        )
+        # Identical timestamps force the id tie-breaker to do the work.
+        Car.objects.update(created_at=timezone.now())
+        self.expected = list(Car.objects.order_by("-created_at", "-id"))
+
+    def get_page(self, **params):
+        response = self.client.get(reverse("listings:home"), params)
+        return response, response.context["page_obj"]
+
+    def test_walks_forward_and_back_without_gaps(self):
+        response, page = self.get_page()
+        seen = list(page)
+        self.assertFalse(page.has_previous())
+        while page.has_next():
+            response, page = self.get_page(cursor=page.next_cursor)
+            seen.extend(page)
+        self.assertEqual(seen, self.expected)
+
+        _, previous = self.get_page(cursor=page.previous_cursor)
+        self.assertEqual(list(previous), self.expected[12:24])
+        _, first = self.get_page(cursor=previous.previous_cursor)
+        self.assertEqual(list(first), self.expected[:12])
+        self.assertFalse(first.has_previous())
+
+    def test_cursor_links_keep_filters(self):
+        response, page = self.get_page(brand="Seat")
+        self.assertEqual(page.paginator.count, 15)
+        self.assertContains(response, f"?cursor={page.next_cursor}&brand=Seat")
+        _, second = self.get_page(brand="Seat", cursor=page.next_cursor)
+        self.assertEqual([car.brand for car in second], ["Seat"] * 3)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        _, page = self.get_page(cursor="not-a-cursor")
+        self.assertEqual(list(page), self.expected[:12])
+
+    def test_stale_cursors_fall_back_to_first_page(self):
+        past = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+        future = datetime(2100, 1, 1, tzinfo=dt_timezone.utc)
+        for cursor in (encode_cursor(past, 1, FORWARD), encode_cursor(future, 1, BACKWARD)):
+            response, page = self.get_page(cursor=cursor)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(list(page), self.expected[:12])
+            self.assertFalse(page.has_previous())
+
+    def test_result_count_is_cached_until_a_car_changes(self):
+        with CaptureQueriesContext(connection) as miss:
+            self.get_page()
+        # Only the page and its photos: the count (and the facets) are cached.
+        with self.assertNumQueries(2):
+            _, page = self.get_page()
+        self.assertEqual(page.paginator.count, 30)
+        Car.objects.first().save()
+        with self.assertNumQueries(len(miss)):
+            self.get_page()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class CataloguePageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.car = Car.objects.create(
+            license_plate="7777PCH",
+            brand="Kia",
+            model_name="Ceed",
+            kilometers=12000,
+            year=2021,
+            price=17000,
+        )
+        self.url = reverse("listings:home")
+
+    def test_second_anonymous_hit_is_served_without_queries(self):
+        first = self.client.get(self.url, {"brand": "Kia"})
+        self.assertEqual(first["X-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url, {"brand": "Kia", "utm_source": "x"})
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(first.content, second.content)
+        self.assertNotContains(second, "utm_source")
+        self.assertNotContains(second, "csrf-token")
+
+    def test_cached_form_shows_the_normalized_filters(self):
+        first = self.client.get(self.url, {"model": "  Ceed ", "q": " "})
+        self.assertContains(first, 'name="model" value="Ceed"')
+        self.assertContains(first, 'name="q" value=""')
+        second = self.client.get(self.url, {"model": "Ceed"})
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(first.content, second.content)
+
+    def test_filter_combinations_are_cached_separately(self):
+        self.client.get(self.url, {"brand": "Kia"})
+        response = self.client.get(self.url, {"brand": "Seat"})
+        self.assertEqual(response["X-Cache"], "MISS")
+
+    def test_car_and_photo_changes_invalidate_pages(self):
+        self.client.get(self.url)
+        self.car.model_name = "Sportage"
+        self.car.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertContains(response, "Sportage")
+
+        CarPhoto.objects.create(car=self.car, image=fake_image("kia.gif"))
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertContains(response, "1 fotos")
+
+    def test_authenticated_users_bypass_the_cache(self):
+        User.objects.create_user(username="viewer", password="secret")
+        self.client.login(username="viewer", password="secret")
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header("X-Cache"))
+
+    def test_stats_are_exposed_to_staff_only(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        stats_url = reverse("listings:cache_stats")
+        self.assertEqual(self.client.get(stats_url).status_code, 302)
+        User.objects.create_user(username="ops", password="secret", is_staff=True)
+        self.client.login(username="ops", password="secret")
+        stats = self.client.get(stats_url).json()
+        self.assertEqual(stats["page-cache-hit"], 1)
+        self.assertEqual(stats["page-cache-miss"], 1)
+        self.assertEqual(stats["hit-ratio"], 0.5)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "listings.cache_backends.RecordingCache", "LOCATION": "tests"}}
+)
+class StampedeProtectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+        start = threading.Barrier(8)
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return "value"
+
+        def read(results):
+            start.wait()
+            results.append(get_or_compute("stampede", compute, 60))
+
+        results = []
+        threads = [threading.Thread(target=read, args=(results,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["value"] * 8)
+        self.assertEqual(cache.operations("set"), ["stampede"])
+
+    def test_values_near_expiry_are_refreshed_early(self):
+        # Took 100 s to compute and expires in 1 s: due for a refresh.
+        cache.set("facets", ("old", 100.0, time.time() + 1), 60)
+        with patch("listings.cache.random.random", return_value=0.5):
+            self.assertEqual(get_or_compute("facets", lambda: "new", 60), "new")
+            self.assertEqual(get_or_compute("facets", lambda: "newer", 60), "new")
+
+    def test_stale_value_is_served_while_another_caller_refreshes(self):
+        cache.set("facets", ("old", 100.0, time.time() + 1), 60)
+        cache.add("facets:lock", 1)
+        with patch("listings.cache.random.random", return_value=0.5):
+            self.assertEqual(get_or_compute("facets", lambda: "new", 60), "old")
+
+    def test_none_is_not_cached(self):
+        self.assertIsNone(get_or_compute("missing", lambda: None, 60))
+        self.assertEqual(cache.operations("set"), [])
+        self.assertEqual(get_or_compute("missing", lambda: "found", 60), "found")
+
+    async def test_concurrent_page_misses_render_once(self):
+        url = reverse("listings:home")
+        responses = await asyncio.gather(*(self.async_client.get(url) for _ in range(4)))
+        self.assertEqual(
+            sorted(response["X-Cache"] for response in responses), ["HIT"] * 3 + ["MISS"]
+        )
+        self.assertEqual(len({response.content for response in responses}), 1)
+
+    def test_warm_page_is_read_without_taking_the_lock(self):
+        url = reverse("listings:home")
+        self.client.get(url)
+        cache.calls.clear()
+        response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertFalse([key for key in cache.operations("add") if key.endswith(":lock")])
+        self.assertEqual(cache.operations("set"), [])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, LISTINGS_PAGE_CACHE_TIMEOUT=0)
+class PhotoQueryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.buyer = User.objects.create_user(username="counter", password="secret")
+
+    def add_cars(self, total, photos=3):
+        cars = []
+        for idx in range(total):
+            car = Car.objects.create(
+                license_plate=f"{Car.objects.count():04d}NPQ",
+                brand="Seat",
+                model_name="Leon",
+                kilometers=1000,
+                year=2020,
+                price=10000,
+            )
+            for position in reversed(range(photos)):
+                CarPhoto.objects.create(
+                    car=car, image=fake_image(f"p{position}.gif"), position=position
+                )
+            cars.append(car)
+        return cars
+
+    def test_list_page_query_count_does_not_grow_with_cars(self):
+        self.add_cars(2)
+        cache.clear()
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse("listings:home"))
+        self.add_cars(8)
+        cache.clear()
+        with self.assertNumQueries(len(small)):
+            response = self.client.get(reverse("listings:home"))
+        self.assertContains(response, "3 fotos", count=10)
+
+    def test_buy_page_uses_prefetched_cover_photo(self):
+        car = self.add_cars(1)[0]
+        self.client.login(username="counter", password="secret")
+        # session + user + car + photos
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("listings:car_buy", args=[car.pk]))
+        cover = response.context["car"].cover_photo
+        self.assertEqual(cover.position, 0)
+        self.assertContains(response, cover.image.url)
+
+    def test_cover_photo_without_prefetch_still_works(self):
+        car = self.add_cars(1, photos=2)[0]
+        self.assertEqual(Car.objects.get(pk=car.pk).cover_photo.position, 0)
+        empty = self.add_cars(1, photos=0)[0]
+        self.assertIsNone(Car.objects.with_photos().get(pk=empty.pk).cover_photo)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    LISTINGS_TASKS_EAGER=True,
+    LISTINGS_PAGE_CACHE_TIMEOUT=0,
+)
+class PhotoRenditionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.car = Car.objects.create(
+            license_plate="3030RND",
+            brand="Ford",
+            model_name="Focus",
+            kilometers=40000,
+            year=2019,
+            price=12000,
+        )
+
+    def test_upload_builds_every_width_and_format(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            photo = CarPhoto.objects.create(car=self.car, image=fake_jpeg("focus.jpg"))
+        photo.refresh_from_db()
+        formats = photo.renditions["formats"]
+        # Formats this Pillow build cannot encode (often AVIF) are skipped.
+        self.assertEqual(set(formats), set(rendition_formats()))
+        for fmt, widths in formats.items():
+            self.assertEqual(sorted(widths, key=int), ["320", "640", "1024"])
+            for width, name in widths.items():
+                self.assertEqual(name, rendition_name(photo.image.name, int(width), fmt))
+                with Image.open(photo.image.storage.path(name)) as rendition:
+                    self.assertEqual(rendition.width, int(width))
+
+        response = self.client.get(reverse("listings:home"))
+        if "avif" in formats:
+            self.assertContains(response, 'type="image/avif"')
+        self.assertContains(response, photo.srcset("webp"))
+        self.assertContains(response, "data-carousel-item")
+
+    def test_small_images_are_not_upscaled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            photo = CarPhoto.objects.create(car=self.car, image=fake_image("tiny.gif"))
+        photo.refresh_from_db()
+        self.assertEqual(list(photo.renditions["formats"]["webp"]), ["1"])
+
+    @override_settings(LISTINGS_RENDITION_FORMATS=("webp",))
+    def test_backfill_command_only_processes_missing_renditions(self):
+        photo = CarPhoto.objects.create(car=self.car, image=fake_jpeg("old.jpg", (800, 600)))
+        self.assertEqual(photo.srcset("webp"), "")
+        out = StringIO()
+        call_command("build_renditions", workers=1, stdout=out)
+        photo.refresh_from_db()
+        self.assertIn("320w", photo.srcset("webp"))
+        self.assertIn("1 de 1", out.getvalue())
+        call_command("build_renditions", stdout=out)
+        self.assertIn("Todas las fotos tienen miniaturas", out.getvalue())
+
+
+CALLS = []
+
+
+@task("test_record", max_attempts=2)
+def record_call(value):
+    CALLS.append(value)
+    if value == "boom":
+        raise RuntimeError("boom")
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, LISTINGS_RENDITION_FORMATS=("webp",))
+class SyntheticSeedTests(TestCase):
+    def test_bulk_mode_batches_inserts_and_shares_images(self):
+        out = StringIO()
+        with CaptureQueriesContext(connection) as ctx:
+            call_command(
+                "seed_listings",
+                count=60,
+                batch_size=20,
+                workers=1,
+                image_variants=1,
+                seed=7,
+                stdout=out,
+            )
+        self.assertEqual(Car.objects.count(), 60)
+        self.assertLess(len(ctx.captured_queries), 60)
+        for car in Car.objects.all():
+            car.full_clean()
+
+        photos = CarPhoto.objects.all()
+        self.assertGreaterEqual(photos.count(), 60)
+        for car in Car.objects.all():
+            self.assertEqual(car.photo_count, car.photos.count())
+        images = set(photos.values_list("image", flat=True))
+        self.assertLessEqual(len(images), len(CATALOGUE_MODELS))
+        photo = photos.first()
+        self.assertEqual(photo.renditions["source"], photo.image.name)
+        self.assertIn("Se insertaron 60 anuncios", out.getvalue())
+
+        call_command("seed_listings", count=5, workers=1, image_variants=1, seed=7, stdout=out)
+        self.assertEqual(Car.objects.count(), 65)
+        self.assertEqual(set(CarPhoto.objects.values_list("image", flat=True)), images)
+
+
+@override_settings(LISTINGS_TASKS_EAGER=False)
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_worker_runs_pending_tasks_in_order(self):
+        enqueue("test_record", value="a")
+        enqueue("test_record", value="b")
+        enqueue("test_record", value="later", delay=3600)
+        self.assertEqual(run_worker(once=True), 2)
+        self.assertEqual(CALLS, ["a", "b"])
+        self.assertEqual(
+            Task.objects.filter(status=Task.Status.DONE).count(), 2
+        )
+
+    def test_claimed_task_is_not_handed_out_twice(self):
+        enqueue("test_record", value="a")
+        self.assertIsNotNone(claim_task())
+        self.assertIsNone(claim_task())
+
+    def test_expired_lease_is_reclaimed(self):
+        enqueue("test_record", value="a")
+        claimed = claim_task()
+        Task.objects.filter(pk=claimed.pk).update(
+            locked_until=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(claim_task().pk, claimed.pk)
+
+    def test_expired_lease_on_the_last_attempt_fails_the_task(self):
+        queued = enqueue("test_record", value="hangs")
+        Task.objects.filter(pk=queued.pk).update(
+            status=Task.Status.RUNNING,
+            attempts=queued.max_attempts,
+            locked_until=timezone.now() - timedelta(seconds=1),
+        )
+        self.assertIsNone(claim_task())
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Task.Status.FAILED)
+        self.assertIn("lease", queued.last_error)
+
+    def test_failures_are_retried_with_backoff_then_marked_failed(self):
+        queued = enqueue("test_record", value="boom")
+        with self.assertLogs("listings.queue", "WARNING"):
+            run_worker(once=True)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Task.Status.PENDING)
+        self.assertGreater(queued.run_after, timezone.now())
+        self.assertIn("RuntimeError", queued.last_error)
+
+        Task.objects.filter(pk=queued.pk).update(run_after=timezone.now())
+        with self.assertLogs("listings.queue", "WARNING"):
+            run_worker(once=True)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Task.Status.FAILED)
+        self.assertEqual(queued.attempts, 2)
+
+    @override_settings(LISTINGS_TASKS_EAGER=True)
+    def test_eager_mode_runs_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIsNone(enqueue("test_record", value="now"))
+            self.assertEqual(CALLS, [])
+        self.assertEqual(CALLS, ["now"])
+        self.assertFalse(Task.objects.exists())
+
+    @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+    def test_photo_upload_enqueues_renditions(self):
+        car = Car.objects.create(
+            license_plate="6060TSK",
+            brand="Opel",
+            model_name="Corsa",
+            kilometers=1000,
+            year=2020,
+            price=9000,
+        )
+        photo = CarPhoto.objects.create(car=car, image=fake_image("corsa.gif"))
+        queued = Task.objects.get(name="build_renditions")
+        self.assertEqual(queued.payload, {"photo_id": photo.pk})
+        run_worker(once=True)
+        photo.refresh_from_db()
+        self.assertEqual(photo.renditions["source"], photo.image.name)
+
+
+class PhotoServer(BaseHTTPRequestHandler):
+    """Tiny origin with ETags, byte ranges and a flaky endpoint."""
+
+    body = b""
+    etag = '"v1"'
+    hits = {}
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.hits[self.path] = self.hits.get(self.path, 0) + 1
+        if self.path == "/flaky.jpg" and self.hits[self.path] == 1:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path == "/missing.jpg":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body, status = self.body, 200
+        range_header = self.headers.get("Range", "")
+        if range_header and self.headers.get("If-Range") == self.etag:
+            start = int(range_header.removeprefix("bytes=").rstrip("-"))
+            body, status = self.body[start:], 206
+            self.server.ranges.append(start)
+        self.send_response(status)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class PhotoDownloaderTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        buffer = BytesIO()
+        Image.new("RGB", (64, 48), "blue").save(buffer, format="JPEG")
+        PhotoServer.body = buffer.getvalue()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), PhotoServer)
+        cls.server.ranges = []
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        PhotoServer.hits.clear()
+        self.server.ranges.clear()
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        self.downloader = PhotoDownloader(workers=4, backoff=0, workdir=self.workdir)
+
+    def test_downloads_concurrently_and_reports_validators(self):
+        jobs = [DownloadJob(f"{self.base_url}/photo.jpg?n={n}") for n in range(6)]
+        results = list(self.downloader.download_all(jobs))
+        self.assertEqual(len(results), 6)
+        for result in results:
+            self.assertEqual(result.status, DOWNLOADED)
+            self.assertEqual(result.etag, '"v1"')
+            self.assertEqual(result.path.read_bytes(), PhotoServer.body)
+            result.discard()
+        self.assertEqual(list(Path(self.workdir).iterdir()), [])
+
+    def test_jobs_for_the_same_url_do_not_share_partial_files(self):
+        url = f"{self.base_url}/photo.jpg"
+        jobs = [DownloadJob(url, key=f"car-{n}") for n in range(2)]
+        first, second = self.downloader.download_all(jobs)
+        self.assertNotEqual(first.path, second.path)
+        first.discard()
+        self.assertEqual(second.path.read_bytes(), PhotoServer.body)
+        second.discard()
+
+        # A partial file removed under a running job fails that job only.
+        with patch.object(self.downloader, "_fetch_once", side_effect=FileNotFoundError(url)):
+            result = self.downloader.fetch(DownloadJob(url))
+        self.assertEqual(result.status, FAILED)
+
+    def test_known_etag_gets_not_modified(self):
+        result = self.downloader.fetch(DownloadJob(f"{self.base_url}/photo.jpg", etag='"v1"'))
+        self.assertEqual(result.status, NOT_MODIFIED)
+        self.assertIsNone(result.path)
+
+    def test_transient_errors_are_retried_and_client_errors_are_not(self):
+        result = self.downloader.fetch(DownloadJob(f"{self.base_url}/flaky.jpg"))
+        self.assertEqual(result.status, DOWNLOADED)
+        self.assertEqual(result.attempts, 2)
+
+        result = self.downloader.fetch(DownloadJob(f"{self.base_url}/missing.jpg"))
+        self.assertEqual(result.status, FAILED)
+        self.assertEqual(PhotoServer.hits["/missing.jpg"], 1)
+
+    def test_partial_download_is_resumed_with_range(self):
+        url = f"{self.base_url}/photo.jpg"
+        part = self.downloader.part_path(url)
+        part.write_bytes(PhotoServer.body[:100])
+        part.with_suffix(".json").write_text(json.dumps({"etag": '"v1"', "last_modified": ""}))
+
+        result = self.downloader.fetch(DownloadJob(url))
+        self.assertEqual(result.status, DOWNLOADED)
+        self.assertEqual(self.server.ranges, [100])
+        self.assertEqual(result.path.read_bytes(), PhotoServer.body)
+
+    @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+    def test_command_ingests_source_file_and_skips_unchanged_photos(self):
+        car = Car.objects.create(
+            license_plate="7070DLW",
+            brand="Kia",
+            model_name="Ceed",
+            kilometers=30000,
+            year=2021,
+            price=15000,
+        )
+        source = Path(self.workdir) / "fuentes.json"
+        source.write_text(
+            json.dumps(
+                [
+                    {
+                        "license_plate": "7070dlw",
+                        "urls": [f"{self.base_url}/photo.jpg", f"{self.base_url}/flaky.jpg"],
+                    },
+                    {"license_plate": "0000XXX", "urls": [f"{self.base_url}/photo.jpg"]},
+                ]
+            )
+        )
+        out = StringIO()
+        call_command("fetch_demo_photos", source=source, retries=2, stdout=out)
+        photos = list(car.photos.order_by("position"))
+        self.assertEqual([photo.position for photo in photos], [0, 1])
+        self.assertEqual(photos[0].source_etag, '"v1"')
+        self.assertIn("No existe 0000XXX", out.getvalue())
+        self.assertIn("Fotos descargadas: 2", out.getvalue())
+
+        out = StringIO()
+        call_command("fetch_demo_photos", source=source, stdout=out)
+        self.assertEqual(car.photos.count(), 2)
+        self.assertIn("Sin cambios (304): 2", out.getvalue())
+
+    @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, LISTINGS_TASKS_EAGER=False)
+    def test_queued_downloads_refresh_existing_photos(self):
+        car = Car.objects.create(
+            license_plate="7171DLQ",
+            brand="Kia",
+            model_name="Ceed",
+            kilometers=30000,
+            year=2021,
+            price=15000,
+        )
+        source = Path(self.workdir) / "fuentes.json"
+        source.write_text(
+            json.dumps([{"license_plate": "7171DLQ", "urls": [f"{self.base_url}/photo.jpg"]}])
+        )
+        for _ in range(2):
+            call_command("fetch_demo_photos", source=source, enqueue=True, stdout=StringIO())
+            run_worker(once=True)
+        photo = car.photos.get()
+        self.assertEqual(photo.source_etag, '"v1"')
+        self.assertEqual(PhotoServer.hits["/photo.jpg"], 2)
+        self.assertFalse(Task.objects.exclude(status=Task.Status.DONE).exists())
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class CarPhotoLimitTests(TestCase):
     def setUp(self):
@@ -120,6 +897,782 @@ class CarPhotoLimitTests(TestCase):
             exceeding.clean()
 
 
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class BatchValidationTests(TestCase):
+    def setUp(self):
+        self.car = Car.objects.create(
+            license_plate="1111VAL",
+            brand="Seat",
+            model_name="Leon",
+            kilometers=10000,
+            year=2020,
+            price=15000,
+        )
+
+    def make_car(self, plate, **fields):
+        values = {
+            "license_plate": plate,
+            "brand": "Seat",
+            "model_name": "Arona",
+            "kilometers": 5000,
+            "year": 2021,
+            "price": 18000,
+        }
+        values.update(fields)
+        return Car(**values)
+
+    def test_cars_are_checked_with_one_query(self):
+        cars = [
+            self.make_car("2222val"),
+            self.make_car("1111val"),
+            self.make_car("2222VAL"),
+            self.make_car("3333VAL", year=1900),
+            self.car,
+        ]
+        with self.assertNumQueries(1):
+            errors = validate_cars(cars)
+        self.assertEqual(sorted(errors), [1, 2, 3])
+        self.assertIn("license_plate", errors[1].message_dict)
+        self.assertIn("year", errors[3].message_dict)
+        self.assertEqual(cars[0].license_plate, "2222VAL")
+
+    def test_photo_cap_uses_one_query(self):
+        for position in range(Car.MAX_PHOTOS - 2):
+            CarPhoto.objects.create(car=self.car, image=fake_image(f"v{position}.gif"))
+        photos = [CarPhoto(car=self.car, image=f"cars/new_{n}.gif") for n in range(3)]
+        with self.assertNumQueries(1):
+            errors = validate_photos(photos)
+        self.assertEqual(list(errors), [2])
+
+    def test_validate_false_skips_validation_queries(self):
+        car = self.make_car("4444VAL")
+        with self.assertNumQueries(1):
+            car.save(validate=False)
+        with CaptureQueriesContext(connection) as ctx:
+            CarPhoto(car=car, image="cars/trusted.gif").save(validate=False)
+        self.assertFalse(any("COUNT" in query["sql"] for query in ctx.captured_queries))
+
+    def test_admin_add_validates_once(self):
+        admin = User.objects.create_superuser("root", "root@example.com", "secret")
+        self.client.force_login(admin)
+        response = self.client.post(
+            reverse("admin:listings_car_add"),
+            {
+                "license_plate": "5555VAL",
+                "brand": "Kia",
+                "model_name": "Niro",
+                "kilometers": "1000",
+                "year": "2022",
+                "price": "21000",
+                "description": "",
+                "is_active": "on",
+                "photos-TOTAL_FORMS": "1",
+                "photos-INITIAL_FORMS": "0",
+                "photos-MIN_NUM_FORMS": "0",
+                "photos-MAX_NUM_FORMS": "10",
+                "photos-0-image": fake_image("niro.gif"),
+                "photos-0-position": "0",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Car.objects.get(license_plate="5555VAL").photos.count(), 1)
+
+
+class CarAdminChangelistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser("root", "root@example.com", "secret")
+        self.client.force_login(self.admin)
+        for plate, brand, year in [("1000ADM", "Seat", 2019), ("2000ADM", "Audi", 2021)]:
+            Car.objects.create(
+                license_plate=plate,
+                brand=brand,
+                model_name="X",
+                kilometers=1000,
+                year=year,
+                price=10000,
+                created_by=self.admin,
+            )
+        self.url = reverse("admin:listings_car_changelist")
+
+    def test_warm_changelist_skips_counts_and_distinct_queries(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertContains(response, "1000ADM")
+        self.assertContains(response, "Audi")  # brand filter choice
+        sql = [query["sql"] for query in ctx.captured_queries]
+        self.assertFalse([query for query in sql if "COUNT(" in query or "DISTINCT" in query])
+        rows = [query for query in sql if 'FROM "listings_car"' in query]
+        self.assertEqual(len(rows), 1)
+        self.assertIn('"listings_user"', rows[0])  # created_by is joined
+
+    def test_search_matches_plate_prefixes(self):
+        response = self.client.get(self.url, {"q": "1000"})
+        self.assertContains(response, "1000ADM")
+        self.assertNotContains(response, "2000ADM")
+
+    def test_search_without_words_shows_no_results(self):
+        for term in ("-", "%", "*"):
+            response = self.client.get(self.url, {"q": term})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context["cl"].result_count, 0)
+
+    def test_new_cars_refresh_cached_filter_choices(self):
+        self.client.get(self.url)
+        Car.objects.create(
+            license_plate="3000ADM", brand="Kia", model_name="X", kilometers=1, year=2020, price=1
+        )
+        self.assertContains(self.client.get(self.url), "?brand=Kia")
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, LISTINGS_TASKS_EAGER=True)
+class BulkAdminActionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser("bulk", "bulk@example.com", "secret")
+        self.client.force_login(self.admin)
+        self.cars = [
+            Car.objects.create(
+                license_plate=f"{n}000BLK",
+                brand="Seat",
+                model_name="Leon",
+                kilometers=1000,
+                year=2020,
+                price=price,
+            )
+            for n, price in enumerate(["10000.00", "12345.67", "9999.99"], start=1)
+        ]
+        self.sold = Car.objects.create(
+            license_plate="9000BLK",
+            brand="Seat",
+            model_name="Ibiza",
+            kilometers=1000,
+            year=2020,
+            price=8000,
+            is_active=False,
+            sold_at=timezone.now(),
+        )
+        self.url = reverse("admin:listings_car_changelist")
+
+    def run_action(self, action, cars, **data):
+        return self.client.post(
+            self.url,
+            {"action": action, "_selected_action": [car.pk for car in cars], **data},
+        )
+
+    def test_activation_is_one_update_and_one_cache_bump(self):
+        with patch("listings.bulk.bump_catalogue_version") as bump:
+            self.run_action("deactivate_cars", self.cars, index=0)
+        bump.assert_called_once()
+        self.assertFalse(Car.objects.filter(is_active=True).exists())
+
+        self.run_action("activate_cars", [*self.cars, self.sold], index=0)
+        self.assertEqual(Car.objects.filter(is_active=True).count(), 3)
+        self.assertFalse(Car.objects.get(pk=self.sold.pk).is_active)
+
+    def test_price_change_asks_for_the_percentage_first(self):
+        response = self.run_action("change_prices", self.cars, index=0)
+        self.assertContains(response, "Variación del precio")
+        self.assertEqual(Car.objects.get(pk=self.cars[0].pk).price, Decimal("10000.00"))
+
+        self.run_action("change_prices", self.cars[:2], apply="1", percent="-5")
+        prices = dict(Car.objects.values_list("license_plate", "price"))
+        self.assertEqual(prices["1000BLK"], Decimal("9500.00"))
+        self.assertEqual(prices["2000BLK"], Decimal("11728.39"))
+        self.assertEqual(prices["3000BLK"], Decimal("9999.99"))
+
+    def test_delete_removes_rows_then_photo_files(self):
+        car = self.cars[0]
+        photo = CarPhoto(car=car, image=fake_image("bulk.gif"))
+        photo.save()
+        storage = photo.image.storage
+        rendition = storage.save(rendition_name(photo.image.name, 320, "webp"), BytesIO(b"x"))
+        CarPhoto.objects.filter(pk=photo.pk).update(
+            renditions={"source": photo.image.name, "formats": {"webp": {"320": rendition}}}
+        )
+        actions = self.client.get(self.url).context["action_form"].fields["action"].choices
+        self.assertNotIn("delete_selected", dict(actions))
+
+        confirm = self.run_action("delete_cars", self.cars[:2], index=0)
+        self.assertContains(confirm, "2 anuncios")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_action("delete_cars", self.cars[:2], apply="1")
+        self.assertEqual(Car.objects.count(), 2)
+        self.assertFalse(CarPhoto.objects.exists())
+        self.assertFalse(storage.exists(photo.image.name))
+        self.assertFalse(storage.exists(rendition))
+
+    def test_delete_keeps_files_shared_with_surviving_cars(self):
+        photo = CarPhoto(car=self.cars[0], image=fake_image("shared.gif"))
+        photo.save()
+        storage = photo.image.storage
+        rendition = storage.save(rendition_name(photo.image.name, 320, "webp"), BytesIO(b"x"))
+        manifest = {"source": photo.image.name, "formats": {"webp": {"320": rendition}}}
+        CarPhoto.objects.filter(pk=photo.pk).update(renditions=manifest)
+        CarPhoto.objects.create(car=self.cars[1], image=photo.image.name, renditions=manifest)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_action("delete_cars", self.cars[:1], apply="1")
+        self.assertEqual(CarPhoto.objects.count(), 1)
+        self.assertTrue(storage.exists(photo.image.name))
+        self.assertTrue(storage.exists(rendition))
+
+
+class MediaGarbageCollectionTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        car = Car.objects.create(
+            license_plate="1000GCM",
+            brand="Seat",
+            model_name="Leon",
+            kilometers=1000,
+            year=2020,
+            price=10000,
+        )
+        self.photo = CarPhoto(car=car, image=fake_image("live.gif"))
+        self.photo.save()
+        self.storage = self.photo.image.storage
+        self.live = self.save_file(rendition_name(self.photo.image.name, 320, "webp"))
+        CarPhoto.objects.filter(pk=self.photo.pk).update(
+            renditions={"source": self.photo.image.name, "formats": {"webp": {"320": self.live}}}
+        )
+        folder = str(Path(self.photo.image.name).parent)
+        self.stale = self.save_file(rendition_name(self.photo.image.name, 640, "webp"))
+        self.orphan = self.save_file(f"{folder}/deleted.jpg", b"x" * 1000)
+        self.orphan_rendition = self.save_file(f"{folder}/deleted__320w.webp", b"x" * 24)
+        self.unknown = self.save_file(f"{folder}/elsewhere__320w.webp")
+        self.names = [
+            self.photo.image.name,
+            self.live,
+            self.stale,
+            self.orphan,
+            self.orphan_rendition,
+            self.unknown,
+        ]
+        old = time.time() - 2 * 3600
+        for name in self.names:
+            os.utime(self.storage.path(name), (old, old))
+
+    def save_file(self, name, content=b"x"):
+        return self.storage.save(name, BytesIO(content))
+
+    def existing(self):
+        return {name for name in self.names if self.storage.exists(name)}
+
+    def test_dry_run_reports_orphans_without_deleting(self):
+        out = StringIO()
+        call_command("gc_media", "--dry-run", stdout=out)
+        output = out.getvalue()
+        self.assertIn(self.orphan, output)
+        self.assertIn(self.stale, output)
+        self.assertIn("3 huérfanos de 6 ficheros", output)
+        self.assertEqual(len(self.existing()), 6)
+
+    def test_deletes_unreferenced_files_and_renditions_only(self):
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command("gc_media", "--workers", "2", stdout=out)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(self.existing(), {self.photo.image.name, self.live, self.unknown})
+        self.assertIn("3 de 3 huérfanos borrados", out.getvalue())
+
+    def test_recent_files_are_kept(self):
+        fresh = self.save_file(f"{Path(self.orphan).parent}/uploading.jpg")
+        call_command("gc_media", stdout=StringIO())
+        self.assertTrue(self.storage.exists(fresh))
+        self.assertFalse(self.storage.exists(self.orphan))
+
+
+@override_settings(LISTINGS_PAGE_CACHE_TIMEOUT=0)
+class ImportListingsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.workdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.workdir, ignore_errors=True)
+        self.dealer = User.objects.create_user("dealer", password="secret")
+        self.stale = Car.objects.create(
+            license_plate="0001OLD",
+            brand="Opel",
+            model_name="Astra",
+            kilometers=90000,
+            year=2012,
+            price=5000,
+            created_by=self.dealer,
+        )
+        self.updated = Car.objects.create(
+            license_plate="0002UPD",
+            brand="Opel",
+            model_name="Corsa",
+            kilometers=50000,
+            year=2016,
+            price=7000,
+            created_by=self.dealer,
+        )
+        self.other = Car.objects.create(
+            license_plate="0003OTR",
+            brand="Fiat",
+            model_name="Panda",
+            kilometers=30000,
+            year=2018,
+            price=6000,
+        )
+
+    def write_csv(self):
+        path = self.workdir / "feed.csv"
+        path.write_text(
+            "license_plate,brand,model_name,kilometers,year,price,description\n"
+            "0004NEW,Škoda,Octavia,20000,2021,19500,Borrador\n"
+            "0004NEW,Škoda,Octavia,20000,2021,19500,Duplicada\n"
+            "0002upd,Opel,Corsa GS,52000,2016,6500,Rebajado\n"
+            "0005BAD,Seat,Leon,muchos,2020,9000,\n"
+            "0006OLD,Seat,Leon,1000,1950,9000,\n"
+            "0004NEW,Škoda,Octavia Combi,20000,2021,19500,Familiar amplio\n",
+            encoding="utf-8",
+        )
+        return path
+
+    def test_csv_feed_upserts_reports_errors_and_deactivates_missing(self):
+        out = StringIO()
+        call_command(
+            "import_listings",
+            self.write_csv(),
+            batch_size=2,
+            deactivate_missing=True,
+            user="dealer",
+            stdout=out,
+        )
+        output = out.getvalue()
+        self.assertIn("Fila 2: license_plate:", output)
+        self.assertIn("Fila 4: Valor no válido", output)
+        self.assertIn("Fila 5: year:", output)
+        self.assertIn("6 filas", output)
+        self.assertIn("1 nuevos, 2 actualizados, 3 con errores, 1 desactivados", output)
+
+        self.updated.refresh_from_db()
+        self.assertEqual((self.updated.model_name, self.updated.price), ("Corsa GS", 6500))
+        self.assertTrue(self.updated.is_active)
+        created = Car.objects.get(license_plate="0004NEW")
+        self.assertEqual(created.created_by, self.dealer)
+        self.stale.refresh_from_db()
+        self.assertFalse(self.stale.is_active)
+        self.other.refresh_from_db()
+        self.assertTrue(self.other.is_active)
+
+        response = self.client.get(reverse("listings:home"), {"q": "skoda"})
+        self.assertEqual([car.pk for car in response.context["cars"]], [created.pk])
+        response = self.client.get(reverse("listings:home"), {"q": "rebajado"})
+        self.assertEqual([car.pk for car in response.context["cars"]], [self.updated.pk])
+        response = self.client.get(reverse("listings:home"), {"q": "borrador"})
+        self.assertEqual(list(response.context["cars"]), [])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO listings_car_fts(listings_car_fts) VALUES ('integrity-check')"
+            )
+
+    def test_json_array_is_read_incrementally(self):
+        path = self.workdir / "feed.json"
+        rows = [
+            {
+                "license_plate": f"77{n:02d}JSN",
+                "brand": "Kia",
+                "model_name": "Ceed",
+                "kilometers": 1000 * n,
+                "year": 2020,
+                "price": 15000.5,
+            }
+            for n in range(5)
+        ]
+        path.write_text(json.dumps(rows, indent=2), encoding="utf-8")
+        with patch("listings.importer.READ_CHUNK", 7):
+            parsed = [row for _, row in read_feed(path)]
+        self.assertEqual(parsed, rows)
+
+        call_command("import_listings", path, stdout=StringIO())
+        self.assertEqual(Car.objects.filter(license_plate__endswith="JSN").count(), 5)
+
+    def test_interrupted_import_keeps_the_search_triggers(self):
+        def triggers():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'")
+                return dict(cursor.fetchall())
+
+        installed = triggers()
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic(), get_search_backend().deferred_indexing(connection):
+                self.assertNotIn("listings_car_fts_ai", triggers())
+                raise RuntimeError("killed")
+        self.assertEqual(triggers(), installed)
+
+        Car.objects.create(
+            license_plate="0009AFT",
+            brand="Mazda",
+            model_name="CX-5",
+            kilometers=1000,
+            year=2022,
+            price=25000,
+        )
+        response = self.client.get(reverse("listings:home"), {"q": "mazda"})
+        self.assertEqual([car.license_plate for car in response.context["cars"]], ["0009AFT"])
+
+    def test_backends_without_on_conflict_update_then_create(self):
+        Car.objects.filter(pk=self.stale.pk).update(is_active=False, sold_at=timezone.now())
+        path = self.workdir / "feed.csv"
+        path.write_text(
+            "license_plate,brand,model_name,kilometers,year,price,description\n"
+            "0001OLD,Opel,Astra,91000,2012,4500,\n"
+            "0002UPD,Opel,Corsa GS,52000,2016,6500,Rebajado\n"
+            "0004NEW,Škoda,Octavia,20000,2021,19500,\n",
+            encoding="utf-8",
+        )
+        with patch.object(connection.features, "supports_update_conflicts_with_target", False):
+            call_command("import_listings", path, stdout=StringIO())
+        self.stale.refresh_from_db()
+        self.assertEqual((self.stale.price, self.stale.is_active), (4500, False))
+        self.updated.refresh_from_db()
+        self.assertEqual((self.updated.model_name, self.updated.price), ("Corsa GS", 6500))
+        self.assertGreater(self.updated.updated_at, self.updated.created_at)
+        self.assertTrue(Car.objects.get(license_plate="0004NEW").is_active)
+        self.assertEqual(Car.objects.count(), 4)
+
+    def test_feed_does_not_bring_sold_cars_back(self):
+        Car.objects.filter(pk=self.updated.pk).update(is_active=False, sold_at=timezone.now())
+        call_command("import_listings", self.write_csv(), stdout=StringIO())
+        self.updated.refresh_from_db()
+        self.assertEqual(self.updated.model_name, "Corsa GS")
+        self.assertFalse(self.updated.is_active)
+        self.assertTrue(Car.objects.get(license_plate="0004NEW").is_active)
+
+
+@override_settings(LISTINGS_TASKS_EAGER=False)
+class CatalogueExportTests(TestCase):
+    def setUp(self):
+        self.leon = Car.objects.create(
+            license_plate="1111EXP",
+            brand="Seat",
+            model_name="Leon",
+            kilometers=40000,
+            year=2019,
+            price=15000,
+            description="Con «comillas», y comas",
+        )
+        self.golf = Car.objects.create(
+            license_plate="2222EXP",
+            brand="Volkswagen",
+            model_name="Golf",
+            kilometers=80000,
+            year=2015,
+            price=9000,
+        )
+        Car.objects.create(
+            license_plate="3333EXP",
+            brand="Seat",
+            model_name="Ibiza",
+            kilometers=1000,
+            year=2023,
+            price=14000,
+            is_active=False,
+        )
+        for position in (1, 0):
+            CarPhoto(car=self.leon, image=f"cars/leon_{position}.jpg", position=position).save(
+                validate=False
+            )
+        self.staff = User.objects.create_user("exporter", password="secret", is_staff=True)
+        self.client.force_login(self.staff)
+
+    def read(self, response):
+        return b"".join(response.streaming_content).decode()
+
+    def test_export_is_staff_only(self):
+        self.client.logout()
+        url = reverse("listings:catalogue_export", args=["csv"])
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(User.objects.create_user("buyer", password="secret"))
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    async def test_asgi_streams_keyset_pages_asynchronously(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(
+            reverse("listings:catalogue_export", args=["jsonl"])
+        )
+        self.assertTrue(response.is_async)
+        rows = [json.loads(line) async for line in response.streaming_content]
+        self.assertEqual([row["license_plate"] for row in rows], ["2222EXP", "1111EXP"])
+        self.assertEqual(len(rows[1]["photos"]), 2)
+
+        pages = aexport_rows(Car.objects.all(), chunk_size=1)
+        plates = [row["license_plate"] async for row in pages]
+        self.assertEqual(plates, ["3333EXP", "2222EXP", "1111EXP"])
+
+    def test_csv_streams_active_cars_with_absolute_photo_urls(self):
+        response = self.client.get(reverse("listings:catalogue_export", args=["csv"]))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertIn('filename="catalogo.csv"', response["Content-Disposition"])
+        rows = list(csv.DictReader(StringIO(self.read(response))))
+        self.assertEqual([row["license_plate"] for row in rows], ["2222EXP", "1111EXP"])
+        self.assertEqual(rows[1]["description"], "Con «comillas», y comas")
+        self.assertEqual(
+            rows[1]["photos"].split(),
+            [
+                "http://testserver/media/cars/leon_0.jpg",
+                "http://testserver/media/cars/leon_1.jpg",
+            ],
+        )
+        self.assertEqual(rows[0]["photos"], "")
+
+    def test_jsonl_applies_listing_filters(self):
+        response = self.client.get(
+            reverse("listings:catalogue_export", args=["jsonl"]),
+            {"brand": "seat", "year_min": "2018"},
+        )
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["license_plate"], "1111EXP")
+        self.assertEqual(rows[0]["price"], "15000.00")
+        self.assertEqual(len(rows[0]["photos"]), 2)
+
+    def test_unknown_format_is_404(self):
+        response = self.client.get(reverse("listings:catalogue_export", args=["xml"]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_queries_grow_with_chunks_not_cars(self):
+        for index in range(8):
+            car = Car.objects.create(
+                license_plate=f"{index:04d}CHK",
+                brand="Kia",
+                model_name="Ceed",
+                kilometers=1000,
+                year=2020,
+                price=12000,
+            )
+            CarPhoto(car=car, image=f"cars/ceed_{index}.jpg").save(validate=False)
+        queryset = Car.objects.order_by("id")
+        # one query for the 11 cars plus one per chunk of 5 for their photos
+        with self.assertNumQueries(4):
+            rows = list(export_rows(queryset, chunk_size=5))
+        self.assertEqual(len(rows), 11)
+        self.assertTrue(all(row["photos"] for row in rows if row["brand"] == "Kia"))
+
+    def test_command_writes_file(self):
+        workdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        target = workdir / "catalogo.jsonl"
+        call_command(
+            "export_listings",
+            format="jsonl",
+            output=str(target),
+            brand="Volkswagen",
+            base_url="https://example.com/",
+            stderr=StringIO(),
+        )
+        rows = [json.loads(line) for line in target.read_text().splitlines()]
+        self.assertEqual([row["license_plate"] for row in rows], ["2222EXP"])
+
+        out = StringIO()
+        call_command(
+            "export_listings", include_inactive=True, base_url="https://example.com", stdout=out
+        )
+        rows = list(csv.DictReader(StringIO(out.getvalue())))
+        self.assertEqual(len(rows), 3)
+        self.assertIn("https://example.com/media/cars/leon_0.jpg", out.getvalue())
+
+
+class CatalogueApiTests(TestCase):
+    def setUp(self):
+        self.cars = []
+        for index, (brand, year) in enumerate(
+            [("Seat", 2018), ("Seat", 2021), ("Toyota", 2020), ("Seat", 2016)]
+        ):
+            self.cars.append(
+                Car.objects.create(
+                    license_plate=f"{index:04d}API",
+                    brand=brand,
+                    model_name="Leon" if brand == "Seat" else "Corolla",
+                    kilometers=20000,
+                    year=year,
+                    price=12000,
+                )
+            )
+        CarPhoto(car=self.cars[1], image="cars/api.jpg").save(validate=False)
+        self.url = reverse("listings:api_car_list")
+
+    def test_list_filters_like_listing_page_with_sparse_fields(self):
+        response = self.client.get(
+            self.url, {"brand": "seat", "year_min": "2017", "fields": "license_plate,photos"}
+        )
+        data = response.json()
+        self.assertEqual(data["count"], 2)
+        self.assertEqual(
+            data["results"],
+            [
+                {"license_plate": "0001API", "photos": ["http://testserver/media/cars/api.jpg"]},
+                {"license_plate": "0000API", "photos": []},
+            ],
+        )
+
+    def test_search_uses_numbered_pages(self):
+        data = self.client.get(self.url, {"q": "leon", "page_size": 2}).json()
+        self.assertEqual(data["count"], 3)
+        self.assertIn("page=2", data["next"])
+        self.assertEqual(len(self.client.get(data["next"]).json()["results"]), 1)
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(self.url, {"fields": "brand,password"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_links_walk_every_car(self):
+        plates = []
+        url = self.url + "?page_size=3&fields=license_plate"
+        while url:
+            data = self.client.get(url).json()
+            plates += [row["license_plate"] for row in data["results"]]
+            url = data["next"]
+        self.assertEqual(plates, ["0003API", "0002API", "0001API", "0000API"])
+
+    def test_stale_cursor_gives_an_empty_page_and_bad_cursor_a_400(self):
+        past = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+        future = datetime(2100, 1, 1, tzinfo=dt_timezone.utc)
+        for cursor in (encode_cursor(past, 1, FORWARD), encode_cursor(future, 1, BACKWARD)):
+            response = self.client.get(self.url, {"cursor": cursor})
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertEqual((data["results"], data["next"], data["previous"]), ([], None, None))
+        self.assertEqual(self.client.get(self.url, {"cursor": "roto"}).status_code, 400)
+
+    def test_matching_etag_is_304_without_reading_rows(self):
+        response = self.client.get(self.url, {"brand": "Seat"})
+        self.assertTrue(response["ETag"].startswith('"'))
+        self.assertIn("Last-Modified", response)
+        with self.assertNumQueries(1):
+            cached = self.client.get(
+                self.url, {"brand": "Seat"}, HTTP_IF_NONE_MATCH=response["ETag"]
+            )
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached["ETag"], response["ETag"])
+        other = self.client.get(self.url, {"brand": "Toyota"}, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(other.status_code, 200)
+
+    def test_etag_changes_with_the_catalogue(self):
+        etag = self.client.get(self.url)["ETag"]
+        CarPhoto(car=self.cars[2], image="cars/new.jpg").save(validate=False)
+        self.assertNotEqual(self.client.get(self.url)["ETag"], etag)
+        etag = self.client.get(self.url)["ETag"]
+        self.cars[3].is_active = False
+        self.cars[3].save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 3)
+
+    def test_detail_and_conditional_get(self):
+        car = self.cars[1]
+        url = reverse("listings:api_car_detail", args=[car.pk])
+        response = self.client.get(url, {"fields": "brand,price"})
+        self.assertEqual(response.json(), {"brand": "Seat", "price": "12000.00"})
+        with self.assertNumQueries(1):
+            cached = self.client.get(
+                url, {"fields": "brand,price"}, HTTP_IF_NONE_MATCH=response["ETag"]
+            )
+        self.assertEqual(cached.status_code, 304)
+        car.price = 11000
+        car.save()
+        self.assertEqual(
+            self.client.get(
+                url, {"fields": "brand,price"}, HTTP_IF_NONE_MATCH=response["ETag"]
+            ).status_code,
+            200,
+        )
+        Car.objects.filter(pk=car.pk).update(is_active=False)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class DatabaseProfileTests(TestCase):
+    def test_tuned_profile_pragmas_are_applied_on_connect(self):
+        profile = settings.DATABASE_PROFILES["tuned"]
+        with tempfile.TemporaryDirectory() as workdir:
+            wrapper = DatabaseWrapper(
+                {**connection.settings_dict, **profile, "NAME": f"{workdir}/tuned.sqlite3"}
+            )
+            try:
+                with wrapper.cursor() as cursor:
+                    pragmas = {}
+                    for name in ("journal_mode", "synchronous", "busy_timeout", "cache_size"):
+                        cursor.execute(f"PRAGMA {name}")
+                        pragmas[name] = cursor.fetchone()[0]
+            finally:
+                wrapper.close()
+        self.assertEqual(
+            pragmas,
+            {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000, "cache_size": -65536},
+        )
+
+    def test_default_profile_leaves_sqlite_defaults(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 2)  # FULL
+
+
+class PhotoCapConcurrencyTests(TransactionTestCase):
+    def test_concurrent_uploads_cannot_exceed_the_cap(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            self.assertEqual(cursor.fetchone()[0], "wal")
+        car = Car.objects.create(
+            license_plate="9999RCE",
+            brand="Dacia",
+            model_name="Sandero",
+            kilometers=1000,
+            year=2023,
+            price=11000,
+        )
+        for position in range(Car.MAX_PHOTOS - 2):
+            CarPhoto(car=car, image=f"cars/base_{position}.gif").save(validate=False)
+
+        uploads = 12
+        barrier = threading.Barrier(uploads)
+        outcomes = []
+
+        def upload(n):
+            try:
+                barrier.wait()
+                CarPhoto(car_id=car.pk, image=f"cars/race_{n}.gif").save()
+                outcomes.append("saved")
+            except ValidationError:
+                outcomes.append("rejected")
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=upload, args=(n,)) for n in range(uploads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes.count("saved"), 2)
+        self.assertEqual(outcomes.count("rejected"), uploads - 2)
+        car.refresh_from_db()
+        self.assertEqual(car.photo_count, Car.MAX_PHOTOS)
+        self.assertEqual(car.photos.count(), Car.MAX_PHOTOS)
+
+    def test_deletes_release_slots(self):
+        car = Car.objects.create(
+            license_plate="9998RCE",
+            brand="Dacia",
+            model_name="Duster",
+            kilometers=1000,
+            year=2023,
+            price=14000,
+        )
+        photos = [CarPhoto.objects.create(car=car, image=f"cars/d{n}.gif") for n in range(3)]
+        photos[0].delete()
+        self.assertEqual(car.photo_count, 2)
+        car.photos.all().delete()
+        car.refresh_from_db()
+        self.assertEqual(car.photo_count, 0)
+
+
 class CheckoutViewTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
@@ -143,19 +1696,464 @@ class CheckoutViewTests(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertIn("/accounts/login/", response.url)
 
-    @override_settings(
-        STRIPE_SECRET_KEY="sk_test",
-        STRIPE_PUBLISHABLE_KEY="pk_test",
-        STRIPE_SUCCESS_URL="https://example.com/success",
-        STRIPE_CANCEL_URL="https://example.com/cancel",
-    )
-    def test_checkout_session_creation(self):
+    def test_checkout_without_stripe_keys_is_500(self):
         self.client.login(username="buyer", password="secret")
-        mock_session = type("obj", (), {"id": "sess_123"})()
-        with patch("listings.views.stripe.checkout.Session.create") as mock_create:
-            mock_create.return_value = mock_session
-            response = self.client.post(
-                reverse("listings:checkout_session", args=[self.car.pk])
+        with self.settings(STRIPE_SECRET_KEY=""):
+            response = self.client.post(reverse("listings:checkout_session", args=[self.car.pk]))
+        self.assertEqual(response.status_code, 500)
+
+
+@override_settings(
+    STRIPE_SECRET_KEY="sk_test",
+    STRIPE_PUBLISHABLE_KEY="pk_test",
+    STRIPE_SUCCESS_URL="https://example.com/success",
+    STRIPE_CANCEL_URL="https://example.com/cancel",
+)
+class StubPaymentCheckoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.stub = self.enterContext(StubPaymentServer())
+        self.enterContext(override_settings(STRIPE_API_BASE=self.stub.url))
+        self.user = User.objects.create_user(
+            username="buyer", password="secret", email="buyer@example.com"
+        )
+        self.car = Car.objects.create(
+            license_plate="1111STB",
+            brand="BMW",
+            model_name="Serie 1",
+            kilometers=30000,
+            year=2020,
+            price=23000,
+        )
+        self.url = reverse("listings:checkout_session", args=[self.car.pk])
+
+    def test_checkout_session_creation(self):
+        self.client.force_login(self.user)
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertJSONEqual(response.content, {"sessionId": "cs_test_1"})
+        path, headers, form = self.stub.requests[0]
+        self.assertEqual(path, "/v1/checkout/sessions")
+        self.assertEqual(headers["Authorization"], "Bearer sk_test")
+        self.assertEqual(form["line_items[0][price_data][unit_amount]"], "2300000")
+        self.assertEqual(form["metadata[car_id]"], str(self.car.pk))
+        self.assertEqual(form["customer_email"], "buyer@example.com")
+
+    def test_provider_errors_are_reported(self):
+        self.stub.error = (400, "Importe no admitido")
+        self.client.force_login(self.user)
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Importe no admitido", response.json()["error"])
+
+    def test_sold_car_is_404_without_calling_the_provider(self):
+        Car.objects.filter(pk=self.car.pk).update(is_active=False)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.post(self.url).status_code, 404)
+        self.assertEqual(self.stub.requests, [])
+
+    async def test_checkouts_wait_for_the_provider_concurrently(self):
+        self.stub.delay = 0.3
+        cars = [
+            await Car.objects.acreate(
+                license_plate=f"{index:04d}ASY",
+                brand="Kia",
+                model_name="Niro",
+                kilometers=1000,
+                year=2022,
+                price=21000,
+            )
+            for index in range(8)
+        ]
+        await self.async_client.aforce_login(self.user)
+        started = time.perf_counter()
+        responses = await asyncio.gather(
+            *(
+                self.async_client.post(reverse("listings:checkout_session", args=[car.pk]))
+                for car in cars
             )
+        )
+        elapsed = time.perf_counter() - started
+        self.assertEqual([response.status_code for response in responses], [200] * 8)
+        self.assertEqual(len({response.json()["sessionId"] for response in responses}), 8)
+        # Sequential calls would take 8 x 0.3 s.
+        self.assertLess(elapsed, 1.2)
+
+    def test_retries_reuse_the_open_session(self):
+        self.client.force_login(self.user)
+        first = self.client.post(self.url).json()["sessionId"]
+        with self.assertNumQueries(3):  # session, user and car; the checkout is cached
+            second = self.client.post(self.url).json()["sessionId"]
+        cache.clear()
+        third = self.client.post(self.url).json()["sessionId"]
+        self.assertEqual({first, second, third}, {"cs_test_1"})
+        self.assertEqual(len(self.stub.requests), 1)
+        session = CheckoutSession.objects.get()
+        self.assertEqual(session.status, CheckoutSession.Status.OPEN)
+        self.assertEqual(session.amount_cents, 2300000)
+        self.assertEqual(session.url, "https://checkout.stripe.com/c/pay/cs_test_1")
+
+    async def test_double_click_sends_one_idempotency_key(self):
+        self.stub.delay = 0.2
+        await self.async_client.aforce_login(self.user)
+        responses = await asyncio.gather(*(self.async_client.post(self.url) for _ in range(4)))
+        self.assertEqual({response.json()["sessionId"] for response in responses}, {"cs_test_1"})
+        keys = {headers["Idempotency-Key"] for _, headers, _ in self.stub.requests}
+        self.assertEqual(len(keys), 1)
+        self.assertTrue(keys.pop().startswith(f"checkout-{self.user.pk}-{self.car.pk}-2300000-0-"))
+        self.assertEqual(await CheckoutSession.objects.acount(), 1)
+
+    def test_new_price_or_expiry_creates_a_new_session(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.post(self.url).json()["sessionId"], "cs_test_1")
+        self.car.price = 22000
+        self.car.save()
+        self.assertEqual(self.client.post(self.url).json()["sessionId"], "cs_test_2")
+
+        CheckoutSession.objects.update(expires_at=timezone.now() + timedelta(minutes=1))
+        cache.clear()
+        self.assertEqual(self.client.post(self.url).json()["sessionId"], "cs_test_3")
+        self.assertTrue(
+            self.stub.requests[-1][1]["Idempotency-Key"].startswith(
+                f"checkout-{self.user.pk}-{self.car.pk}-2200000-1-"
+            )
+        )
+
+    def test_retry_after_the_hold_is_renewed_uses_a_new_key(self):
+        Car.objects.filter(pk=self.car.pk).update(
+            reserved_by=self.user.pk, reserved_until=timezone.now() + timedelta(minutes=40)
+        )
+        self.stub.error = (400, "Importe no admitido")
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.post(self.url).status_code, 400)
+        # The hold is about to lapse, so the retry renews it: a new expires_at.
+        Car.objects.filter(pk=self.car.pk).update(
+            reserved_until=timezone.now() + timedelta(minutes=5)
+        )
+        self.stub.error = None
+        response = self.client.post(self.url)
         self.assertEqual(response.status_code, 200)
-        self.assertJSONEqual(response.content, {"sessionId": "sess_123"})
+        first, second = (headers["Idempotency-Key"] for _, headers, _ in self.stub.requests)
+        self.assertNotEqual(first, second)
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET="whsec_test", LISTINGS_TASKS_EAGER=False)
+class PaymentWebhookTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="buyer", email="buyer@example.com")
+        self.cars = [
+            Car.objects.create(
+                license_plate=f"{index:04d}PAY",
+                brand="Seat",
+                model_name="Arona",
+                kilometers=1000,
+                year=2023,
+                price=19000,
+            )
+            for index in range(4)
+        ]
+        for index, car in enumerate(self.cars):
+            CheckoutSession.objects.create(
+                user=self.user,
+                car=car,
+                amount_cents=1900000,
+                stripe_session_id=f"cs_test_{index}",
+                idempotency_key=f"key-{index}",
+                expires_at=timezone.now() + timedelta(hours=1),
+            )
+        self.url = reverse("listings:payment_webhook")
+
+    def post_event(self, event_id, event_type, session_id, *, secret="whsec_test", **session):
+        payload = json.dumps(
+            {
+                "id": event_id,
+                "type": event_type,
+                "data": {"object": {"id": session_id, **session}},
+            }
+        )
+        return self.client.post(
+            self.url,
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=sign_webhook(payload, secret),
+        )
+
+    def test_rejects_bad_signatures(self):
+        response = self.post_event(
+            "evt_1", "checkout.session.completed", "cs_test_0", secret="whsec_other"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+    def test_burst_is_stored_deduplicated_and_queued_once(self):
+        for index in range(3):
+            self.post_event(
+                f"evt_{index}",
+                "checkout.session.completed",
+                f"cs_test_{index}",
+                payment_status="paid",
+            )
+        response = self.post_event(
+            "evt_0", "checkout.session.completed", "cs_test_0", payment_status="paid"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(PaymentEvent.objects.count(), 3)
+        self.assertEqual(Task.objects.filter(name="process_payment_events").count(), 1)
+        self.assertTrue(all(car.is_active for car in Car.objects.all()))
+
+    def test_processing_marks_cars_sold_once_per_batch(self):
+        events = [
+            ("evt_1", "checkout.session.completed", "cs_test_0", "paid"),
+            ("evt_2", "checkout.session.completed", "cs_test_1", "unpaid"),
+            ("evt_3", "checkout.session.async_payment_succeeded", "cs_test_1", "paid"),
+            ("evt_4", "checkout.session.expired", "cs_test_2", "unpaid"),
+            ("evt_5", "customer.created", "cus_1", ""),
+        ]
+        for event_id, event_type, session_id, status in events:
+            self.post_event(event_id, event_type, session_id, payment_status=status)
+
+        with patch("listings.payments.bump_catalogue_version") as bump:
+            self.assertEqual(process_payment_events(batch_size=3), 5)
+        self.assertEqual(bump.call_count, 1)  # the second batch sold nothing
+        self.assertFalse(PaymentEvent.objects.filter(processed_at__isnull=True).exists())
+
+        sold = Car.objects.filter(sold_at__isnull=False)
+        self.assertEqual({car.pk for car in sold}, {self.cars[0].pk, self.cars[1].pk})
+        self.assertFalse(sold.filter(is_active=True).exists())
+        statuses = dict(CheckoutSession.objects.values_list("stripe_session_id", "status"))
+        self.assertEqual(
+            statuses,
+            {
+                "cs_test_0": "complete",
+                "cs_test_1": "complete",
+                "cs_test_2": "expired",
+                "cs_test_3": "open",
+            },
+        )
+        self.assertEqual(process_payment_events(), 0)
+
+    @override_settings(LISTINGS_TASKS_EAGER=True)
+    def test_eager_mode_applies_events_after_the_request(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post_event(
+                "evt_1", "checkout.session.completed", "cs_test_3", payment_status="paid"
+            )
+        self.assertIsNotNone(Car.objects.get(pk=self.cars[3].pk).sold_at)
+        response = self.client.get(reverse("listings:api_car_detail", args=[self.cars[3].pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(
+    STRIPE_SECRET_KEY="sk_test",
+    STRIPE_PUBLISHABLE_KEY="pk_test",
+)
+class ReservationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.stub = self.enterContext(StubPaymentServer())
+        self.enterContext(override_settings(STRIPE_API_BASE=self.stub.url))
+        self.first = User.objects.create_user(username="first")
+        self.second = User.objects.create_user(username="second")
+        self.car = Car.objects.create(
+            license_plate="1111RSV",
+            brand="Mazda",
+            model_name="CX-30",
+            kilometers=12000,
+            year=2022,
+            price=24000,
+        )
+        self.url = reverse("listings:checkout_session", args=[self.car.pk])
+
+    def checkout(self, user):
+        self.client.force_login(user)
+        return self.client.post(self.url)
+
+    def test_second_buyer_waits_until_the_hold_lapses(self):
+        self.assertEqual(self.checkout(self.first).status_code, 200)
+        self.car.refresh_from_db()
+        self.assertEqual(self.car.reserved_by, self.first)
+        form = self.stub.requests[0][2]
+        self.assertEqual(int(form["expires_at"]), int(self.car.reserved_until.timestamp()))
+
+        response = self.checkout(self.second)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(len(self.stub.requests), 1)
+        self.assertEqual(self.checkout(self.first).status_code, 200)  # retries still work
+
+        Car.objects.filter(pk=self.car.pk).update(reserved_until=timezone.now())
+        self.assertEqual(self.checkout(self.second).status_code, 200)
+        self.car.refresh_from_db()
+        self.assertEqual(self.car.reserved_by, self.second)
+
+    def test_admin_saves_do_not_clobber_holds(self):
+        stale = Car.objects.get(pk=self.car.pk)
+        self.assertIsNotNone(reserve(self.car.pk, self.first.pk))
+        stale.price = 23000
+        stale.save()
+        self.assertEqual(Car.objects.get(pk=self.car.pk).reserved_by, self.first)
+
+    def test_sweeper_releases_lapsed_holds(self):
+        self.checkout(self.first)
+        past = timezone.now() - timedelta(seconds=1)
+        Car.objects.update(reserved_until=past)
+        CheckoutSession.objects.update(expires_at=past)
+        out = StringIO()
+        call_command("release_reservations", stdout=out)
+        self.assertIn("Reservas liberadas: 1 · sesiones caducadas: 1", out.getvalue())
+        self.assertIsNone(Car.objects.get(pk=self.car.pk).reserved_by)
+        self.assertEqual(CheckoutSession.objects.get().status, CheckoutSession.Status.EXPIRED)
+
+    @override_settings(LISTINGS_TASKS_EAGER=False, STRIPE_WEBHOOK_SECRET="whsec_test")
+    def test_expired_session_releases_the_hold(self):
+        self.checkout(self.first)
+        payload = json.dumps(
+            {
+                "id": "evt_expired",
+                "type": "checkout.session.expired",
+                "data": {"object": {"id": "cs_test_1", "payment_status": "unpaid"}},
+            }
+        )
+        self.client.post(
+            reverse("listings:payment_webhook"),
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=sign_webhook(payload, "whsec_test"),
+        )
+        process_payment_events()
+        self.assertIsNone(Car.objects.get(pk=self.car.pk).reserved_by)
+        self.assertEqual(self.checkout(self.second).status_code, 200)
+
+
+class ReservationConcurrencyTests(TransactionTestCase):
+    def test_one_buyer_wins_a_contended_car(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        car = Car.objects.create(
+            license_plate="9999RSV",
+            brand="Mazda",
+            model_name="MX-5",
+            kilometers=5000,
+            year=2021,
+            price=27000,
+        )
+        buyers = [User.objects.create_user(username=f"racer{n}").pk for n in range(12)]
+        barrier = threading.Barrier(len(buyers))
+        winners = []
+
+        def attempt(user_id):
+            try:
+                barrier.wait()
+                if reserve(car.pk, user_id):
+                    winners.append(user_id)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=attempt, args=(pk,)) for pk in buyers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(winners), 1)
+        self.assertEqual(Car.objects.get(pk=car.pk).reserved_by_id, winners[0])
+
+
+@override_settings(LISTINGS_READ_REPLICAS=["replica"], LISTINGS_PAGE_CACHE_TIMEOUT=0)
+class ReplicaRoutingTests(TransactionTestCase):
+    """The test database plus a second SQLite file, synced on demand.
+
+    The replica alias exists only while the class runs, so the test runner
+    does not create it; ``sync_replica`` copies the default database over it.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.replica_dir = tempfile.mkdtemp()
+        connections.settings["replica"] = {
+            **connections.settings["default"],
+            "NAME": os.path.join(cls.replica_dir, "replica.sqlite3"),
+        }
+        cls.databases = {*cls.databases, "replica"}
+
+    @classmethod
+    def tearDownClass(cls):
+        del cls.databases
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+        shutil.rmtree(cls.replica_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def sync_replica(cls):
+        """Copy the default database, schema and rows, over the replica."""
+        connections["replica"].close()
+        source = connections["default"]
+        source.ensure_connection()
+        with closing(sqlite3.connect(connections["replica"].settings_dict["NAME"])) as target:
+            source.connection.backup(target)
+
+    def setUp(self):
+        cache.clear()
+        self.replicated = Car.objects.create(
+            license_plate="1111RPL",
+            brand="Skoda",
+            model_name="Octavia",
+            kilometers=40000,
+            year=2019,
+            price=15000,
+        )
+        self.sync_replica()
+        self.pending = Car.objects.create(
+            license_plate="2222RPL",
+            brand="Cupra",
+            model_name="Born",
+            kilometers=1000,
+            year=2024,
+            price=35000,
+        )
+
+    def test_catalogue_reads_come_from_the_replica(self):
+        response = self.client.get(reverse("listings:home"))
+        self.assertContains(response, "Octavia")
+        self.assertNotContains(response, "Born")
+        self.assertEqual(self.client.get(reverse("listings:api_car_list")).json()["count"], 1)
+
+    @override_settings(LISTINGS_PAGE_CACHE_TIMEOUT=60)
+    def test_cached_values_are_never_filled_from_the_replica(self):
+        response = self.client.get(reverse("listings:home"))
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertContains(response, "Born")
+        self.assertEqual(response.context["available_years"], [2019, 2024])
+        response = self.client.get(reverse("listings:home"))
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertContains(response, "Born")
+
+    def test_pinned_visitors_read_their_own_writes(self):
+        self.client.cookies[PIN_COOKIE] = "1"
+        self.assertContains(self.client.get(reverse("listings:home")), "Born")
+
+    def test_only_car_writes_pin_the_visitor(self):
+        def write_car(request):
+            Car.objects.filter(pk=self.pending.pk).update(price=34000)
+            return HttpResponse()
+
+        def write_user(request):
+            User.objects.create_user(username="reader")
+            return HttpResponse()
+
+        request = RequestFactory().post("/")
+        self.assertIn(PIN_COOKIE, ReplicaPinMiddleware(write_car)(request).cookies)
+        self.assertNotIn(PIN_COOKIE, ReplicaPinMiddleware(write_user)(request).cookies)
+
+    def test_instances_read_from_a_replica_are_saved_to_default(self):
+        with replica_reads():
+            car = Car.objects.get(pk=self.replicated.pk)
+            self.assertEqual(router.db_for_read(User), "default")
+        self.assertEqual(car._state.db, "replica")
+        car.price = 14000
+        car.save()
+        self.assertEqual(Car.objects.get(pk=car.pk).price, 14000)
+        self.assertEqual(Car.objects.using("replica").get(pk=car.pk).price, 15000)
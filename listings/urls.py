@@ -1,9 +1,13 @@
 from django.urls import path
 
+from .api import CarApiDetailView, CarApiListView
 from .views import (
+    CacheStatsView,
     CarBuyView,
     CarListView,
+    CatalogueExportView,
     CheckoutSessionView,
+    PaymentWebhookView,
     SignUpView,
 )
 
@@ -12,10 +16,15 @@ app_name = "listings"
 urlpatterns = [
     path("", CarListView.as_view(), name="home"),
     path("registro/", SignUpView.as_view(), name="signup"),
+    path("exportar/catalogo.<str:fmt>", CatalogueExportView.as_view(), name="catalogue_export"),
+    path("api/anuncios/", CarApiListView.as_view(), name="api_car_list"),
+    path("api/anuncios/<int:pk>/", CarApiDetailView.as_view(), name="api_car_detail"),
+    path("estado/cache/", CacheStatsView.as_view(), name="cache_stats"),
     path("anuncios/<int:pk>/comprar/", CarBuyView.as_view(), name="car_buy"),
     path(
         "anuncios/<int:pk>/checkout-session/",
         CheckoutSessionView.as_view(),
         name="checkout_session",
     ),
+    path("pagos/webhook/", PaymentWebhookView.as_view(), name="payment_webhook"),
 ]
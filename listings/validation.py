@@ -0,0 +1,121 @@
+"""Set-based validation for batches of cars and photos.
+
+``Car.save`` and ``CarPhoto.save`` validate one row at a time, which costs a
+uniqueness query per car and a photo count per photo. These helpers apply the
+same rules to a whole batch with a fixed number of queries; the valid rows
+can then be written with ``save(validate=False)`` or ``bulk_create``.
+"""
+
+from django.core.exceptions import ValidationError
+from django.utils.translation import gettext_lazy as _
+
+from .models import Car, User
+
+# Keeps ``IN (...)`` lists well below SQLite's bound-parameter limit.
+LOOKUP_CHUNK = 5000
+
+
+def _chunks(values, size=LOOKUP_CHUNK):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
+
+
+def validate_cars(cars, *, existing_ok: bool = False) -> dict[int, ValidationError]:
+    """Validate ``cars`` and return ``{index: error}`` for the invalid ones.
+
+    Field validators and ``Car.clean`` run per row without queries; plate
+    uniqueness, against the database and within the batch, is checked with a
+    single ``IN`` query. With ``existing_ok`` (upserts) plates already stored
+    are accepted and only duplicates within the batch are rejected. Plates are
+    upper-cased in place, as ``Car.save`` does.
+    """
+    cars = list(cars)
+    errors = {}
+    for index, car in enumerate(cars):
+        if car.license_plate:
+            car.license_plate = car.license_plate.upper()
+        try:
+            # The created_by lookup is batched below instead of one per row;
+            # the photo_count constraint is enforced by the database.
+            car.full_clean(
+                exclude=["created_by"], validate_unique=False, validate_constraints=False
+            )
+        except ValidationError as exc:
+            errors[index] = exc
+
+    user_ids = {car.created_by_id for car in cars if car.created_by_id}
+    if user_ids:
+        known = set()
+        for chunk in _chunks(user_ids):
+            known.update(User.objects.filter(pk__in=chunk).values_list("pk", flat=True))
+        for index, car in enumerate(cars):
+            if index not in errors and car.created_by_id and car.created_by_id not in known:
+                errors[index] = ValidationError(
+                    {"created_by": [_("El usuario indicado no existe.")]}
+                )
+
+    owners = {}
+    if not existing_ok:
+        plates = {car.license_plate for index, car in enumerate(cars) if index not in errors}
+        for chunk in _chunks(plates):
+            owners.update(
+                Car.objects.filter(license_plate__in=chunk)
+                .values_list("license_plate", "pk")
+                .order_by()
+            )
+
+    seen = set()
+    for index, car in enumerate(cars):
+        if index in errors:
+            continue
+        owner = owners.get(car.license_plate)
+        if car.license_plate in seen or (owner is not None and owner != car.pk):
+            errors[index] = ValidationError(
+                {"license_plate": [car.unique_error_message(Car, ("license_plate",))]}
+            )
+        else:
+            seen.add(car.license_plate)
+    return errors
+
+
+def validate_photos(photos) -> dict[int, ValidationError]:
+    """Validate ``photos`` and return ``{index: error}`` for the invalid ones.
+
+    The ``MAX_PHOTOS`` cap is checked with one query reading
+    ``Car.photo_count``: photos already stored for each car (other than those
+    in ``photos``) plus the batch's own photos, in order, so the photos that
+    overflow a car are the ones reported.
+    """
+    photos = list(photos)
+    errors = {}
+    for index, photo in enumerate(photos):
+        try:
+            # The car lookup is batched with the photo counts below.
+            photo.clean_fields(exclude=["car"])
+        except ValidationError as exc:
+            errors[index] = exc
+        if photo.car_id is None:
+            errors[index] = ValidationError({"car": [_("Este campo no puede ser nulo.")]})
+
+    car_ids = {photo.car_id for photo in photos if photo.car_id}
+    totals = {}
+    for chunk in _chunks(car_ids):
+        totals.update(
+            Car.objects.filter(pk__in=chunk).values_list("pk", "photo_count").order_by()
+        )
+    # Stored photos in the batch are already part of photo_count.
+    for photo in photos:
+        if not photo._state.adding and photo.car_id in totals:
+            totals[photo.car_id] -= 1
+
+    for index, photo in enumerate(photos):
+        if index in errors:
+            continue
+        if photo.car_id not in totals:
+            errors[index] = ValidationError({"car": [_("El anuncio indicado no existe.")]})
+        elif totals[photo.car_id] >= Car.MAX_PHOTOS:
+            errors[index] = ValidationError(Car.MAX_PHOTOS_MESSAGE)
+        else:
+            totals[photo.car_id] += 1
+    return errors
@@ -1,96 +1,203 @@
 from django.conf import settings
 from django.contrib import messages
-from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Q
-from django.http import JsonResponse
-from django.shortcuts import get_object_or_404
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404
 from django.urls import reverse_lazy
+from django.utils.decorators import method_decorator
+from django.utils.http import urlencode
+from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import CreateView, ListView, TemplateView, View
 
-import stripe
+from asgiref.sync import sync_to_async
 
+from .cache import (
+    acatalogue_key,
+    aget_or_compute,
+    aincr_counter,
+    catalogue_key,
+    get_counters,
+)
+from .checkout import CheckoutError, acreate_checkout_session, ensure_configured
+from .export import (
+    EXPORT_FORMATS,
+    aexport_rows,
+    arender_export,
+    export_rows,
+    render_export,
+)
+from .facets import get_catalogue_facets
+from .filters import FILTER_PARAMS, filter_catalogue
 from .forms import SignUpForm
 from .models import Car
+from .pagination import CachedCountPaginator, KeysetPaginator
+from .payments import InvalidEvent, parse_event, record_event
+from .replicas import ReplicaReadMixin
 
+PAGE_PARAMS = ("page", "cursor")
 
-class CarListView(ListView):
+DEFAULT_PAGE_CACHE_TIMEOUT = 10 * 60
+
+
+class CarListView(ReplicaReadMixin, ListView):
     """Public landing page that lists all available cars with filters."""
 
     template_name = "listings/home.html"
     model = Car
     context_object_name = "cars"
     paginate_by = 12
+    paginator_class = CachedCountPaginator
+
+    def get_pagination_mode(self) -> str:
+        # Search results are ordered by relevance, which keyset cannot seek on.
+        if self.request.GET.get("q"):
+            return "offset"
+        return getattr(settings, "LISTINGS_PAGINATION", "offset")
+
+    def normalized_params(self, names) -> list:
+        return sorted(
+            (name, self.request.GET[name].strip())
+            for name in names
+            if self.request.GET.get(name, "").strip()
+        )
+
+    def get_count_key(self) -> str:
+        return catalogue_key("count", self.normalized_params(FILTER_PARAMS))
+
+    def is_page_cacheable(self) -> bool:
+        # Authenticated pages carry user-specific chrome and pending messages
+        # are single-use, so only plain anonymous hits share the cache.
+        request = self.request
+        return (
+            request.method == "GET"
+            and not request.user.is_authenticated
+            and not len(messages.get_messages(request))
+        )
+
+    async def get(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        if not self.is_page_cacheable():
+            return await sync_to_async(self.render_page)(request, *args, **kwargs)
+
+        key = await acatalogue_key(
+            "page",
+            self.get_pagination_mode(),
+            self.normalized_params(FILTER_PARAMS + PAGE_PARAMS),
+        )
+        rendered = None
+
+        async def render():
+            nonlocal rendered
+            rendered = await sync_to_async(self.render_page)(request, *args, **kwargs)
+            return rendered.content if rendered.status_code == 200 else None
+
+        timeout = getattr(settings, "LISTINGS_PAGE_CACHE_TIMEOUT", DEFAULT_PAGE_CACHE_TIMEOUT)
+        content = await aget_or_compute(key, render, timeout)
+        if rendered is None:
+            # Cached, or rendered by a concurrent request for the same page.
+            await aincr_counter("page-cache-hit")
+            response = HttpResponse(content)
+            response["X-Cache"] = "HIT"
+            return response
+
+        await aincr_counter("page-cache-miss")
+        rendered["X-Cache"] = "MISS"
+        return rendered
+
+    def render_page(self, request, *args, **kwargs):
+        # Count, page, photos and facets run back to back on the ORM thread:
+        # one hop instead of one per query, which is all the async ORM does.
+        response = super().get(request, *args, **kwargs)
+        response.render()
+        return response
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        return self.paginator_class(
+            queryset,
+            per_page,
+            orphans=orphans,
+            allow_empty_first_page=allow_empty_first_page,
+            count_key=self.get_count_key(),
+            **kwargs,
+        )
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.get_pagination_mode() != "keyset":
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, page_size, count_key=self.get_count_key())
+        page = paginator.page(self.request.GET.get("cursor"))
+        return paginator, page, page.object_list, page.has_other_pages()
 
     def get_queryset(self):
         queryset = (
             Car.objects.filter(is_active=True)
-            .prefetch_related("photos")
+            .with_photos()
             .order_by("-created_at")
         )
-
-        brand = self.request.GET.get("brand")
-        model_name = self.request.GET.get("model")
-        year_min = self.request.GET.get("year_min")
-        year_max = self.request.GET.get("year_max")
-        km_max = self.request.GET.get("km_max")
-        search = self.request.GET.get("q")
-
-        if brand:
-            queryset = queryset.filter(brand__iexact=brand)
-        if model_name:
-            queryset = queryset.filter(model_name__icontains=model_name)
-        if year_min:
-            try:
-                queryset = queryset.filter(year__gte=int(year_min))
-            except ValueError:
-                pass
-        if year_max:
-            try:
-                queryset = queryset.filter(year__lte=int(year_max))
-            except ValueError:
-                pass
-        if km_max:
-            try:
-                queryset = queryset.filter(kilometers__lte=int(km_max))
-            except ValueError:
-                pass
-        if search:
-            queryset = queryset.filter(
-                Q(brand__icontains=search)
-                | Q(model_name__icontains=search)
-                | Q(license_plate__icontains=search)
-            )
-
-        return queryset
+        return filter_catalogue(queryset, self.request.GET)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["filter_values"] = {
-            "brand": self.request.GET.get("brand", ""),
-            "model": self.request.GET.get("model", ""),
-            "year_min": self.request.GET.get("year_min", ""),
-            "year_max": self.request.GET.get("year_max", ""),
-            "km_max": self.request.GET.get("km_max", ""),
-            "q": self.request.GET.get("q", ""),
-        }
-        context["available_brands"] = (
-            Car.objects.filter(is_active=True)
-            .values_list("brand", flat=True)
-            .distinct()
-            .order_by("brand")
-        )
-        context["available_years"] = (
-            Car.objects.filter(is_active=True)
-            .order_by("year")
-            .values_list("year", flat=True)
-            .distinct()
-        )
-        query_params = self.request.GET.copy()
-        query_params.pop("page", None)
-        context["filters_query"] = query_params.urlencode()
+        # The same values as the page cache key, so pages sharing a cache
+        # entry render the same form.
+        filters = self.normalized_params(FILTER_PARAMS)
+        context["filter_values"] = dict.fromkeys(FILTER_PARAMS, "") | dict(filters)
+        facets = get_catalogue_facets()
+        context["brand_facets"] = facets["brands"]
+        context["year_facets"] = facets["years"]
+        context["available_brands"] = [brand for brand, _ in facets["brands"]]
+        context["available_years"] = [year for year, _ in facets["years"]]
+        # Only known filters are carried over, so cached pages never echo
+        # unrelated query parameters from whoever rendered them first.
+        context["filters_query"] = urlencode(filters)
         return context
 
 
+class CatalogueExportView(UserPassesTestMixin, View):
+    """Stream the active catalogue, filtered like CarListView, as CSV or JSON Lines.
+
+    Restricted to staff: it dumps the whole catalogue in one request.
+    """
+
+    http_method_names = ["get"]
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request, fmt):
+        if fmt not in EXPORT_FORMATS:
+            raise Http404("Formato de exportación desconocido.")
+        queryset = filter_catalogue(
+            Car.objects.filter(is_active=True).order_by("-created_at", "-id"), request.GET
+        )
+        if isinstance(request, ASGIRequest):
+            # ASGI servers buffer sync iterators whole; stream an async one.
+            rows = aexport_rows(queryset, photo_url=request.build_absolute_uri)
+            content = arender_export(rows, fmt)
+        else:
+            rows = export_rows(queryset, photo_url=request.build_absolute_uri)
+            content = render_export(rows, fmt)
+        response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[fmt])
+        response["Content-Disposition"] = f'attachment; filename="catalogo.{fmt}"'
+        return response
+
+
+class CacheStatsView(UserPassesTestMixin, View):
+    """Page cache hit/miss counters for monitoring, restricted to staff."""
+
+    http_method_names = ["get"]
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        stats = get_counters("page-cache-hit", "page-cache-miss")
+        lookups = stats["page-cache-hit"] + stats["page-cache-miss"]
+        stats["hit-ratio"] = round(stats["page-cache-hit"] / lookups, 4) if lookups else None
+        return JsonResponse(stats)
+
+
 class SignUpView(CreateView):
     """Simple registration flow so anonymous users can comprar un vehículo."""
 
@@ -106,64 +213,54 @@ class SignUpView(CreateView):
         return super().form_valid(form)
 
 
-class CarBuyView(LoginRequiredMixin, TemplateView):
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    """LoginRequiredMixin for async views: loads the user without blocking."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        return await View.dispatch(self, request, *args, **kwargs)
+
+
+class CarBuyView(ReplicaReadMixin, AsyncLoginRequiredMixin, TemplateView):
     template_name = "listings/buy.html"
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        car = get_object_or_404(Car, pk=self.kwargs["pk"], is_active=True)
-        context["car"] = car
-        context["stripe_public_key"] = settings.STRIPE_PUBLISHABLE_KEY
-        return context
+    async def get(self, request, *args, **kwargs):
+        car = await aget_object_or_404(
+            Car.objects.with_photos(), pk=kwargs["pk"], is_active=True
+        )
+        context = self.get_context_data(
+            car=car, stripe_public_key=settings.STRIPE_PUBLISHABLE_KEY, **kwargs
+        )
+        return self.render_to_response(context)
+
+
+class CheckoutSessionView(AsyncLoginRequiredMixin, View):
+    http_method_names = ["post"]
+
+    async def post(self, request, pk):
+        try:
+            ensure_configured()
+            car = await aget_object_or_404(Car, pk=pk, is_active=True)
+            session = await acreate_checkout_session(car, request.user)
+        except CheckoutError as exc:
+            return JsonResponse({"error": exc.message}, status=exc.status)
+        return JsonResponse({"sessionId": session.stripe_session_id})
+
 
+@method_decorator(csrf_exempt, name="dispatch")
+class PaymentWebhookView(View):
+    """Provider events: verified and stored here, applied by the task queue."""
 
-class CheckoutSessionView(LoginRequiredMixin, View):
     http_method_names = ["post"]
 
-    def post(self, request, pk):
-        if not settings.STRIPE_SECRET_KEY or not settings.STRIPE_PUBLISHABLE_KEY:
-            return JsonResponse(
-                {"error": "Stripe no está configurado. Contacta con el administrador."},
-                status=500,
-            )
-
-        car = get_object_or_404(Car, pk=pk, is_active=True)
-        if car.price <= 0:
-            return JsonResponse(
-                {"error": "El anuncio no tiene un precio válido."}, status=400
-            )
-
-        stripe.api_key = settings.STRIPE_SECRET_KEY
-        amount_cents = int(car.price * 100)
+    async def post(self, request):
+        if not settings.STRIPE_WEBHOOK_SECRET:
+            return JsonResponse({"error": "Webhook no configurado."}, status=500)
         try:
-            checkout_kwargs = {
-                "mode": "payment",
-                "line_items": [
-                    {
-                        "price_data": {
-                            "currency": "eur",
-                            "product_data": {
-                                "name": f"{car.brand} {car.model_name}",
-                                "metadata": {"car_id": car.pk},
-                            },
-                            "unit_amount": amount_cents,
-                        },
-                        "quantity": 1,
-                    }
-                ],
-                "success_url": settings.STRIPE_SUCCESS_URL,
-                "cancel_url": settings.STRIPE_CANCEL_URL,
-                "payment_method_types": ["card"],
-                "metadata": {"car_id": car.pk, "user_id": request.user.pk},
-            }
-            if request.user.email:
-                checkout_kwargs["customer_email"] = request.user.email
-
-            session = stripe.checkout.Session.create(**checkout_kwargs)
-        except stripe.error.StripeError as exc:
-            return JsonResponse(
-                {"error": f"Error creando la sesión de pago: {exc.user_message}"},
-                status=400,
-            )
-
-        return JsonResponse({"sessionId": session.id})
+            event = parse_event(request.body, request.headers.get("Stripe-Signature", ""))
+        except InvalidEvent:
+            return JsonResponse({"error": "Firma o evento no válido."}, status=400)
+        await sync_to_async(record_event)(event)
+        return JsonResponse({"received": True})